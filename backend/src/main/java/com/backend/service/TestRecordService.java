@@ -102,6 +102,7 @@ public class TestRecordService {
                 analysisData.put("individual_ratings", data.get("individual_ratings"));
                 analysisData.put("overall_score", data.get("overall_score"));
                 analysisData.put("overall_rating", data.get("overall_rating"));
+                analysisData.put("plan_data", data.get("plan_data"));
                 
                 record.setAnalysisResult(mapper.writeValueAsString(analysisData));
                 
@@ -46,8 +46,12 @@ public class TrainingPlanService {
         // 若绑定了体测报告，尝试提取分阶段训练周计划存入 plan_data
         if (plan.getTestRecordId() != null) {
             TestRecord record = testRecordMapper.findById(plan.getTestRecordId());
-            if (record != null && StringUtils.hasText(record.getReport())) {
-                String planData = PlanDataParser.buildPlanData(record.getReport(), plan.getTotalWeeks());
+            if (record != null) {
+                // 优先使用分析服务返回的结构化计划，缺失时再从报告文本中解析
+                String planData = PlanDataParser.extractStructuredPlanData(record.getAnalysisResult());
+                if (planData == null && StringUtils.hasText(record.getReport())) {
+                    planData = PlanDataParser.buildPlanData(record.getReport(), plan.getTotalWeeks());
+                }
                 plan.setPlanData(planData);
             }
         }
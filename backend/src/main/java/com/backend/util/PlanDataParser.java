@@ -52,6 +52,30 @@ public class PlanDataParser {
         }
     }
 
+    /**
+     * Read the structured plan data returned by the analysis service (stored under "plan_data"
+     * in the record's analysis result), so the report text does not need to be parsed.
+     */
+    public static String extractStructuredPlanData(String analysisResultJson) {
+        if (!StringUtils.hasText(analysisResultJson)) {
+            return null;
+        }
+        try {
+            Map<String, Object> analysis = OBJECT_MAPPER.readValue(
+                    analysisResultJson, new TypeReference<Map<String, Object>>() {});
+            Object planData = analysis.get("plan_data");
+            if (!(planData instanceof Map) || !(((Map<?, ?>) planData).get("phases") instanceof List)) {
+                return null;
+            }
+            if (((List<?>) ((Map<?, ?>) planData).get("phases")).isEmpty()) {
+                return null;
+            }
+            return OBJECT_MAPPER.writeValueAsString(planData);
+        } catch (Exception e) {
+            return null;
+        }
+    }
+
     public static List<Map<String, Object>> buildWeeklySchedule(String planDataJson, int currentWeek) {
         if (!StringUtils.hasText(planDataJson)) {
             return Collections.emptyList();
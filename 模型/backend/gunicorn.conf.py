@@ -0,0 +1,27 @@
+# Pre-fork deployment: the master loads the KG, FAISS indexes and models once,
+# then forks workers that share those pages copy-on-write.
+#
+#   gunicorn -c backend/gunicorn.conf.py backend.main:app
+#
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Read by main.py: load synchronously at import time (in the master) instead of in a per-worker background thread
+os.environ.setdefault("SERVICE_PRELOAD", "1")
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Report streams can run for minutes
+timeout = 300
+graceful_timeout = 30
+
+
+def post_fork(server, worker):
+    from src.utils.prefork import pin_torch_threads
+
+    # The master loads with a single torch thread; give each worker its share of the cores
+    pin_torch_threads(int(os.environ.get("TORCH_NUM_THREADS", 0)) or None)
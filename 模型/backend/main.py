@@ -1,9 +1,18 @@
 import sys
 import os
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+import json
+import threading
+import uuid
+import asyncio
+import random
+import secrets
+import tracemalloc
+from typing import Any, Dict, List, Optional, Union
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 
 # Add the project root to sys.path to allow importing src
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -11,6 +20,17 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from src.models.models import Gender, PhysicalTestInput
 from src.core.core_service import IntegratedFitnessRAGService
 from src.config.config import settings
+from src.core.executors import AdmissionLimiter, AdmissionRejected
+from src.core.report_jobs import CallbackNotAllowedError, JobQueueFullError, JobStore, ReportJobQueue
+from src.core.single_flight import ReportSingleFlight
+from src.core.warmup import ServiceWarmup
+from src.utils.prefork import freeze_shared_heap, pin_torch_threads
+from src.utils.compression import CompressionMiddleware
+from src.utils import result_encoding
+from src.utils.tracing import REGISTRY
+from src.utils.profiling import ProfileSession, ProfileStore
+from src.utils.memory_report import MemoryTracker, format_report
+from src.llm.resilience import CancelToken, RequestCancelled
 
 app = FastAPI(title="体质测试健康分析系统 API")
 
@@ -23,12 +43,171 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the service
-try:
-    service = IntegratedFitnessRAGService(config=settings)
-except Exception as e:
-    print(f"Error initializing service: {e}")
-    service = None
+# Negotiated zstd/br/gzip; streamed responses (SSE/NDJSON) are flushed chunk by chunk
+if getattr(settings, 'response_compression_enabled', True):
+    app.add_middleware(CompressionMiddleware,
+                       minimum_size=getattr(settings, 'response_compression_min_size', 1024),
+                       levels=getattr(settings, 'response_compression_levels', None))
+
+# Background report jobs (async mode of /analyze); created per process on first use,
+# so no SQLite connection or worker thread is inherited across a pre-fork
+job_queue = None
+job_queue_lock = threading.Lock()
+
+# Identical /analyze and /analyze/stream submissions share one generation; created per process on first use
+report_flights = None
+report_flights_lock = threading.Lock()
+
+# Per-request sampling profiles (opt-in flag or low-rate sampling), listed under /admin/profiles
+profile_store = ProfileStore(getattr(settings, 'profile_dir', os.path.join(settings.data_dir, "profiles")),
+                             max_files=getattr(settings, 'profile_max_files', 200))
+
+# Started before the service loads so startup allocations are attributed too
+if getattr(settings, 'memory_tracemalloc_frames', 0) > 0:
+    tracemalloc.start(settings.memory_tracemalloc_frames)
+
+# The service loads in the background so the server binds immediately; see /health/ready
+warmup = ServiceWarmup(lambda: IntegratedFitnessRAGService(config=settings, defer_startup=True))
+
+# Per-component memory accounting with growth history, reported on /debug/memory
+memory_tracker = MemoryTracker(lambda: warmup.service, max_samples=getattr(settings, 'memory_max_samples', 120))
+
+if getattr(settings, 'service_preload', False):
+    # Pre-fork mode (gunicorn preload_app): load everything once in the master before forking.
+    # A single torch thread here means no OpenMP pool exists at fork time; workers re-pin in post_fork.
+    pin_torch_threads(1)
+    warmup.start(background=False)
+    freeze_shared_heap()
+
+@app.on_event("startup")
+def start_warmup():
+    if warmup.status == ServiceWarmup.PENDING:
+        warmup.start(background=getattr(settings, 'service_warmup_background', True))
+    if getattr(settings, 'memory_sample_interval', 0) > 0:
+        memory_tracker.start(settings.memory_sample_interval)
+
+def get_service(require_ready: bool = True):
+    """Return the service, or fail fast with 503 + Retry-After while it is still warming up.
+
+    require_ready=False (scoring only) needs just the service object, so it keeps working
+    when a heavy component (KG, RAG, models) failed to load.
+    """
+    service = warmup.service
+    if warmup.failed and (require_ready or service is None):
+        raise HTTPException(status_code=500, detail=f"Service not initialized: {warmup.error}")
+    if service is None or (require_ready and not warmup.ready):
+        raise HTTPException(status_code=503, detail="Service warming up",
+                            headers={"Retry-After": str(getattr(settings, 'service_warmup_retry_after', 5))})
+    return service
+
+def get_job_queue():
+    global job_queue
+    service = get_service()
+    with job_queue_lock:
+        if job_queue is None:
+            try:
+                job_queue = ReportJobQueue(
+                    service,
+                    JobStore(getattr(settings, 'report_job_db_path', os.path.join(settings.data_dir, "report_jobs.sqlite3"))),
+                    max_workers=getattr(settings, 'report_job_workers', 4),
+                    max_pending=getattr(settings, 'report_job_max_pending', 100),
+                    flush_interval=getattr(settings, 'report_job_flush_interval', 1.0),
+                    webhook_timeout=getattr(settings, 'report_job_webhook_timeout', 10.0),
+                    callback_hosts=getattr(settings, 'report_job_callback_hosts', [])
+                )
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Job queue not initialized: {e}")
+    return job_queue
+
+def get_report_flights():
+    global report_flights
+    service = get_service()
+    with report_flights_lock:
+        if report_flights is None:
+            report_flights = ReportSingleFlight(
+                service,
+                completed_ttl=getattr(settings, 'analyze_dedup_completed_ttl', 30.0),
+                max_completed=getattr(settings, 'analyze_dedup_max_completed', 256)
+            )
+    return report_flights
+
+# Per-endpoint admission control for the heavy report endpoints
+admission = {
+    name: AdmissionLimiter(name, limits.get("limit", 8), limits.get("max_queue", 0),
+                           queue_timeout=getattr(settings, 'admission_queue_timeout', 10.0))
+    for name, limits in getattr(settings, 'admission_limits', {}).items()
+}
+
+async def admit(name: str):
+    """Take an admission slot for the endpoint, or fail with 429 + Retry-After when over capacity."""
+    limiter = admission.get(name)
+    if limiter is None:
+        return None
+    try:
+        await limiter.acquire()
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    return limiter.permit()
+
+# Load gauges exported next to the stage latency histograms on /metrics
+REGISTRY.gauge("fitness_admission_in_flight", "Requests executing per endpoint", ("endpoint",),
+               lambda: {(name,): limiter.in_flight for name, limiter in admission.items()})
+REGISTRY.gauge("fitness_admission_queue_depth", "Requests waiting for admission per endpoint", ("endpoint",),
+               lambda: {(name,): limiter.waiting for name, limiter in admission.items()})
+REGISTRY.gauge("fitness_admission_rejected", "Requests rejected with 429 per endpoint (cumulative)", ("endpoint",),
+               lambda: {(name,): limiter.rejected for name, limiter in admission.items()})
+REGISTRY.gauge("fitness_executor_queue_depth", "Tasks queued per service thread pool", ("pool",),
+               lambda: {(pool,): state["queue_depth"] for pool, state in warmup.service.executors.snapshot().items()}
+               if warmup.service is not None else {})
+REGISTRY.gauge("fitness_analyze_dedup_requests", "Coalesced /analyze requests by role (cumulative)", ("role",),
+               lambda: {(role,): count for role, count in report_flights.stats.items()} if report_flights is not None else {})
+REGISTRY.gauge("fitness_component_memory_bytes", "Estimated bytes per service component at the last memory sample",
+               ("component",), lambda: {(name,): size["bytes"] for name, size in memory_tracker.history[-1]["components"].items()}
+               if memory_tracker.history else {})
+def prompt_cache_snapshot():
+    client = warmup.service.llm_client if warmup.service is not None else None
+    stats = getattr(client, 'prompt_cache_stats', None)
+    return stats.snapshot() if stats is not None else {}
+
+REGISTRY.gauge("fitness_llm_prompt_cache_tokens", "Prompt tokens served from (hit) or missing (miss) the provider prefix cache (cumulative)",
+               ("endpoint", "result"), lambda: {(endpoint, result): counts[f"{result}_tokens"]
+                                                for endpoint, counts in prompt_cache_snapshot().items() for result in ("hit", "miss")})
+REGISTRY.gauge("fitness_llm_prompt_cache_hit_ratio", "Share of prompt tokens served from the provider prefix cache", ("endpoint",),
+               lambda: {(endpoint,): counts["hit_ratio"] for endpoint, counts in prompt_cache_snapshot().items()
+                        if counts["hit_ratio"] is not None})
+REGISTRY.gauge("fitness_service_ready", "1 once all components are loaded", (), lambda: {(): 1 if warmup.ready else 0})
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition: per-stage latency histograms plus admission/executor gauges."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/health/live")
+async def health_live():
+    return {"code": 200, "message": "success", "data": {"status": "alive"}}
+
+@app.get("/health/ready")
+async def health_ready():
+    state = warmup.snapshot()
+    # Scoring (/evaluate) is served as soon as the service object exists, even if a component failed
+    state["scoring_available"] = warmup.service is not None
+    if not warmup.ready:
+        return JSONResponse(status_code=503, content={"code": 503, "message": state["status"], "data": state},
+                            headers={"Retry-After": str(getattr(settings, 'service_warmup_retry_after', 5))})
+    return {"code": 200, "message": "success", "data": state}
+
+@app.get("/health/load")
+async def health_load():
+    """In-flight/queued requests per endpoint and executor queue depths."""
+    return {
+        "code": 200,
+        "message": "success",
+        "data": {
+            "admission": {name: limiter.snapshot() for name, limiter in admission.items()},
+            "executors": warmup.service.executors.snapshot() if warmup.service is not None else None,
+            "dedup": report_flights.snapshot() if report_flights is not None else None
+        }
+    }
 
 class PhysicalTestRequest(BaseModel):
     age: int
@@ -53,50 +232,88 @@ class PhysicalTestRequest(BaseModel):
     exercise_preferences: Optional[List[str]] = []
     exercise_risk_level: Optional[str] = None
     uses_equipment: Optional[bool] = None
+    # Async mode only: notified with {"job_id", "status"} when the job finishes;
+    # must be http(s) on a host listed in settings.report_job_callback_hosts
+    callback_url: Optional[str] = None
+
+def to_physical_test_input(data: PhysicalTestRequest) -> PhysicalTestInput:
+    # Convert string gender to Enum; metric fields are read straight off the request, lists are shared
+    gender_enum = Gender.MALE if data.gender == "男" else Gender.FEMALE
+    return PhysicalTestInput.from_fields(data, gender=gender_enum)
+
+def plan_data_of(result) -> Optional[Dict[str, Any]]:
+    # Structured plan data parsed from the report (None when the model did not emit it)
+    prescription = result.exercise_prescription
+    return prescription.to_plan_data() if prescription else None
+
+async def join_report_flight(data: PhysicalTestRequest, endpoint: str,
+                            profile: Optional[ProfileSession] = None, coalesce: bool = True):
+    """Attach to the in-flight (or just finished) generation for an identical payload, or start a new one.
+
+    Only the request that starts a generation takes an admission slot; the slot is held until the
+    generation finishes, however many duplicates attach to it. A profile session only runs when this
+    request starts the generation; coalesce=False always starts a generation of its own.
+    """
+    flights = get_report_flights()
+    if coalesce and getattr(settings, 'analyze_dedup_enabled', True):
+        key = flights.key_of(data.model_dump(exclude={"callback_url"}))
+    else:
+        key = uuid.uuid4().hex
+    flight, role = flights.join(key)
+    if role == ReportSingleFlight.LEADER:
+        try:
+            permit = await admit(endpoint)
+        except BaseException as e:
+            # Duplicates that attached meanwhile fail the same way
+            flights.abandon(flight, e)
+            raise
+        if permit is not None:
+            loop = asyncio.get_running_loop()
+            flight.add_done_callback(lambda: loop.call_soon_threadsafe(permit.release))
+        flights.start(flight, to_physical_test_input(data), profile)
+    return flights, flight, role
+
+def require_admin(request: Request):
+    """Admin surfaces (profiling, memory reports) require X-Admin-Token and are disabled until settings.admin_token is set."""
+    token = getattr(settings, 'admin_token', None)
+    if not token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    if not secrets.compare_digest(request.headers.get("x-admin-token", ""), token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+def profile_requested(request: Request, requested: bool) -> bool:
+    """Explicit profiling (?profile=true or X-Profile: 1), admin only."""
+    if requested or request.headers.get("x-profile", "").lower() in ("1", "true"):
+        require_admin(request)
+        return True
+    return False
+
+def profile_sampled() -> bool:
+    rate = getattr(settings, 'profile_sample_rate', 0.0)
+    return rate > 0 and random.random() < rate
 
 @app.post("/analyze")
-async def analyze_physical_test(data: PhysicalTestRequest):
-    if service is None:
-        raise HTTPException(status_code=500, detail="Service not initialized")
+async def analyze_physical_test(data: PhysicalTestRequest, request: Request, response: Response,
+                                async_mode: bool = False, profile: bool = False):
+    service = get_service()
+
+    if async_mode:
+        return await submit_report_job(service, data)
 
+    # An explicit profile gets a generation of its own; sampled requests still coalesce and
+    # are profiled only when they lead the generation
+    explicit = profile_requested(request, profile)
+    session = None
+    if explicit or profile_sampled():
+        session = ProfileSession("analyze", interval=getattr(settings, 'profile_interval', 0.005))
+    flights, flight, role = await join_report_flight(data, "analyze", profile=session, coalesce=not explicit)
+    response.headers["X-Request-Coalesced"] = role
     try:
-        # Convert string gender to Enum
-        gender_enum = Gender.MALE if data.gender == "男" else Gender.FEMALE
-        
-        # Create PhysicalTestInput object
-        user_data = PhysicalTestInput(
-            age=data.age,
-            gender=gender_enum,
-            height=data.height,
-            weight=data.weight,
-            bmi=data.bmi,
-            body_fat_rate=data.body_fat_rate,
-            vital_capacity=data.vital_capacity,
-            max_oxygen_uptake=data.max_oxygen_uptake,
-            sit_and_reach=data.sit_and_reach,
-            single_leg_stand=data.single_leg_stand,
-            reaction_time=data.reaction_time,
-            grip_strength=data.grip_strength,
-            sit_ups_per_minute=data.sit_ups_per_minute,
-            push_ups=data.push_ups,
-            vertical_jump=data.vertical_jump,
-            high_knees_2min=data.high_knees_2min,
-            sit_to_stand_30s=data.sit_to_stand_30s,
-            name=data.name,
-            diseases=data.diseases,
-            exercise_preferences=data.exercise_preferences,
-            exercise_risk_level=data.exercise_risk_level,
-            uses_equipment=data.uses_equipment
-        )
-
-        # Call the service
-        result = service.analyze_physical_test(user_data)
-
-        # Consume the generator to get the full report text
-        full_report = ""
-        if result.basic_analysis:
-            for chunk in result.basic_analysis:
-                full_report += chunk
+        # Scoring and retrieval run on the CPU pool, the LLM stream is drained on the I/O pool;
+        # waiting happens on the event loop so duplicates never hold the threads the generation needs
+        result, full_report = await flights.wait_async(flight, getattr(settings, 'analyze_wait_timeout', 300.0))
+        if session is not None and role == ReportSingleFlight.LEADER:
+            response.headers["X-Profile-Id"] = await service.executors.run_io(profile_store.save, session)
 
         return {
             "code": 200,
@@ -105,13 +322,275 @@ async def analyze_physical_test(data: PhysicalTestRequest):
                 "overall_score": result.overall_score,
                 "overall_rating": result.overall_rating,
                 "report": full_report,
-                "individual_scores": result.individual_scores,
-                "individual_ratings": result.individual_ratings
+                "individual_scores": result.scores_dict(),
+                "individual_ratings": dict(result.individual_ratings),
+                "plan_data": plan_data_of(result)
             }
         }
 
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Report generation timed out")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        flights.leave(flight)
+
+def scores_of(result) -> Dict[str, Any]:
+    return {
+        "overall_score": result.overall_score,
+        "overall_rating": result.overall_rating,
+        "individual_scores": result.scores_dict(),
+        "individual_ratings": dict(result.individual_ratings)
+    }
+
+@app.post("/evaluate")
+async def evaluate_physical_test(data: Union[List[PhysicalTestRequest], PhysicalTestRequest], request: Request,
+                                 format: Optional[str] = None):
+    """Scores and ratings only (no KG, RAG or LLM). Accepts a single request or an array for bulk re-scoring.
+
+    Bulk results can also be encoded as MessagePack or an Arrow IPC stream (one row per record),
+    chosen by `?format=msgpack|arrow` or the Accept header.
+    """
+    # Scoring needs none of the heavy components, so it is served during warm-up too
+    service = get_service(require_ready=False)
+    try:
+        result_format = result_encoding.negotiate_format(request.headers.get("accept", ""), format)
+    except result_encoding.UnsupportedEncodingError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+    if isinstance(data, list):
+        max_items = getattr(settings, 'evaluate_max_items', 10000)
+        if len(data) > max_items:
+            raise HTTPException(status_code=413, detail=f"Too many records (max {max_items} items)")
+
+    try:
+        if isinstance(data, list):
+            # Bulk lists are scored column-wise: one matrix in, one score matrix out, rows encoded at the end
+            from src.models.batch import PhysicalTestBatch
+
+            def score_batch():
+                return list(service.evaluate_scores_batch(PhysicalTestBatch.from_records(data)).records())
+            # A handful of records scores in microseconds; cohort-sized lists would stall the event loop
+            if len(data) > getattr(settings, 'evaluate_offload_items', 50):
+                results = await service.executors.run_cpu(score_batch)
+            else:
+                results = score_batch()
+        else:
+            results = scores_of(service.evaluate_scores(to_physical_test_input(data)))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    payload = {
+        "code": 200,
+        "message": "success",
+        "data": results
+    }
+    if result_format == result_encoding.JSON:
+        return payload
+    try:
+        # Encoding (and the first pyarrow import) is CPU-bound; keep it off the event loop
+        if result_format == result_encoding.ARROW:
+            body = await service.executors.run_cpu(result_encoding.encode_scores_arrow,
+                                                   results if isinstance(results, list) else [results])
+        else:
+            body = await service.executors.run_cpu(result_encoding.encode_msgpack, payload)
+    except result_encoding.UnsupportedEncodingError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    return Response(content=body, media_type=result_encoding.MEDIA_TYPES[result_format])
+
+@app.post("/analyze/batch")
+async def analyze_physical_test_batch(data: List[PhysicalTestRequest], request: Request):
+    """NDJSON stream, one line per item in completion order; identical KG/RAG queries run once per batch."""
+    service = get_service()
+    max_items = getattr(settings, 'batch_max_items', 200)
+    if len(data) > max_items:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {max_items} items)")
+
+    users = [to_physical_test_input(item) for item in data]
+    permit = await admit("analyze_batch")
+    cancel_token = CancelToken()
+    results = service.analyze_batch(users, max_concurrency=getattr(settings, 'batch_max_concurrency', 4),
+                                    cancel_token=cancel_token)
+
+    async def ndjson_stream():
+        completed = False
+        try:
+            async for index, result, report in service.executors.iterate_io(results):
+                if await request.is_disconnected():
+                    break
+                if result is None:
+                    # A failed item only fails its own line; the rest of the batch keeps going
+                    yield json.dumps({"index": index, "error": report}, ensure_ascii=False) + "\n"
+                    continue
+                line = {
+                    "index": index,
+                    **scores_of(result),
+                    "report": report,
+                    "plan_data": plan_data_of(result)
+                }
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            else:
+                completed = True
+        except Exception as e:
+            if not cancel_token.cancelled:
+                yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away (or the stream itself broke): stop queued items and abort in-flight LLM requests
+            if not completed:
+                cancel_token.cancel()
+            if permit is not None:
+                permit.release()
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson",
+                             background=BackgroundTask(permit.release) if permit else None)
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/analyze/stream")
+async def analyze_physical_test_stream(data: PhysicalTestRequest, request: Request):
+    """Server-Sent Events: `scores` first, then report `delta`s as they arrive, then `done` with usage stats.
+
+    Identical concurrent payloads share one generation; every subscriber gets the full replay from the start.
+    """
+    service = get_service()
+    flights, flight, role = await join_report_flight(data, "analyze_stream")
+
+    async def event_stream():
+        try:
+            async for kind, value in service.executors.iterate_io(flights.subscribe(flight)):
+                if await request.is_disconnected():
+                    break
+                if kind == "heartbeat":
+                    yield ": keep-alive\n\n"
+                elif kind == "scores":
+                    yield sse_event("scores", scores_of(value))
+                elif kind == "delta":
+                    yield sse_event("delta", {"text": value})
+                else:
+                    stats = value.stream_stats
+                    yield sse_event("done", {
+                        "plan_data": plan_data_of(value),
+                        "usage": stats.usage if stats else {},
+                        "stats": stats.to_dict() if stats else {}
+                    })
+        except RequestCancelled:
+            pass
+        except Exception as e:
+            yield sse_event("error", {"message": getattr(e, "detail", None) or str(e)})
+        finally:
+            # The upstream LLM request is aborted once the last subscriber has gone
+            flights.leave(flight)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+                                      "X-Request-Coalesced": role})
+
+async def submit_report_job(service, data: PhysicalTestRequest):
+    """Enqueue report generation and return the job id immediately."""
+    # The job store is SQLite: opening it and inserting the job are blocking calls
+    job_queue = await service.executors.run_io(get_job_queue)
+    try:
+        job_id = await service.executors.run_io(job_queue.submit, to_physical_test_input(data), data.model_dump(),
+                                                data.callback_url)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except CallbackNotAllowedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "code": 200,
+        "message": "success",
+        "data": {"job_id": job_id, "status": JobStore.QUEUED}
+    }
+
+@app.get("/admin/profiles")
+async def list_profiles(request: Request):
+    """Captured request profiles, newest first."""
+    require_admin(request)
+    return {
+        "code": 200,
+        "message": "success",
+        "data": await asyncio.get_running_loop().run_in_executor(None, profile_store.list)
+    }
+
+@app.get("/admin/profiles/{name}")
+async def get_profile(name: str, request: Request, format: str = "folded"):
+    """`folded` stacks (speedscope / flamegraph.pl input) or the `json` summary with the hottest functions."""
+    require_admin(request)
+    if format == "json":
+        summary = profile_store.load_summary(name)
+        if summary is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return {"code": 200, "message": "success", "data": summary}
+    path = profile_store.path(name, ".folded")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"{name}.folded")
+
+@app.get("/debug/memory")
+async def debug_memory(request: Request, format: str = "json"):
+    """Takes a fresh sample: RSS, per-component sizes with growth since the first sample, leak suspects
+    and (when tracemalloc is on) the top allocation sites. `format=text` gives the CLI table."""
+    require_admin(request)
+    report = await asyncio.get_running_loop().run_in_executor(None, memory_tracker.report)
+    if format == "text":
+        return PlainTextResponse(format_report(report))
+    return {"code": 200, "message": "success", "data": report}
+
+@app.get("/jobs/{job_id}")
+async def get_report_job(job_id: str):
+    service = get_service()
+    job_queue = await service.executors.run_io(get_job_queue)
+    job = await service.executors.run_io(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    scores = job["scores"] or {}
+    return {
+        "code": 200,
+        "message": "success",
+        "data": {
+            "job_id": job_id,
+            "status": job["status"],
+            "progress": job["progress"],
+            "error": job["error"],
+            "overall_score": scores.get("overall_score"),
+            "overall_rating": scores.get("overall_rating"),
+            "report": job["report"],
+            "individual_scores": scores.get("individual_scores"),
+            "individual_ratings": scores.get("individual_ratings"),
+            "plan_data": job["plan_data"],
+            "stats": job["stats"]
+        }
+    }
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_report_job(job_id: str, request: Request):
+    """Attach to a job: replays the text generated so far, then follows it live (same events as /analyze/stream)."""
+    service = get_service()
+    job_queue = await service.executors.run_io(get_job_queue)
+    if await service.executors.run_io(job_queue.store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for kind, value in service.executors.iterate_io(job_queue.subscribe(job_id)):
+            if await request.is_disconnected():
+                break
+            if kind == "heartbeat":
+                yield ": keep-alive\n\n"
+            elif kind == "scores":
+                yield sse_event("scores", value)
+            elif kind == "delta":
+                yield sse_event("delta", {"text": value})
+            elif value["status"] == JobStore.SUCCEEDED:
+                stats = value["stats"] or {}
+                yield sse_event("done", {"plan_data": value["plan_data"], "usage": stats.get("usage", {}), "stats": stats})
+            else:
+                yield sse_event("error", {"message": value["error"] or "任务未完成"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 if __name__ == "__main__":
     import uvicorn
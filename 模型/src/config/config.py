@@ -23,7 +23,125 @@ class Settings:
         self.deepseek_api_base_url = "https://api.deepseek.com"
         self.deepseek_model = "deepseek-chat"
         self.deepseek_max_tokens = 4096
-        
+        self.llm_request_timeout = 60  # 非流式请求超时（秒）
+        self.llm_stream_timeout = 120  # 流式请求读超时（秒）
+        self.llm_stream_chunk_size = 4096  # 流式响应单次网络读取的最大字节数
+        self.llm_stream_coalesce_ms = 0  # 文本增量合并窗口（毫秒），0表示按网络读块输出
+
+        # 报告输出模式：markdown（纯文本报告）或hybrid（报告末尾附加结构化计划JSON块，解析后直接得到逐日训练安排）
+        self.report_output_mode = "hybrid"
+
+        # 提示词token预算：专业知识参考按相关度分数×分区权重填充剩余预算
+        self.deepseek_tokenizer_path = os.path.join(self.project_root, "deepseek_tokenizer")  # 本地分词器目录，缺失时按字符估算
+        self.prompt_input_token_budget = 6000
+        self.prompt_min_snippet_tokens = 64  # 剩余预算低于该值时不再截断填充
+        self.prompt_section_weights = {
+            "profile": 1.0,
+            "risk": 1.2,
+            "disease": 1.2,
+            "preference": 0.8,
+            "rag": 1.0
+        }
+
+        # 备用LLM端点（主端点熔断、失败或首字过慢时使用），按优先级排列
+        # 例如: [{"name": "backup", "base_url": "https://...", "api_key": "...", "model": "deepseek-chat"}]
+        self.deepseek_fallback_endpoints = []
+
+        # 对冲请求配置：首字延迟超过历史分位数时向下一个端点发起第二次请求，先出字者胜出
+        self.llm_hedge_enabled = False
+        self.llm_hedge_ttft_percentile = 95
+        self.llm_hedge_initial_delay = 5.0  # 样本不足时使用的对冲延迟（秒）
+        self.llm_hedge_min_delay = 1.0
+        self.llm_hedge_max_delay = 20.0
+        self.llm_hedge_min_samples = 20
+
+        # LLM响应录制/回放：off（关闭）、record（录制真实响应到磁盘）、replay（只从磁盘回放，不访问API）
+        self.llm_record_mode = "off"
+        self.llm_record_dir = os.path.join(self.project_root, "data/llm_recordings")
+        self.llm_replay_realtime = False  # 回放时是否按录制时的时间间隔输出
+
+        # 端点熔断配置
+        self.llm_circuit_failure_threshold = 5
+        self.llm_circuit_reset_timeout = 30.0
+
+        # 预fork模式（gunicorn preload_app，由backend/gunicorn.conf.py设置SERVICE_PRELOAD=1）：
+        # 主进程加载只读数据后再fork，各worker以写时复制方式共享
+        self.service_preload = os.environ.get("SERVICE_PRELOAD") == "1"
+        self.faiss_mmap = True  # 以mmap方式读取预计算的FAISS索引，多进程共享页缓存
+
+        # 模型推理旁路进程（python -m src.inference.server）：嵌入和重排在独立进程中按动态微批次执行
+        # 地址为Unix socket路径（Windows为\\.\pipe\名称），None表示在本进程内加载模型
+        self.inference_server_address = None
+        self.inference_server_authkey = b"health-inference"
+        self.inference_max_batch_size = 64  # 单次前向计算的最大文本数
+        self.inference_max_wait_ms = 5  # 收到第一条请求后等待合并的最长时间
+        self.inference_timeout = 30.0
+
+        # 服务预热：重量级组件在后台线程分阶段加载，加载完成前报告类接口返回503并附带Retry-After
+        self.service_warmup_background = True
+        self.service_warmup_retry_after = 5  # 秒
+
+        # 阻塞任务线程池与接口准入控制：超出并发上限的请求排队，队列已满或排队超时返回429
+        self.cpu_pool_workers = None  # None表示按CPU核数
+        self.io_pool_workers = 32
+        self.retrieval_pool_workers = 16  # 各路知识检索（知识图谱、RAG）并行执行的线程数
+        self.admission_limits = {
+            "analyze": {"limit": 8, "max_queue": 16},
+            "analyze_stream": {"limit": 16, "max_queue": 16},
+            "analyze_batch": {"limit": 2, "max_queue": 2}
+        }
+        self.admission_queue_timeout = 10.0  # 秒
+
+        # 响应压缩：按Accept-Encoding协商zstd/br/gzip（zstd、br需安装zstandard、brotli），流式响应逐分片刷新
+        self.response_compression_enabled = True
+        self.response_compression_min_size = 1024  # 小于该字节数的普通响应不压缩
+        self.response_compression_levels = {"zstd": 3, "br": 4, "gzip": 6}
+
+        # 相同分析请求合并（/analyze、/analyze/stream）：并发的相同请求体共享一次生成，刚完成的结果短时间内直接回放
+        self.analyze_dedup_enabled = True
+        self.analyze_dedup_completed_ttl = 30.0  # 已完成结果的保留时间（秒），吸收前端重试和重复点击
+        self.analyze_dedup_max_completed = 256
+        self.analyze_wait_timeout = 300.0  # /analyze等待生成完成的最长时间（秒），超时返回504
+
+        # 报告前的知识检索：各路来源并行执行，超过各自时限的来源被跳过（秒，从检索开始计时）
+        self.retrieval_timeouts = {"profile": 3.0, "risk": 3.0, "disease": 3.0, "preference": 3.0, "rag": 5.0}
+        self.knowledge_cache_size = 1024  # 跨请求缓存的检索结果条数，0表示不缓存
+        self.knowledge_cache_ttl = 600.0  # 秒
+        self.knowledge_cache_enabled = False  # 跨请求缓存默认只在推测启动模式下使用，设为True时普通模式也读写缓存
+        # 推测启动：评分完成即开始检索（与运动处方生成并行），报告请求最多等待latency_budget秒的上下文，
+        # 未及时返回的来源不纳入本次报告，完成后写入缓存供之后的请求使用
+        self.report_speculative_start = False
+        self.report_context_latency_budget = 0.5  # 秒
+
+        # 请求剖析：/analyze带X-Profile: 1请求头或?profile=true时采样该请求的调用栈，另按profile_sample_rate随机抽样
+        self.profile_dir = os.path.join(self.project_root, "data/profiles")
+        self.profile_sample_rate = 0.0  # 常开抽样比例，如0.01
+        self.profile_interval = 0.005  # 采样间隔（秒）
+        self.profile_max_files = 200
+        # 管理接口令牌（/admin/*、/debug/memory及按需剖析），未设置时这些接口关闭
+        self.admin_token = os.environ.get("ADMIN_TOKEN")
+
+        # 内存报告（/debug/memory）：按组件统计内存，保留最近memory_max_samples次采样用于判断增长和泄漏
+        self.memory_sample_interval = 0.0  # 后台采样间隔（秒），0表示只在请求报告时采样
+        self.memory_max_samples = 120
+        self.memory_tracemalloc_frames = 0  # 大于0时启动即开启tracemalloc（保留的栈深度），有明显的运行开销
+
+        # 批量评分（/evaluate传入数组）：超过evaluate_max_items条返回413，超过evaluate_offload_items条时在CPU线程池中评分
+        self.evaluate_max_items = 10000
+        self.evaluate_offload_items = 50
+
+        # 批量分析（/analyze/batch）：批内相同的检索查询只执行一次，报告并发生成
+        self.batch_max_items = 200
+        self.batch_max_concurrency = 4  # 同时进行的大模型报告生成数
+
+        # 异步报告任务：有界线程池后台生成报告，结果（含部分报告）持久化到SQLite
+        self.report_job_workers = 4
+        self.report_job_max_pending = 100  # 排队和生成中的任务上限，超出时拒绝提交
+        self.report_job_db_path = os.path.join(self.project_root, "data/report_jobs.sqlite3")
+        self.report_job_flush_interval = 1.0  # 部分报告落盘间隔（秒）
+        self.report_job_webhook_timeout = 10.0
+        self.report_job_callback_hosts = []  # 允许的callback_url主机名（仅http/https）；为空时不接受回调地址
+
         # 日志配置
         self.log_level = "INFO"
         self.log_file = os.path.join(self.project_root, "app.log")
@@ -51,12 +169,9 @@ class Settings:
         # 运动处方配置
         self.prescription_stages = 3
         self.exercise_plan_template = os.path.join(self.project_root, "data/templates/exercise_plan.txt")
-        
-        # 确保数据目录存在
-        self._ensure_directories_exist()
     
-    def _ensure_directories_exist(self):
-        """确保必要的目录存在"""
+    def ensure_directories(self):
+        """确保必要的目录存在（由加载组件的服务调用，导入配置本身没有文件系统副作用）"""
         directories = [
             self.rag_components_path,
             os.path.dirname(self.kg_triples_path),
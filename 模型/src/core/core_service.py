@@ -1,29 +1,106 @@
+import json
 import logging
 import os
-from typing import Dict, Any, Optional, List, Tuple
-from src.models.models import PhysicalTestInput, EvaluationResult, ExercisePrescription, ExercisePhase
-from src.kg.kg_manager import KnowledgeGraphManager
-from src.rag.rag_components import RAGPipeline
-from src.llm.llm_client import DeepSeekAPIClient
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from typing import TYPE_CHECKING, Callable, Dict, Any, Iterator, Optional, List, Tuple
+from src.models.models import Metric, PhysicalTestInput, EvaluationResult, ExercisePrescription, ExercisePhase, FailedReport
+from src.llm.resilience import CancelToken
+from src.llm.sse import StreamStats
+from src.llm.prompt_budget import ContextSnippet, PromptBudgeter, TokenCounter
+from src.core.executors import ServiceExecutors
+from src.core.knowledge_cache import KnowledgeCache
+from src.core.query_memo import QueryMemo
+from src.core.report_prompt import ReportPromptBuilder
+from src.core.structured_report import iter_structured_report
 from src.utils.data_loader import FitnessDataLoader
+from src.utils.tracing import in_current_context, span
 from src.config.config import settings
-import datetime
+
+if TYPE_CHECKING:
+    from src.models.batch import BatchScores, PhysicalTestBatch
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 各年龄段综合得分的指标权重（按求和顺序排列）
+_AGE_GROUP_WEIGHTS = {
+    # 20-49岁成年人体质综合评级得分计算
+    "20-49": (
+        (Metric.BMI, 0.05), (Metric.BODY_FAT_RATE, 0.10), (Metric.VITAL_CAPACITY, 0.10),
+        (Metric.MAX_OXYGEN_UPTAKE, 0.15),  # 功率车二级负荷试验对应最大摄氧量
+        (Metric.GRIP_STRENGTH, 0.1), (Metric.VERTICAL_JUMP, 0.10), (Metric.PUSH_UPS, 0.05),
+        (Metric.SIT_UPS_PER_MINUTE, 0.05), (Metric.SIT_AND_REACH, 0.10), (Metric.SINGLE_LEG_STAND, 0.10),
+        (Metric.REACTION_TIME, 0.10)
+    ),
+    # 50-59岁成年人体质综合评级得分计算
+    "50-59": (
+        (Metric.BMI, 0.05), (Metric.BODY_FAT_RATE, 0.10), (Metric.VITAL_CAPACITY, 0.10),
+        (Metric.MAX_OXYGEN_UPTAKE, 0.15),  # 功率车二级负荷试验对应最大摄氧量
+        (Metric.GRIP_STRENGTH, 0.15), (Metric.SIT_AND_REACH, 0.15), (Metric.PUSH_UPS, 0.05),
+        (Metric.SIT_UPS_PER_MINUTE, 0.05), (Metric.SINGLE_LEG_STAND, 0.10), (Metric.REACTION_TIME, 0.10)
+    ),
+    # 60-79岁老年人体质综合得分计算
+    "60-79": (
+        (Metric.BMI, 0.10), (Metric.BODY_FAT_RATE, 0.10), (Metric.VITAL_CAPACITY, 0.10),
+        (Metric.HIGH_KNEES_2MIN, 0.10),  # 2分钟原地高抬腿
+        (Metric.GRIP_STRENGTH, 0.15), (Metric.SIT_AND_REACH, 0.10),
+        (Metric.SIT_TO_STAND_30S, 0.15),  # 30秒坐站
+        (Metric.SINGLE_LEG_STAND, 0.10), (Metric.REACTION_TIME, 0.10)
+    )
+}
+
+
+def _age_group(age: int) -> Optional[str]:
+    if 20 <= age <= 49:
+        return "20-49"
+    if 50 <= age <= 59:
+        return "50-59"
+    if 60 <= age <= 79:
+        return "60-79"
+    return None
+
 class IntegratedFitnessRAGService:
     """整合RAG与知识图谱的体质分析服务"""
-    def __init__(self, config):
+    def __init__(self, config, defer_startup: bool = False):
+        """defer_startup为True时只构造轻量部分，重量级组件由调用方按startup_stages()逐步加载"""
         self.config = config
-        self.kg_manager = KnowledgeGraphManager(config)
-        self.rag_pipeline = RAGPipeline(config)
-        self.llm_client = DeepSeekAPIClient(config)
+        self.kg_manager = None
+        self.rag_pipeline = None
+        self.llm_client = None
         self.data_loader = FitnessDataLoader()
         
-        # 加载动作方案库到RAG系统
-        self._load_exercise_plan_library()
+        # 阻塞任务线程池：cpu池执行检索/推理/评分，io池执行大模型调用（供异步接口offload）
+        self.executors = ServiceExecutors(
+            cpu_workers=getattr(config, 'cpu_pool_workers', None),
+            io_workers=getattr(config, 'io_pool_workers', 32),
+            retrieval_workers=getattr(config, 'retrieval_pool_workers', 16)
+        )
+        # 各路知识检索的时限（秒），超时的来源被跳过
+        self.retrieval_timeouts = getattr(config, 'retrieval_timeouts', {})
+        
+        # 跨请求的检索结果缓存（推测启动模式或knowledge_cache_enabled时使用）；
+        # 推测启动模式下评分完成即开始检索，上下文只等待latency_budget秒
+        self.knowledge_cache = KnowledgeCache(
+            max_entries=getattr(config, 'knowledge_cache_size', 1024),
+            ttl=getattr(config, 'knowledge_cache_ttl', 600.0)
+        )
+        self.knowledge_cache_enabled = getattr(config, 'knowledge_cache_enabled', False)
+        self.report_speculative_start = getattr(config, 'report_speculative_start', False)
+        self.report_context_latency_budget = getattr(config, 'report_context_latency_budget', 0.5)
+        
+        # 提示词token预算
+        self.token_counter = TokenCounter(getattr(config, 'deepseek_tokenizer_path', None))
+        self.prompt_budgeter = PromptBudgeter(
+            self.token_counter,
+            section_weights=getattr(config, 'prompt_section_weights', None),
+            min_snippet_tokens=getattr(config, 'prompt_min_snippet_tokens', 64)
+        )
+        self.prompt_budgeter_budget = getattr(config, 'prompt_input_token_budget', 6000)
+        
+        # 报告输出模式：markdown（纯文本）或hybrid（文本+结构化计划JSON块）
+        self.report_output_mode = getattr(config, 'report_output_mode', 'markdown')
         
         # 指标单位映射
         self.metric_units = {
@@ -43,113 +120,195 @@ class IntegratedFitnessRAGService:
             "high_knees_2min": "次/2分钟",
             "sit_to_stand_30s": "次/30秒"
         }
+        self.report_prompt_builder = ReportPromptBuilder(self.metric_units)
+        
+        if not defer_startup:
+            for _, stage in self.startup_stages():
+                stage()
     
-    def analyze_physical_test(self, user_data: PhysicalTestInput) -> EvaluationResult:
-        """分析体质测试数据"""
+    def startup_stages(self) -> List[Tuple[str, Callable[[], None]]]:
+        """重量级组件的加载步骤（组件名, 加载函数），按顺序执行"""
+        return [
+            ("knowledge_graph", self._init_knowledge_graph),
+            ("rag_pipeline", self._init_rag_pipeline),
+            ("llm_client", self._init_llm_client),
+            # 加载动作方案库到RAG系统
+            ("exercise_library", self._load_exercise_plan_library)
+        ]
+    
+    # 组件模块在加载时才导入（faiss、numpy、requests等），只评分的调用方不承担这些导入开销
+    def _init_knowledge_graph(self):
+        from src.kg.kg_manager import KnowledgeGraphManager
+        self.kg_manager = KnowledgeGraphManager(self.config)
+        # 重新加载知识图谱后，缓存中的摘要可能已过时
+        self.knowledge_cache.clear()
+    
+    def _init_rag_pipeline(self):
+        from src.rag.rag_components import RAGPipeline
+        ensure_directories = getattr(self.config, 'ensure_directories', None)
+        if ensure_directories is not None:
+            ensure_directories()
+        self.rag_pipeline = RAGPipeline(self.config)
+    
+    def _init_llm_client(self):
+        from src.llm.llm_client import DeepSeekAPIClient
+        self.llm_client = DeepSeekAPIClient(self.config)
+    
+    def analyze_physical_test(self, user_data: PhysicalTestInput,
+                              cancel_token: Optional[CancelToken] = None,
+                              query_memo: Optional[QueryMemo] = None) -> EvaluationResult:
+        """分析体质测试数据（cancel_token被取消时中断报告的流式生成，query_memo用于批量请求间共享检索结果）"""
         result = EvaluationResult()
         
         try:
-            # 1. 评估各项指标
-            self._evaluate_metrics(user_data, result)
+            with span("analyze.scoring"):
+                # 1. 评估各项指标
+                self._evaluate_metrics(user_data, result)
+                
+                # 2. 计算综合评级
+                self._calculate_overall_rating(result, user_data)
             
-            # 2. 计算综合评级
-            self._calculate_overall_rating(result, user_data)
+            # 推测启动：检索只依赖评分结果，提前开始，与运动处方生成并行
+            retrieval = None
+            if self.report_speculative_start:
+                retrieval = self._start_knowledge_retrieval(user_data, result, query_memo)
             
             # 3. 生成运动处方
-            prescription = self._generate_exercise_prescription(user_data, result)
+            with span("analyze.prescription"):
+                prescription = self._generate_exercise_prescription(user_data, result)
             result.exercise_prescription = prescription
             
             # 4. 生成详细分析报告（流式生成器）
-            result.basic_analysis = self._generate_detailed_report(user_data, result)
+            result.basic_analysis = self._generate_detailed_report(user_data, result, cancel_token, query_memo,
+                                                                   retrieval)
             
         except Exception as e:
             logger.error(f"体质分析失败: {str(e)}")
-            # 返回一个生成器，生成错误信息
-            def error_generator():
-                yield f"体质分析过程中发生错误: {str(e)}"
-            result.basic_analysis = error_generator()
+            # 返回错误信息作为报告（标记为失败，不被缓存回放）
+            result.basic_analysis = FailedReport(f"体质分析过程中发生错误: {str(e)}")
         
         return result
     
+    def analyze_batch(self, users: List[PhysicalTestInput], max_concurrency: int = 4,
+                      cancel_token: Optional[CancelToken] = None
+                      ) -> Iterator[Tuple[int, Optional[EvaluationResult], str]]:
+        """批量分析：相同的知识图谱/RAG查询在批内只执行一次，报告生成并发数不超过max_concurrency，
+        按完成顺序产出(序号, 评估结果, 完整报告)；单条失败时产出(序号, None, 错误信息)，不影响其余条目"""
+        query_memo = QueryMemo()
+        
+        def run(user_data: PhysicalTestInput) -> Tuple[EvaluationResult, str]:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            result = self.analyze_physical_test(user_data, cancel_token, query_memo)
+            return result, "".join(result.basic_analysis or [])
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="batch-analyze")
+        try:
+            futures = {executor.submit(run, user_data): index for index, user_data in enumerate(users)}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result, report = future.result()
+                except Exception as e:
+                    if cancel_token is not None and cancel_token.cancelled:
+                        return
+                    logger.warning(f"批量分析第{index}条失败: {str(e)}")
+                    yield index, None, str(e)
+                    continue
+                yield index, result, report
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            logger.info(f"批量分析{len(users)}条: 检索查询命中{query_memo.hits}次，实际执行{query_memo.misses}次")
+    
+    def evaluate_scores(self, user_data: PhysicalTestInput) -> EvaluationResult:
+        """只计算各项指标得分和综合评级，不查询知识图谱、不检索、不调用大模型"""
+        result = EvaluationResult()
+        with span("analyze.scoring"):
+            self._evaluate_metrics(user_data, result)
+            self._calculate_overall_rating(result, user_data)
+        return result
+    
+    def evaluate_scores_batch(self, batch: "PhysicalTestBatch") -> "BatchScores":
+        """列式批量评分：逐行由批次矩阵构造PhysicalTestInput，EvaluationResult以结果矩阵的行视图为存储，
+        得分和评级直接写入BatchScores，不再为每行生成结果字典（由BatchScores.records()在输出时统一转换）"""
+        from src.models.batch import BatchScores
+        scores = BatchScores(len(batch))
+        with span("analyze.scoring_batch"):
+            for i in range(len(batch)):
+                user_data = batch.row(i)
+                result = EvaluationResult(scores.scores[i], scores.ratings[i])
+                self._evaluate_metrics(user_data, result)
+                self._calculate_overall_rating(result, user_data)
+                scores.overall_scores[i] = result.overall_score
+                scores.overall_ratings[i] = result.overall_rating
+        return scores
+    
     def _evaluate_metrics(self, user_data: PhysicalTestInput, result: EvaluationResult):
         """评估各项体质指标"""
         # BMI评估
         if user_data.bmi is not None:
             bmi_score, bmi_rating = self._evaluate_bmi(user_data.bmi)
-            result.individual_scores["bmi"] = bmi_score
-            result.individual_ratings["bmi"] = bmi_rating
+            result.set_metric(Metric.BMI, bmi_score, bmi_rating)
         
         # 体脂率评估
         if user_data.body_fat_rate is not None:
             fat_score, fat_rating = self._evaluate_body_fat_rate(user_data.body_fat_rate, user_data.gender, user_data.age)
-            result.individual_scores["body_fat_rate"] = fat_score
-            result.individual_ratings["body_fat_rate"] = fat_rating
+            result.set_metric(Metric.BODY_FAT_RATE, fat_score, fat_rating)
         
         # 肺活量评估
         if user_data.vital_capacity is not None:
             vital_score, vital_rating = self._evaluate_vital_capacity(user_data.vital_capacity, user_data.gender, user_data.age)
-            result.individual_scores["vital_capacity"] = vital_score
-            result.individual_ratings["vital_capacity"] = vital_rating
+            result.set_metric(Metric.VITAL_CAPACITY, vital_score, vital_rating)
         
         # 最大摄氧量评估（成年人）
         if user_data.max_oxygen_uptake is not None and 20 <= user_data.age <= 59:
             oxygen_score, oxygen_rating = self._evaluate_max_oxygen_uptake(user_data.max_oxygen_uptake, user_data.gender, user_data.age)
-            result.individual_scores["max_oxygen_uptake"] = oxygen_score
-            result.individual_ratings["max_oxygen_uptake"] = oxygen_rating
+            result.set_metric(Metric.MAX_OXYGEN_UPTAKE, oxygen_score, oxygen_rating)
         
         # 柔韧性评估（坐位体前屈）
         if user_data.sit_and_reach is not None:
             flex_score, flex_rating = self._evaluate_flexibility(user_data.sit_and_reach, user_data.gender, user_data.age)
-            result.individual_scores["sit_and_reach"] = flex_score
-            result.individual_ratings["sit_and_reach"] = flex_rating
+            result.set_metric(Metric.SIT_AND_REACH, flex_score, flex_rating)
         
         # 平衡能力评估（闭眼单脚站立）
         if user_data.single_leg_stand is not None:
             balance_score, balance_rating = self._evaluate_balance(user_data.single_leg_stand, user_data.gender, user_data.age)
-            result.individual_scores["single_leg_stand"] = balance_score
-            result.individual_ratings["single_leg_stand"] = balance_rating
+            result.set_metric(Metric.SINGLE_LEG_STAND, balance_score, balance_rating)
         
         # 反应能力评估
         if user_data.reaction_time is not None:
             reaction_score, reaction_rating = self._evaluate_reaction_time(user_data.reaction_time, user_data.gender, user_data.age)
-            result.individual_scores["reaction_time"] = reaction_score
-            result.individual_ratings["reaction_time"] = reaction_rating
+            result.set_metric(Metric.REACTION_TIME, reaction_score, reaction_rating)
         
         # 握力评估
         if user_data.grip_strength is not None:
             grip_score, grip_rating = self._evaluate_grip_strength(user_data.grip_strength, user_data.gender, user_data.age)
-            result.individual_scores["grip_strength"] = grip_score
-            result.individual_ratings["grip_strength"] = grip_rating
+            result.set_metric(Metric.GRIP_STRENGTH, grip_score, grip_rating)
         
         # 仰卧起坐评估（成年人）
         if user_data.sit_ups_per_minute is not None and 20 <= user_data.age <= 59:
             situp_score, situp_rating = self._evaluate_sit_ups(user_data.sit_ups_per_minute, user_data.gender, user_data.age)
-            result.individual_scores["sit_ups_per_minute"] = situp_score
-            result.individual_ratings["sit_ups_per_minute"] = situp_rating
+            result.set_metric(Metric.SIT_UPS_PER_MINUTE, situp_score, situp_rating)
         
         # 俯卧撑评估（成年人）
         if user_data.push_ups is not None and 20 <= user_data.age <= 59:
             pushup_score, pushup_rating = self._evaluate_push_ups(user_data.push_ups, user_data.gender, user_data.age)
-            result.individual_scores["push_ups"] = pushup_score
-            result.individual_ratings["push_ups"] = pushup_rating
+            result.set_metric(Metric.PUSH_UPS, pushup_score, pushup_rating)
         
         # 纵跳评估（20-49岁）
         if user_data.vertical_jump is not None and 20 <= user_data.age <= 49:
             jump_score, jump_rating = self._evaluate_vertical_jump(user_data.vertical_jump, user_data.gender, user_data.age)
-            result.individual_scores["vertical_jump"] = jump_score
-            result.individual_ratings["vertical_jump"] = jump_rating
+            result.set_metric(Metric.VERTICAL_JUMP, jump_score, jump_rating)
         
         # 原地高抬腿评估（老年人）
         if user_data.high_knees_2min is not None and 60 <= user_data.age <= 79:
             knees_score, knees_rating = self._evaluate_high_knees(user_data.high_knees_2min, user_data.gender)
-            result.individual_scores["high_knees_2min"] = knees_score
-            result.individual_ratings["high_knees_2min"] = knees_rating
+            result.set_metric(Metric.HIGH_KNEES_2MIN, knees_score, knees_rating)
         
         # 坐站评估（老年人）
         if user_data.sit_to_stand_30s is not None and 60 <= user_data.age <= 79:
             sit_stand_score, sit_stand_rating = self._evaluate_sit_to_stand(user_data.sit_to_stand_30s, user_data.gender)
-            result.individual_scores["sit_to_stand_30s"] = sit_stand_score
-            result.individual_ratings["sit_to_stand_30s"] = sit_stand_rating
+            result.set_metric(Metric.SIT_TO_STAND_30S, sit_stand_score, sit_stand_rating)
     
     def _calculate_overall_rating(self, result: EvaluationResult, user_data: PhysicalTestInput):
         """计算综合评级"""
@@ -158,50 +317,15 @@ class IntegratedFitnessRAGService:
             result.overall_rating = "数据不足"
             return
         
-        # 根据用户年龄选择不同的权重计算规则
-        age = user_data.age
-        weighted_sum = 0
-        
-        if 20 <= age <= 49:
-            # 20-49岁成年人体质综合评级得分计算
-            weighted_sum += result.individual_scores.get("bmi", 0) * 0.05
-            weighted_sum += result.individual_scores.get("body_fat_rate", 0) * 0.10
-            weighted_sum += result.individual_scores.get("vital_capacity", 0) * 0.10
-            weighted_sum += result.individual_scores.get("max_oxygen_uptake", 0) * 0.15  # 功率车二级负荷试验对应最大摄氧量
-            weighted_sum += result.individual_scores.get("grip_strength", 0) * 0.1
-            weighted_sum += result.individual_scores.get("vertical_jump", 0) * 0.10
-            weighted_sum += result.individual_scores.get("push_ups", 0) * 0.05
-            weighted_sum += result.individual_scores.get("sit_ups_per_minute", 0) * 0.05
-            weighted_sum += result.individual_scores.get("sit_and_reach", 0) * 0.10
-            weighted_sum += result.individual_scores.get("single_leg_stand", 0) * 0.10
-            weighted_sum += result.individual_scores.get("reaction_time", 0) * 0.10
-            result.overall_score = weighted_sum
-        
-        elif 50 <= age <= 59:
-            # 50-59岁成年人体质综合评级得分计算
-            weighted_sum += result.individual_scores.get("bmi", 0) * 0.05
-            weighted_sum += result.individual_scores.get("body_fat_rate", 0) * 0.10
-            weighted_sum += result.individual_scores.get("vital_capacity", 0) * 0.10
-            weighted_sum += result.individual_scores.get("max_oxygen_uptake", 0) * 0.15  # 功率车二级负荷试验对应最大摄氧量
-            weighted_sum += result.individual_scores.get("grip_strength", 0) * 0.15
-            weighted_sum += result.individual_scores.get("sit_and_reach", 0) * 0.15
-            weighted_sum += result.individual_scores.get("push_ups", 0) * 0.05
-            weighted_sum += result.individual_scores.get("sit_ups_per_minute", 0) * 0.05
-            weighted_sum += result.individual_scores.get("single_leg_stand", 0) * 0.10
-            weighted_sum += result.individual_scores.get("reaction_time", 0) * 0.10
-            result.overall_score = weighted_sum
-        
-        elif 60 <= age <= 79:
-            # 60-79岁老年人体质综合得分计算
-            weighted_sum += result.individual_scores.get("bmi", 0) * 0.10
-            weighted_sum += result.individual_scores.get("body_fat_rate", 0) * 0.10
-            weighted_sum += result.individual_scores.get("vital_capacity", 0) * 0.10
-            weighted_sum += result.individual_scores.get("high_knees_2min", 0) * 0.10  # 2分钟原地高抬腿
-            weighted_sum += result.individual_scores.get("grip_strength", 0) * 0.15
-            weighted_sum += result.individual_scores.get("sit_and_reach", 0) * 0.10
-            weighted_sum += result.individual_scores.get("sit_to_stand_30s", 0) * 0.15  # 30秒坐站
-            weighted_sum += result.individual_scores.get("single_leg_stand", 0) * 0.10
-            weighted_sum += result.individual_scores.get("reaction_time", 0) * 0.10
+        # 根据用户年龄选择不同的权重计算规则（未测的指标按0分计）
+        weights = _AGE_GROUP_WEIGHTS.get(_age_group(user_data.age))
+        if weights is not None:
+            scores = result.scores
+            weighted_sum = 0
+            for metric, weight in weights:
+                score = scores[metric]
+                if score == score:
+                    weighted_sum += score * weight
             result.overall_score = weighted_sum
         
         else:
@@ -257,26 +381,33 @@ class IntegratedFitnessRAGService:
         
         try:
             # 使用大模型生成详细的分阶段计划
-            prompt = self._prepare_prescription_prompt(user_data, result, phase1_weeks, phase2_weeks, phase3_weeks)
-            response = self.llm_client.generate_text(prompt)
+            system_prompt, prompt = self.report_prompt_builder.prescription_messages(
+                user_data, result, (phase1_weeks, phase2_weeks, phase3_weeks))
+            response = self.llm_client.generate_text(prompt, system_prompt=system_prompt)
             
             # 解析响应，构建阶段计划
             # 实际项目中应根据大模型返回的格式进行解析
             # 这里简化处理，创建示例阶段计划
             phase1 = ExercisePhase(
                 weeks=f"第1-{phase1_weeks}周",
+                start_week=1,
+                end_week=phase1_weeks,
                 goal="建立运动习惯，提高基础体能",
                 plan="低强度有氧运动为主，每周3-4次，每次20-30分钟"
             )
             
             phase2 = ExercisePhase(
                 weeks=f"第{phase1_weeks+1}-{phase1_weeks+phase2_weeks}周",
+                start_week=phase1_weeks + 1,
+                end_week=phase1_weeks + phase2_weeks,
                 goal="增强心肺功能，提高力量和耐力",
                 plan="中等强度有氧运动结合力量训练，每周4-5次，每次30-40分钟"
             )
             
             phase3 = ExercisePhase(
                 weeks=f"第{phase1_weeks+phase2_weeks+1}-{total_weeks}周",
+                start_week=phase1_weeks + phase2_weeks + 1,
+                end_week=total_weeks,
                 goal="进一步提高运动表现，巩固训练成果",
                 plan="中高强度训练，增加训练多样性，每周5次，每次40-50分钟"
             )
@@ -299,18 +430,24 @@ class IntegratedFitnessRAGService:
         
         phase1 = ExercisePhase(
             weeks=f"第1-{phase1_weeks}周",
+            start_week=1,
+            end_week=phase1_weeks,
             goal="建立运动习惯，熟悉基本动作",
             plan="健步走、慢跑等低强度运动，每周3次，每次20-30分钟"
         )
         
         phase2 = ExercisePhase(
             weeks=f"第{phase1_weeks+1}-{phase1_weeks+phase2_weeks}周",
+            start_week=phase1_weeks + 1,
+            end_week=phase1_weeks + phase2_weeks,
             goal="逐步提高运动强度和时长",
             plan="快走、跑步结合简单力量训练，每周3-4次，每次25-35分钟"
         )
         
         phase3 = ExercisePhase(
             weeks=f"第{phase1_weeks+phase2_weeks+1}-{total_weeks}周",
+            start_week=phase1_weeks + phase2_weeks + 1,
+            end_week=total_weeks,
             goal="巩固成果，尝试更多运动形式",
             plan="中等强度有氧运动结合全面力量训练，每周4-5次，每次30-40分钟"
         )
@@ -319,14 +456,22 @@ class IntegratedFitnessRAGService:
         
         return prescription
     
-    def _generate_detailed_report(self, user_data: PhysicalTestInput, result: EvaluationResult):
+    def _generate_detailed_report(self, user_data: PhysicalTestInput, result: EvaluationResult,
+                                  cancel_token: Optional[CancelToken] = None,
+                                  query_memo: Optional[QueryMemo] = None,
+                                  retrieval: Optional[Tuple] = None):
         """生成详细分析报告（支持流式生成）"""
         try:
-            # 准备专业知识
-            self.specialized_knowledge_str = self._prepare_specialized_knowledge(user_data, result)
+            # 准备专业知识候选片段（推测启动模式下只等待延迟预算内返回的来源）
+            if retrieval is None:
+                retrieval = self._start_knowledge_retrieval(user_data, result, query_memo)
+            budget = self.report_context_latency_budget if self.report_speculative_start else None
+            with span("analyze.retrieval"):
+                knowledge_snippets, result.retrieval_report = self._gather_knowledge_snippets(retrieval, budget)
             
-            # 构建提示词
-            prompt = self._prepare_report_prompt(user_data, result)
+            # 构建提示词（按token预算裁剪专业知识）
+            with span("analyze.prompt_build"):
+                system_prompt, prompt = self._prepare_report_messages(user_data, result, knowledge_snippets)
             
             # 获取总训练周数
             total_weeks = result.exercise_prescription.total_weeks
@@ -334,14 +479,18 @@ class IntegratedFitnessRAGService:
             
             # 调用大模型流式生成报告
             logger.info(f"调用大模型流式生成包含{total_weeks}周分阶段计划的详细报告...")
-            return self.llm_client.stream_text(prompt)
+            result.stream_stats = StreamStats()
+            report_stream = self.llm_client.stream_text(prompt, system_prompt=system_prompt,
+                                                        stream_stats=result.stream_stats, cancel_token=cancel_token)
+            if self.report_output_mode == "hybrid":
+                # 剥离报告末尾的结构化计划块，阶段闭合后即写入运动处方
+                return iter_structured_report(report_stream, result.exercise_prescription)
+            return report_stream
             
         except Exception as e:
             logger.error(f"报告生成失败: {str(e)}")
-            # 返回一个生成器，生成错误信息
-            def error_generator():
-                yield "运动处方报告生成失败，请稍后重试。"
-            return error_generator()
+            # 返回错误信息作为报告（标记为失败，不被缓存回放）
+            return FailedReport("运动处方报告生成失败，请稍后重试。")
     
     def _load_exercise_plan_library(self):
         """加载动作方案库到RAG系统"""
@@ -378,6 +527,7 @@ class IntegratedFitnessRAGService:
                 # 添加到RAG系统
                 if documents:
                     self.rag_pipeline.add_documents(documents)
+                    self.knowledge_cache.clear()
                     print(f"成功加载{len(documents)}条动作方案到RAG系统")
                 else:
                     print("动作方案库中没有有效数据")
@@ -388,34 +538,50 @@ class IntegratedFitnessRAGService:
     
     def _prepare_specialized_knowledge(self, user_data: PhysicalTestInput, result: EvaluationResult) -> str:
         """准备专业知识参考"""
-        knowledge_parts = []
+        return self._render_knowledge(self._collect_knowledge_snippets(user_data, result))
+    
+    def _collect_knowledge_snippets(self, user_data: PhysicalTestInput, result: EvaluationResult,
+                                    query_memo: Optional[QueryMemo] = None) -> List[ContextSnippet]:
+        """收集知识图谱和RAG检索到的候选上下文片段（带相关度分数）"""
+        return self._gather_knowledge_snippets(self._start_knowledge_retrieval(user_data, result, query_memo))[0]
+    
+    def _start_knowledge_retrieval(self, user_data: PhysicalTestInput, result: EvaluationResult,
+                                   query_memo: Optional[QueryMemo] = None) -> Tuple[List[Tuple[str, str, str]], List[Future], float]:
+        """发起各路知识检索，返回(任务列表, futures, 开始时间)
+
+        各路检索相互独立，在retrieval池中并行执行；启用跨请求缓存时命中的直接完成，其余完成后写入缓存。
+        """
+        def kg_summary(query: str) -> Tuple[str, float]:
+            if query_memo is None:
+                return self.kg_manager.generate_scored_summary(query)
+            return query_memo.get_or_compute(("kg", query), lambda: self.kg_manager.generate_scored_summary(query))
+        
+        def rag_search(query: str) -> List[Dict[str, Any]]:
+            if query_memo is None:
+                return self.rag_pipeline.search(query)
+            return query_memo.get_or_compute(("rag", query), lambda: self.rag_pipeline.search(query))
+        
+        # 检索任务：(分区, 查询, 来源类型)，顺序即合并顺序
+        tasks = []
         
         # 1. 从知识图谱获取相关知识
         query = f"{user_data.gender.value}{user_data.age}岁{result.overall_rating}体质运动建议"
-        kg_knowledge = self.kg_manager.generate_knowledge_summary(query)
-        if kg_knowledge:
-            knowledge_parts.append(kg_knowledge)
+        tasks.append(("profile", query, "kg"))
         
         # 2. 添加运动风险相关知识
         if user_data.exercise_risk_level:
             risk_query = f"{user_data.exercise_risk_level}风险等级运动注意事项"
-            risk_knowledge = self.kg_manager.generate_knowledge_summary(risk_query)
-            if risk_knowledge:
-                knowledge_parts.append(risk_knowledge)
+            tasks.append(("risk", risk_query, "kg"))
         
         # 3. 添加疾病相关知识
         for disease in user_data.diseases:
             disease_query = f"{disease}患者运动建议"
-            disease_knowledge = self.kg_manager.generate_knowledge_summary(disease_query)
-            if disease_knowledge:
-                knowledge_parts.append(disease_knowledge)
+            tasks.append(("disease", disease_query, "kg"))
         
         # 4. 添加运动偏好相关知识
         for preference in user_data.exercise_preferences:
             pref_query = f"{preference}运动技巧和注意事项"
-            pref_knowledge = self.kg_manager.generate_knowledge_summary(pref_query)
-            if pref_knowledge:
-                knowledge_parts.append(pref_knowledge)
+            tasks.append(("preference", pref_query, "kg"))
         
         # 5. 从RAG系统检索相关动作方案
         # 添加是否使用器械信息到查询中
@@ -427,183 +593,117 @@ class IntegratedFitnessRAGService:
                 equipment_info = "无器械徒手 "
                 
         rag_query = f"{user_data.gender.value}{user_data.age}岁{result.overall_rating}体质{equipment_info}{user_data.exercise_preferences}运动方案"
-        rag_results = self.rag_pipeline.search(rag_query)
+        tasks.append(("rag", rag_query, "rag"))
+        
+        started = time.monotonic()
+        futures = []
+        use_cache = self.report_speculative_start or self.knowledge_cache_enabled
+        for _, query, source in tasks:
+            hit, value = self.knowledge_cache.get((source, query)) if use_cache else (False, None)
+            if hit:
+                future = Future()
+                future.set_result(value)
+                future.cached = True
+            else:
+                # 子阶段的span挂在当前分析请求的trace下
+                future = self.executors.retrieval.submit(
+                    in_current_context(kg_summary if source == "kg" else rag_search), query)
+                future.cached = False
+                if use_cache:
+                    # 超时被跳过的结果也写入缓存，之后的请求可以直接使用
+                    future.add_done_callback(lambda f, key=(source, query): (
+                        self.knowledge_cache.put(key, f.result()) if not f.cancelled() and f.exception() is None else None))
+            futures.append(future)
+        return tasks, futures, started
+    
+    def _gather_knowledge_snippets(self, retrieval: Tuple[List[Tuple[str, str, str]], List[Future], float],
+                                   latency_budget: Optional[float] = None) -> Tuple[List[ContextSnippet], Dict[str, Any]]:
+        """按固定顺序合并检索结果，返回(片段, 取舍报告)；超过时限（及latency_budget）或失败的来源被跳过，每个来源的取舍记录在日志中"""
+        tasks, futures, started = retrieval
+        snippets = []
+        decisions = []
+        
+        def add(section: str, text: str, score: float):
+            if text:
+                snippets.append(ContextSnippet(section, text, score, order=len(snippets)))
+        
+        for (section, query, _), future in zip(tasks, futures):
+            # 时限从检索开始计时，总耗时取决于最慢的来源而不是各来源之和
+            timeout = self.retrieval_timeouts.get(section, 5.0)
+            if latency_budget is not None:
+                timeout = min(timeout, latency_budget)
+            try:
+                value = future.result(timeout=max(0.0, started + timeout - time.monotonic()))
+            except FutureTimeoutError:
+                # 推测启动模式下不取消：检索继续在后台完成并写入缓存
+                if latency_budget is None:
+                    future.cancel()
+                decisions.append({"section": section, "query": query, "decision": "late"})
+                logger.warning(f"知识检索超时，跳过该来源: {section}（{query}）")
+                continue
+            except Exception as e:
+                decisions.append({"section": section, "query": query, "decision": "failed", "error": str(e)})
+                logger.warning(f"知识检索失败，跳过该来源: {section}（{query}）: {str(e)}")
+                continue
+            decisions.append({"section": section, "query": query, "decision": "cache" if future.cached else "fresh"})
+            if section == "rag":
+                for doc in value[:3]:  # 只取前3个最相关的结果
+                    add("rag", doc.get('content', ''), doc.get('relevance_score', 0.0))
+            else:
+                add(section, *value)
+        
+        report = {
+            "sources": len(tasks),
+            "seconds": round(time.monotonic() - started, 3),
+            "latency_budget": latency_budget,
+            "decisions": decisions,
+            "dropped": [d for d in decisions if d["decision"] in ("late", "failed")]
+        }
+        # 供质量复核：每次报告使用了哪些上下文、哪些来源因超时被跳过
+        logger.info(f"报告上下文决策: {json.dumps(report, ensure_ascii=False)}")
+        return snippets, report
+    
+    def _render_knowledge(self, snippets: List[ContextSnippet]) -> str:
+        """将上下文片段拼接为专业知识参考文本"""
+        knowledge_parts = [snippet.text for snippet in snippets if snippet.section != "rag"]
         
-        if rag_results:
+        rag_snippets = [snippet for snippet in snippets if snippet.section == "rag"]
+        if rag_snippets:
             # 构建RAG检索结果文本
             rag_knowledge = "# RAG检索到的相关动作方案\n\n"
-            for i, result in enumerate(rag_results[:3], 1):  # 只取前3个最相关的结果
+            for i, snippet in enumerate(rag_snippets, 1):
                 rag_knowledge += f"## 方案 {i}\n"
-                rag_knowledge += result.get('content', '') + "\n\n"
+                rag_knowledge += snippet.text + "\n\n"
             
             knowledge_parts.append(rag_knowledge)
         
         return "\n\n".join(knowledge_parts)
     
-    def _prepare_report_prompt(self, user_data: PhysicalTestInput, result: EvaluationResult) -> str:
-        """准备报告生成的提示词"""
-        # 获取总训练周数和阶段信息
-        total_weeks = result.exercise_prescription.total_weeks
-        prescriptions = [result.exercise_prescription]
-        
-        # 指标中文名称映射，确保与Excel评价标准中的指标名称一致
-        metric_names = {
-            "bmi": "BMI",
-            "body_fat_rate": "体脂率",
-            "vital_capacity": "肺活量",
-            "max_oxygen_uptake": "最大摄氧量相对值",
-            "sit_and_reach": "坐位体前屈",
-            "single_leg_stand": "闭眼单脚站立",
-            "reaction_time": "选择反应时间",
-            "grip_strength": "握力",
-            "sit_ups_per_minute": "一分钟仰卧起坐",
-            "push_ups": "俯卧撑（男）/跪卧撑（女）",
-            "vertical_jump": "纵跳（仅20-49岁，50-79岁无）",
-            "high_knees_2min": "2分钟原地高抬腿",
-            "sit_to_stand_30s": "30秒坐站"
-        }
-        
-        # 获取当前系统时间
-        current_time = datetime.datetime.now().strftime("%Y年%m月%d日 %H:%M:%S")
-        
-        # 生成最终的提示词
-        prompt = """
-【任务】
-请作为一名专业的运动处方专家，根据用户的体质测试数据和评估结果，生成一份个性化的运动处方报告。
-
-【报告生成日期】
-%s
-
-【用户信息】
-" % current_time
-"""
-        prompt += "- 姓名：%s\n" % user_data.name
-        prompt += "- 年龄：%d岁\n" % user_data.age
-        prompt += "- 性别：%s\n" % user_data.gender.value
-        prompt += "- 运动风险等级：%s\n" % (user_data.exercise_risk_level or "未填写")
-        prompt += "- 疾病：%s\n" % ('、'.join(user_data.diseases) if user_data.diseases else "无")
-        prompt += "- 运动偏好：%s\n" % ('、'.join(user_data.exercise_preferences) if user_data.exercise_preferences else "未填写")
-        # 添加是否使用器械信息
-        if hasattr(user_data, 'uses_equipment'):
-            equipment_status = "是" if user_data.uses_equipment else "否"
-            prompt += "- 是否使用器械：%s\n" % equipment_status
-        
-        prompt += """
-
-【体质测试数据】
-"""
-        
-        # 添加体质测试数据（不包含评价等级，避免干扰大模型）
-        for metric, value in user_data.to_dict().items():
-            if metric not in ['age', 'gender', 'name', 'diseases', 'exercise_preferences', 'exercise_risk_level']:
-                unit = self.metric_units.get(metric, '')
-                prompt += "- %s：%s %s\n" % (metric_names.get(metric, metric), value, unit)
-        
-        # 添加评估结果和其他内容
-        prompt += """
-## 评估结果
-"""
-        prompt += "- 综合得分: %.1f分\n" % result.overall_score
-        prompt += "- 综合评级: %s\n" % result.overall_rating
-        
-        # 添加各项指标的详细得分和评级信息（用于生成表格）
-        if result.individual_scores and result.individual_ratings:
-            prompt += "\n## 各项指标详细评分\n"
-            for metric in result.individual_scores:
-                if metric in result.individual_ratings:
-                    chinese_name = metric_names.get(metric, metric)
-                    score = result.individual_scores[metric]
-                    rating = result.individual_ratings[metric]
-                    # 特别处理BMI和体脂率的评级词汇
-                    if metric in ['bmi', 'body_fat_rate']:
-                        # 确保使用正确的评级词汇：偏瘦，正常，超重，肥胖
-                        prompt += "- %s：%s分，%s\n" % (chinese_name, score, rating)
-                    else:
-                        prompt += "- %s：%s分，%s\n" % (chinese_name, score, rating)
-            
-            # 添加体质测试总评信息
-            prompt += "- 体质测试总评：%.1f分，%s\n" % (result.overall_score, result.overall_rating)
-        
-        prompt += """
-
-## 运动处方概要
-"""
-        prompt += "总训练周期: %d周\n" % total_weeks
-        
-        prompt += """
-
-## 报告内容要求
-1. 体质分析总结：简要分析用户的体质状况、优势和需要改善的方面。
-2. 各项指标评价：严格按照Excel评价标准文件中的指标名称，以表格形式展示所有测试指标的得分和评价等级，表头为"指标、得分、评价等级"，按示例格式对齐显示。请严格遵守以下要求：
-   - 不再包含输入的数值，只显示运算后的评分（如"60分"、"90分"）
-   - BMI和体脂率的评价等级必须使用：偏瘦，正常，超重，肥胖
-   - 在表格的最后一行增加"体质测试总评"，内容为综合得分和综合评级
-   - 确保显示所有在individual_scores和individual_ratings中存在的指标，包括BMI、体脂率、肺活量、坐位体前屈、闭眼单脚站立、选择反应时间、握力、最大摄氧量相对值、一分钟仰卧起坐、俯卧撑（男）/跪卧撑（女）、纵跳（仅20-49岁）等。
-3. 运动处方目标：根据综合评级和个人体质情况，设定明确、可衡量的运动处方目标。
-4. 分阶段计划（重点）：
-   - 有氧运动强度必须使用储备心率HRR（Heart Rate Reserve）表示
-   - 抗阻运动强度必须使用1-RM百分比（1-Repetition Maximum percentage）设定
-   - 根据用户是否使用器械的情况调整运动内容：如果用户可以使用器械，优先推荐健身房器械动作；如果用户无法使用器械，仅推荐无器械的徒手动作
-"""
-        prompt += "   - 阶段1（%s）：适合用户当前水平的低强度训练，重点是建立运动习惯和正确姿势\n" % prescriptions[0].phases[0].weeks
-        prompt += "   - 阶段2（%s）：中等强度训练，增加运动量和强度\n" % prescriptions[0].phases[1].weeks
-        prompt += "   - 阶段3（%s）：中高强度训练，优化运动表现\n" % prescriptions[0].phases[2].weeks
-        
-        prompt += """
-   每个阶段必须包含：阶段目标、每周训练安排表（具体到周一，周二，周三，周四，周五，周六，周日的运动类型、运动时长、运动强度（需要输出有氧运动强度HRR的计算过程）、运动内容（不要出现例如，示例等，直接给出需要做的训练内容即可）），注意事项。
-5. 运动禁忌：明确不适合的运动类型或注意事项（特别关注疾病和风险等级），严格遵循安全第一运动原则。
-6. 进度监测：如何评估每个阶段的训练效果，关键指标是什么。
-7. 营养建议：配合运动的基础营养原则（简要）。
-
-## 格式要求
-- 输出自然流畅的中文文本，使用标题、子标题和项目符号使结构清晰。
-- 训练计划要具体到"每周X次、每次X分钟、具体动作、运动强度描述"，确保用户方便理解和可直接执行。
-- 阶段计划需体现循序渐进的原则，难度和量逐步提升。
-- 所有建议需考虑用户的年龄特点、疾病状况、运动风险等级和体质综合评级%s
-- 强制不要输出报告生成日期。
-- 请在运动推荐最后的位置强制输出"本运动推荐仅供参考，请您务必在专业人士指导下进行运动"
-
-## 专业知识参考（包含知识图谱信息）
-%s""" % (result.overall_rating, self.specialized_knowledge_str)
-        
-        return prompt
+    def _fit_knowledge_to_budget(self, base_prompt: str, snippets: List[ContextSnippet]) -> Tuple[str, Dict[str, Any]]:
+        """在输入token预算内按相关度挑选知识片段，返回(专业知识文本, 各分区token用量)"""
+        base_tokens = self.token_counter.count(base_prompt)
+        budget = self.prompt_budgeter_budget - base_tokens
+        selected, report = self.prompt_budgeter.fit(snippets, budget)
+        report["base_prompt_tokens"] = base_tokens
+        
+        section_usage = "，".join(f"{name}: {stats['tokens']}/{stats['candidate_tokens']}"
+                                 for name, stats in report["sections"].items())
+        logger.info(f"提示词token预算: 基础部分 {base_tokens}，知识参考 {report['used']}/{max(budget, 0)}（{section_usage}）")
+        return self._render_knowledge(selected), report
     
-    def _prepare_prescription_prompt(self, user_data: PhysicalTestInput, result: EvaluationResult, phase1_weeks: int, phase2_weeks: int, phase3_weeks: int) -> str:
-        """准备运动处方生成的提示词"""
-        # 获取薄弱环节
-        weak_areas = []
-        for metric, rating in result.individual_ratings.items():
-            if rating in ["较差", "差", "需要改善"]:
-                weak_areas.append(metric)
-        
-        weak_areas_str = "、".join(weak_areas) if weak_areas else "各方面均衡"
-        
-        prompt = f"""作为一名专业的运动处方专家，请根据以下用户信息生成个性化的运动处方：
-
-用户信息：
-- 年龄：{user_data.age}岁
-- 性别：{user_data.gender.value}
-- 综合评级：{result.overall_rating}
-- 薄弱环节：{weak_areas_str}
-- 运动偏好：{'、'.join(user_data.exercise_preferences) if user_data.exercise_preferences else "无特殊偏好"}
-- 运动风险等级：{user_data.exercise_risk_level or "未填写"}
-- 疾病：{'、'.join(user_data.diseases) if user_data.diseases else "无"}
-
-训练周期：共{phase1_weeks + phase2_weeks + phase3_weeks}周，分为3个阶段
-- 阶段1：{phase1_weeks}周
-- 阶段2：{phase2_weeks}周
-- 阶段3：{phase3_weeks}周
-
-请为每个阶段生成具体的训练计划，包括：
-1. 阶段目标
-2. 每周训练次数和总时长
-3. 主要运动类型和强度（有氧运动强度必须使用储备心率HRR表示，抗阻运动强度必须使用1-RM百分比设定）
-4. 注意事项
-
-请确保计划安全、有效，并考虑用户的年龄、性别、健康状况和运动风险等级。
-"""
-        
-        return prompt
+    def _prepare_report_messages(self, user_data: PhysicalTestInput, result: EvaluationResult,
+                                 knowledge_snippets: Optional[List[ContextSnippet]] = None) -> Tuple[str, str]:
+        """准备报告生成的(system, user)消息（传入知识片段时按token预算裁剪专业知识参考，用量记录在result上）"""
+        # 固定说明放在system消息，用户数据和专业知识放在user消息，使不同请求共享同一请求前缀
+        system_prompt, user_prompt = self.report_prompt_builder.messages(
+            user_data, result, plan_block=self.report_output_mode == "hybrid")
+        
+        # 专业知识只属于本次请求，不经过服务实例的共享属性
+        knowledge = ""
+        if knowledge_snippets is not None:
+            knowledge, result.prompt_budget_report = self._fit_knowledge_to_budget(
+                system_prompt + user_prompt, knowledge_snippets)
+        return system_prompt, user_prompt + knowledge
     
     # 以下是各项指标的评估方法
     def _evaluate_bmi(self, bmi: float) -> Tuple[float, str]:
@@ -0,0 +1,130 @@
+import asyncio
+import functools
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, Optional
+
+_SENTINEL = object()
+
+
+class ServiceExecutors:
+    """服务层的显式线程池：cpu池（按核数）执行模型推理、检索和评分，io池执行大模型调用等阻塞I/O，
+    retrieval池并行执行单次分析内的各路知识检索（与cpu池分开，避免cpu池任务等待同池子任务而死锁）"""
+    def __init__(self, cpu_workers: Optional[int] = None, io_workers: int = 32, retrieval_workers: int = 16):
+        self.cpu_workers = cpu_workers or os.cpu_count() or 1
+        self.io_workers = io_workers
+        self.retrieval_workers = retrieval_workers
+        self.cpu = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="service-cpu")
+        self.io = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="service-io")
+        self.retrieval = ThreadPoolExecutor(max_workers=self.retrieval_workers, thread_name_prefix="service-retrieval")
+
+    async def run_cpu(self, fn: Callable, *args, **kwargs) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.cpu, functools.partial(fn, *args, **kwargs))
+
+    async def run_io(self, fn: Callable, *args, **kwargs) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.io, functools.partial(fn, *args, **kwargs))
+
+    async def iterate_io(self, iterable: Iterable) -> AsyncIterator:
+        """在io池中逐个拉取同步迭代器（如流式报告生成器）的元素"""
+        iterator = iter(iterable)
+        while True:
+            item = await self.run_io(next, iterator, _SENTINEL)
+            if item is _SENTINEL:
+                break
+            yield item
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各线程池的排队任务数"""
+        return {
+            "cpu": {"workers": self.cpu_workers, "queue_depth": self.cpu._work_queue.qsize()},
+            "io": {"workers": self.io_workers, "queue_depth": self.io._work_queue.qsize()},
+            "retrieval": {"workers": self.retrieval_workers, "queue_depth": self.retrieval._work_queue.qsize()}
+        }
+
+    def shutdown(self, wait: bool = True):
+        self.cpu.shutdown(wait=wait)
+        self.io.shutdown(wait=wait)
+        self.retrieval.shutdown(wait=wait)
+
+
+class AdmissionRejected(Exception):
+    """超出接口容量，请求被拒绝"""
+
+
+class AdmissionLimiter:
+    """单个接口的准入控制：最多limit个请求同时执行，最多max_queue个请求排队，队列已满或排队超过queue_timeout秒时拒绝
+
+    只在事件循环线程中使用；释放名额时直接转交给最早排队的请求。
+    """
+    def __init__(self, name: str, limit: int, max_queue: int = 0, queue_timeout: float = 10.0):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        raise AdmissionRejected(f"{self.name}接口{reason}（{self.in_flight}个执行中，{self.waiting}个排队中）")
+
+    async def acquire(self):
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._reject("繁忙")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject("排队超时")
+        except asyncio.CancelledError:
+            # 名额已转交但请求被取消（客户端断开），归还名额
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def permit(self) -> "AdmissionPermit":
+        return AdmissionPermit(self)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "in_flight": self.in_flight, "queue_depth": self.waiting,
+                "max_queue": self.max_queue, "rejected": self.rejected}
+
+
+class AdmissionPermit:
+    """已获得的准入名额，release可重复调用（流式响应在多个收尾路径上释放）"""
+    def __init__(self, limiter: AdmissionLimiter):
+        self.limiter = limiter
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.limiter.release()
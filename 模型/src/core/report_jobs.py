@@ -0,0 +1,328 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from typing import Any, Dict, Generator, Iterator, List, Optional, Tuple
+
+from src.models.models import PhysicalTestInput
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFullError(Exception):
+    """等待中的任务数已达上限"""
+
+
+class CallbackNotAllowedError(Exception):
+    """callback_url不是http(s)地址或主机不在允许列表中"""
+
+
+def check_callback_url(url: str, allowed_hosts) -> None:
+    """只允许回调http(s)且主机在allowed_hosts中的地址（防止借回调访问内网服务），否则抛出CallbackNotAllowedError"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise CallbackNotAllowedError("callback_url必须是http(s)地址")
+    if parts.hostname.lower() not in {host.lower() for host in allowed_hosts or ()}:
+        raise CallbackNotAllowedError(f"callback_url主机不在允许列表中: {parts.hostname}")
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid or pid == os.getpid():
+        # 本进程刚启动，库中属于同一pid的任务只可能来自已退出的旧进程
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """报告任务结果存储（SQLite），生成中的部分报告定期落盘，服务重启后仍可查询"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    _JSON_FIELDS = ("request", "scores", "plan_data", "stats")
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS report_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    request TEXT,
+                    callback_url TEXT,
+                    scores TEXT,
+                    report TEXT NOT NULL DEFAULT '',
+                    plan_data TEXT,
+                    stats TEXT,
+                    error TEXT,
+                    worker_pid INTEGER
+                )
+            """)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(report_jobs)")}
+            if "worker_pid" not in columns:
+                self._conn.execute("ALTER TABLE report_jobs ADD COLUMN worker_pid INTEGER")
+
+    def create(self, request: Dict[str, Any], callback_url: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO report_jobs (id, status, created_at, request, callback_url, worker_pid) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, self.QUEUED, time.time(), json.dumps(request, ensure_ascii=False), callback_url, os.getpid())
+            )
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        """更新任务字段，字典类字段自动序列化为JSON"""
+        if not fields:
+            return
+        values = []
+        for name, value in fields.items():
+            if name in self._JSON_FIELDS and value is not None:
+                value = json.dumps(value, ensure_ascii=False)
+            values.append(value)
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE report_jobs SET {assignments} WHERE id = ?", (*values, job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM report_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for name in self._JSON_FIELDS:
+            if job[name] is not None:
+                job[name] = json.loads(job[name])
+        return job
+
+    def fail_interrupted(self) -> int:
+        """把所属进程已退出的未完成任务标记为失败（多worker共享同一数据库时不影响其他存活进程的任务），返回受影响的任务数"""
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT id, worker_pid FROM report_jobs WHERE status IN (?, ?)",
+                                      (self.QUEUED, self.RUNNING)).fetchall()
+            orphaned = [row["id"] for row in rows if not _process_alive(row["worker_pid"])]
+            self._conn.executemany(
+                "UPDATE report_jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                [(self.FAILED, "服务重启，任务中断", time.time(), job_id) for job_id in orphaned]
+            )
+        return len(orphaned)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _LiveJob:
+    """生成中任务的内存状态，供/jobs/{id}/stream实时订阅"""
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.scores: Optional[Dict[str, Any]] = None
+        self.done = False
+        self.condition = threading.Condition()
+
+    def append(self, chunk: str):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self):
+        with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+
+class ReportJobQueue:
+    """报告生成任务队列：提交后立即返回任务ID，由有界线程池在后台生成报告并写入JobStore"""
+    def __init__(self, service, store: JobStore, max_workers: int = 4, max_pending: int = 100,
+                 flush_interval: float = 1.0, webhook_timeout: float = 10.0, callback_hosts=()):
+        self.service = service
+        self.store = store
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.webhook_timeout = webhook_timeout
+        self.callback_hosts = tuple(callback_hosts or ())
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-job")
+        self._live: Dict[str, _LiveJob] = {}
+        self._lock = threading.Lock()
+        interrupted = store.fail_interrupted()
+        if interrupted:
+            logger.warning(f"{interrupted}个未完成的报告任务因服务重启被标记为失败")
+
+    def pending_count(self) -> int:
+        """排队中和生成中的任务数"""
+        with self._lock:
+            return len(self._live)
+
+    def submit(self, user_data: PhysicalTestInput, request: Dict[str, Any],
+               callback_url: Optional[str] = None) -> str:
+        """提交报告生成任务，返回任务ID；等待中的任务过多时抛出JobQueueFullError，回调地址不被允许时抛出CallbackNotAllowedError"""
+        if callback_url:
+            check_callback_url(callback_url, self.callback_hosts)
+        with self._lock:
+            if len(self._live) >= self.max_pending:
+                raise JobQueueFullError(f"报告任务队列已满（{self.max_pending}）")
+            job_id = self.store.create(request, callback_url)
+            self._live[job_id] = _LiveJob()
+        self.executor.submit(self._run, job_id, user_data, callback_url)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务状态、进度和结果，生成中的任务返回最新的部分报告"""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            live = self._live.get(job_id)
+        if live is not None and not live.done:
+            with live.condition:
+                job["report"] = "".join(live.chunks)
+        job["progress"] = {"chars": len(job["report"] or "")}
+        return job
+
+    def subscribe(self, job_id: str, poll_interval: float = 1.0) -> Iterator[Tuple[str, Any]]:
+        """订阅任务输出：依次产出("scores", 得分)、("delta", 文本)…，任务结束后产出("done", 任务)
+
+        本进程生成中的任务实时推送；其他worker进程的任务（共享同一数据库）轮询存储，按落盘的部分报告推送增量。
+        """
+        with self._lock:
+            live = self._live.get(job_id)
+        if live is None:
+            job = yield from self._follow_store(job_id, poll_interval)
+            if job is not None:
+                yield "done", job
+            return
+        offset = 0
+        scores_sent = False
+        while True:
+            with live.condition:
+                while not live.done and offset == len(live.chunks) and (scores_sent or live.scores is None):
+                    # 定时醒来，使调用方有机会检测客户端断开
+                    if not live.condition.wait(poll_interval):
+                        break
+                chunks = live.chunks[offset:]
+                offset += len(chunks)
+                done = live.done
+                scores = live.scores
+            if scores is not None and not scores_sent:
+                scores_sent = True
+                yield "scores", scores
+            for chunk in chunks:
+                yield "delta", chunk
+            if done:
+                break
+            if not chunks:
+                yield "heartbeat", None
+
+        job = self.store.get(job_id)
+        if job is not None:
+            yield "done", job
+
+    def _follow_store(self, job_id: str, poll_interval: float
+                      ) -> Generator[Tuple[str, Any], None, Optional[Dict[str, Any]]]:
+        """回放存储中的任务输出，未结束时按poll_interval轮询，直到任务结束或所属进程已退出；返回最终的任务记录"""
+        job = self.store.get(job_id)
+        offset = 0
+        scores_sent = False
+        while job is not None:
+            if job["scores"] is not None and not scores_sent:
+                scores_sent = True
+                yield "scores", job["scores"]
+            report = job["report"] or ""
+            grew = len(report) > offset
+            if grew:
+                yield "delta", report[offset:]
+                offset = len(report)
+            if job["status"] in (JobStore.SUCCEEDED, JobStore.FAILED) or not _process_alive(job["worker_pid"]):
+                break
+            if not grew:
+                yield "heartbeat", None
+            time.sleep(poll_interval)
+            job = self.store.get(job_id)
+        return job
+
+    def _run(self, job_id: str, user_data: PhysicalTestInput, callback_url: Optional[str]):
+        live = self._live[job_id]
+        self.store.update(job_id, status=JobStore.RUNNING, started_at=time.time())
+        try:
+            result = self.service.analyze_physical_test(user_data)
+            scores = {
+                "overall_score": result.overall_score,
+                "overall_rating": result.overall_rating,
+                "individual_scores": result.scores_dict(),
+                "individual_ratings": dict(result.individual_ratings)
+            }
+            with live.condition:
+                live.scores = scores
+                live.condition.notify_all()
+            self.store.update(job_id, scores=scores)
+
+            last_flush = time.monotonic()
+            for chunk in result.basic_analysis or []:
+                live.append(chunk)
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    # 定期持久化部分报告
+                    with live.condition:
+                        partial = "".join(live.chunks)
+                    self.store.update(job_id, report=partial)
+                    last_flush = time.monotonic()
+
+            prescription = result.exercise_prescription
+            stats = result.stream_stats
+            self.store.update(
+                job_id,
+                status=JobStore.SUCCEEDED,
+                report="".join(live.chunks),
+                plan_data=prescription.to_plan_data() if prescription else None,
+                stats=stats.to_dict() if stats else None,
+                finished_at=time.time()
+            )
+        except Exception as e:
+            logger.error(f"报告任务{job_id}失败: {str(e)}")
+            self.store.update(job_id, status=JobStore.FAILED, report="".join(live.chunks),
+                              error=str(e), finished_at=time.time())
+        finally:
+            live.finish()
+            with self._lock:
+                self._live.pop(job_id, None)
+
+        if callback_url:
+            self._notify(job_id, callback_url)
+
+    def _notify(self, job_id: str, callback_url: str):
+        """任务结束后回调webhook，失败只记录日志"""
+        import requests
+        job = self.store.get(job_id)
+        try:
+            check_callback_url(callback_url, self.callback_hosts)
+            # 不跟随重定向，避免允许的主机把回调转到其他地址
+            response = requests.post(callback_url, json={"job_id": job_id, "status": job["status"]},
+                                     timeout=self.webhook_timeout, allow_redirects=False)
+            if response.status_code >= 400:
+                logger.warning(f"报告任务{job_id}回调失败 (状态码: {response.status_code})")
+        except Exception as e:
+            logger.warning(f"报告任务{job_id}回调失败: {str(e)}")
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
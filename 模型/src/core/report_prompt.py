@@ -0,0 +1,209 @@
+import datetime
+import threading
+from typing import Dict, Optional, Tuple
+
+from src.core.structured_report import build_plan_output_instructions
+from src.llm.prompt_templates import PromptTemplate
+from src.models.models import METRIC_KEYS, EvaluationResult, ExercisePrescription, PhysicalTestInput
+
+# 指标中文名称映射，确保与Excel评价标准中的指标名称一致
+METRIC_DISPLAY_NAMES = {
+    "bmi": "BMI",
+    "body_fat_rate": "体脂率",
+    "vital_capacity": "肺活量",
+    "max_oxygen_uptake": "最大摄氧量相对值",
+    "sit_and_reach": "坐位体前屈",
+    "single_leg_stand": "闭眼单脚站立",
+    "reaction_time": "选择反应时间",
+    "grip_strength": "握力",
+    "sit_ups_per_minute": "一分钟仰卧起坐",
+    "push_ups": "俯卧撑（男）/跪卧撑（女）",
+    "vertical_jump": "纵跳（仅20-49岁，50-79岁无）",
+    "high_knees_2min": "2分钟原地高抬腿",
+    "sit_to_stand_30s": "30秒坐站"
+}
+
+# 与用户无关的任务说明和报告要求，作为system消息放在请求最前面，使各请求共享同一前缀以命中服务端前缀缓存
+REPORT_INSTRUCTIONS = """【任务】
+请作为一名专业的运动处方专家，根据用户的体质测试数据和评估结果，生成一份个性化的运动处方报告。用户的具体数据在用户消息的【用户信息】【体质测试数据】【评估结果】【运动处方概要】中给出。
+
+## 报告内容要求
+1. 体质分析总结：简要分析用户的体质状况、优势和需要改善的方面。
+2. 各项指标评价：严格按照Excel评价标准文件中的指标名称，以表格形式展示所有测试指标的得分和评价等级，表头为"指标、得分、评价等级"，按示例格式对齐显示。请严格遵守以下要求：
+   - 不再包含输入的数值，只显示运算后的评分（如"60分"、"90分"）
+   - BMI和体脂率的评价等级必须使用：偏瘦，正常，超重，肥胖
+   - 在表格的最后一行增加"体质测试总评"，内容为综合得分和综合评级
+   - 确保显示所有在individual_scores和individual_ratings中存在的指标，包括BMI、体脂率、肺活量、坐位体前屈、闭眼单脚站立、选择反应时间、握力、最大摄氧量相对值、一分钟仰卧起坐、俯卧撑（男）/跪卧撑（女）、纵跳（仅20-49岁）等。
+3. 运动处方目标：根据综合评级和个人体质情况，设定明确、可衡量的运动处方目标。
+4. 分阶段计划（重点）：
+   - 有氧运动强度必须使用储备心率HRR（Heart Rate Reserve）表示
+   - 抗阻运动强度必须使用1-RM百分比（1-Repetition Maximum percentage）设定
+   - 根据用户是否使用器械的情况调整运动内容：如果用户可以使用器械，优先推荐健身房器械动作；如果用户无法使用器械，仅推荐无器械的徒手动作
+   - 各阶段的周次见运动处方概要
+   - 阶段1：适合用户当前水平的低强度训练，重点是建立运动习惯和正确姿势
+   - 阶段2：中等强度训练，增加运动量和强度
+   - 阶段3：中高强度训练，优化运动表现
+   每个阶段必须包含：阶段目标、每周训练安排表（具体到周一，周二，周三，周四，周五，周六，周日的运动类型、运动时长、运动强度（需要输出有氧运动强度HRR的计算过程）、运动内容（不要出现例如，示例等，直接给出需要做的训练内容即可）），注意事项。
+5. 运动禁忌：明确不适合的运动类型或注意事项（特别关注疾病和风险等级），严格遵循安全第一运动原则。
+6. 进度监测：如何评估每个阶段的训练效果，关键指标是什么。
+7. 营养建议：配合运动的基础营养原则（简要）。
+
+## 格式要求
+- 输出自然流畅的中文文本，使用标题、子标题和项目符号使结构清晰。
+- 训练计划要具体到"每周X次、每次X分钟、具体动作、运动强度描述"，确保用户方便理解和可直接执行。
+- 阶段计划需体现循序渐进的原则，难度和量逐步提升。
+- 所有建议需考虑用户的年龄特点、疾病状况、运动风险等级和评估结果中的体质综合评级
+- 强制不要输出报告生成日期。
+- 请在运动推荐最后的位置强制输出"本运动推荐仅供参考，请您务必在专业人士指导下进行运动"
+"""
+
+# 每个用户不同的部分（用户消息）
+REPORT_USER_TEMPLATE = PromptTemplate("""【报告生成日期】
+{current_time}
+
+【用户信息】
+- 姓名：{name}
+- 年龄：{age}岁
+- 性别：{gender}
+- 运动风险等级：{exercise_risk_level}
+- 疾病：{diseases}
+- 运动偏好：{exercise_preferences}
+- 是否使用器械：{uses_equipment}
+
+【体质测试数据】
+{test_data}
+## 评估结果
+- 综合得分: {overall_score:.1f}分
+- 综合评级: {overall_rating}
+{detail_scores}
+## 运动处方概要
+总训练周期: {total_weeks}周
+{phase_weeks}
+""")
+
+KNOWLEDGE_HEADER = """
+## 专业知识参考（包含知识图谱信息）
+"""
+
+# 静态说明加结构化计划要求的前缀只随阶段划分变化，按(周数, 各阶段起止周)缓存
+_PREFIX_CACHE_SIZE = 64
+
+
+# 运动处方生成的固定说明（system消息）
+PRESCRIPTION_INSTRUCTIONS = """作为一名专业的运动处方专家，请根据用户消息中的用户信息生成个性化的运动处方。
+
+请为每个阶段生成具体的训练计划，包括：
+1. 阶段目标
+2. 每周训练次数和总时长
+3. 主要运动类型和强度（有氧运动强度必须使用储备心率HRR表示，抗阻运动强度必须使用1-RM百分比设定）
+4. 注意事项
+
+请确保计划安全、有效，并考虑用户的年龄、性别、健康状况和运动风险等级。
+"""
+
+PRESCRIPTION_USER_TEMPLATE = PromptTemplate("""用户信息：
+- 年龄：{age}岁
+- 性别：{gender}
+- 综合评级：{overall_rating}
+- 薄弱环节：{weak_areas}
+- 运动偏好：{exercise_preferences}
+- 运动风险等级：{exercise_risk_level}
+- 疾病：{diseases}
+
+训练周期：共{total_weeks}周，分为3个阶段
+- 阶段1：{phase1_weeks}周
+- 阶段2：{phase2_weeks}周
+- 阶段3：{phase3_weeks}周
+""")
+
+
+class ReportPromptBuilder:
+    """生成(system, user)两条消息：system为静态说明和结构化计划要求，user为用户数据和专业知识参考"""
+
+    def __init__(self, metric_units: Dict[str, str]):
+        self.metric_units = metric_units
+        # 报告在多个线程池中并发构建，前缀缓存的读写需加锁
+        self._prefixes: Dict[Tuple, str] = {}
+        self._prefixes_lock = threading.Lock()
+
+    def system_prompt(self, prescription: ExercisePrescription, plan_block: bool = False) -> str:
+        """报告的system消息；plan_block时附加结构化计划输出要求（同一阶段划分的请求返回同一个字符串对象）"""
+        if not plan_block:
+            return REPORT_INSTRUCTIONS
+        key = (prescription.total_weeks, tuple((phase.start_week, phase.end_week) for phase in prescription.phases))
+        with self._prefixes_lock:
+            prefix = self._prefixes.get(key)
+            if prefix is None:
+                if len(self._prefixes) >= _PREFIX_CACHE_SIZE:
+                    self._prefixes.clear()
+                prefix = self._prefixes[key] = REPORT_INSTRUCTIONS + build_plan_output_instructions(prescription)
+        return prefix
+
+    def user_section(self, user_data: PhysicalTestInput, result: EvaluationResult,
+                     now: Optional[datetime.datetime] = None) -> str:
+        """用户信息、体质测试数据、评估结果和运动处方概要"""
+        now = now or datetime.datetime.now()
+        names = METRIC_DISPLAY_NAMES
+        units = self.metric_units
+
+        # 体质测试数据（不包含评价等级，避免干扰大模型）
+        test_data = []
+        for key in METRIC_KEYS:
+            value = getattr(user_data, key)
+            if value is not None:
+                test_data.append(f"- {names.get(key, key)}：{value} {units.get(key, '')}\n")
+
+        # 各项指标的详细得分和评级信息（用于生成表格）
+        detail_scores = ""
+        scores, ratings = result.individual_scores, result.individual_ratings
+        if scores and ratings:
+            rows = [f"- {names.get(key, key)}：{score:g}分，{ratings[key]}\n"
+                    for key, score in scores.items() if key in ratings]
+            rows.append(f"- 体质测试总评：{result.overall_score:.1f}分，{result.overall_rating}\n")
+            detail_scores = "\n## 各项指标详细评分\n" + "".join(rows)
+
+        prescription = result.exercise_prescription
+        phase_weeks = "".join(f"- 阶段{i}：{phase.weeks}\n" for i, phase in enumerate(prescription.phases, 1))
+        return REPORT_USER_TEMPLATE.render(
+            current_time=now.strftime("%Y年%m月%d日 %H:%M:%S"),
+            name=user_data.name,
+            age=user_data.age,
+            gender=user_data.gender.value,
+            exercise_risk_level=user_data.exercise_risk_level or "未填写",
+            diseases='、'.join(user_data.diseases) if user_data.diseases else "无",
+            exercise_preferences='、'.join(user_data.exercise_preferences) if user_data.exercise_preferences else "未填写",
+            uses_equipment="是" if user_data.uses_equipment else "否",
+            test_data="".join(test_data),
+            overall_score=result.overall_score,
+            overall_rating=result.overall_rating,
+            detail_scores=detail_scores,
+            total_weeks=prescription.total_weeks,
+            phase_weeks=phase_weeks
+        )
+
+    def messages(self, user_data: PhysicalTestInput, result: EvaluationResult, plan_block: bool = False,
+                 now: Optional[datetime.datetime] = None) -> Tuple[str, str]:
+        """报告的(system, user)消息，user消息以专业知识参考标题结尾，知识内容由调用方按预算追加"""
+        return (self.system_prompt(result.exercise_prescription, plan_block),
+                self.user_section(user_data, result, now) + KNOWLEDGE_HEADER)
+
+    @staticmethod
+    def prescription_messages(user_data: PhysicalTestInput, result: EvaluationResult,
+                              phase_weeks: Tuple[int, int, int]) -> Tuple[str, str]:
+        """运动处方生成的(system, user)消息"""
+        # 获取薄弱环节
+        weak_areas = [metric for metric, rating in result.individual_ratings.items()
+                      if rating in ["较差", "差", "需要改善"]]
+        return PRESCRIPTION_INSTRUCTIONS, PRESCRIPTION_USER_TEMPLATE.render(
+            age=user_data.age,
+            gender=user_data.gender.value,
+            overall_rating=result.overall_rating,
+            weak_areas="、".join(weak_areas) if weak_areas else "各方面均衡",
+            exercise_preferences='、'.join(user_data.exercise_preferences) if user_data.exercise_preferences else "无特殊偏好",
+            exercise_risk_level=user_data.exercise_risk_level or "未填写",
+            diseases='、'.join(user_data.diseases) if user_data.diseases else "无",
+            total_weeks=sum(phase_weeks),
+            phase1_weeks=phase_weeks[0],
+            phase2_weeks=phase_weeks[1],
+            phase3_weeks=phase_weeks[2]
+        )
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.llm.resilience import CancelToken, RequestCancelled
+from src.models.models import FailedReport, PhysicalTestInput
+from src.utils.profiling import ProfileSession
+from src.utils.tracing import in_current_context
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """一次报告生成的共享状态：记录得分结果和全部报告片段，供并发的相同请求从头回放"""
+    def __init__(self, key: str):
+        self.key = key
+        self.result = None
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.started = False
+        self.finished_at: Optional[float] = None
+        self.cancel_token = CancelToken()
+        self.condition = threading.Condition()
+        self._callbacks: List[Callable[[], None]] = []
+
+    def set_result(self, result):
+        with self.condition:
+            self.result = result
+            self.condition.notify_all()
+
+    def append(self, chunk: str):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self.condition:
+            if self.done:
+                return
+            self.done = True
+            self.error = error
+            self.finished_at = time.monotonic()
+            callbacks, self._callbacks = self._callbacks, []
+            self.condition.notify_all()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"请求合并回调执行失败: {str(e)}")
+
+    def add_done_callback(self, callback: Callable[[], None]):
+        """计算结束（成功、失败或取消）后调用，已结束时立即调用"""
+        with self.condition:
+            if not self.done:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+
+class ReportSingleFlight:
+    """相同分析请求的合并执行：并发的相同请求共享一次检索和大模型生成，刚完成的结果在completed_ttl秒内直接回放
+
+    每个订阅者都从头收到完整的得分和报告片段；全部订阅者断开后才取消上游生成。
+    """
+    LEADER = "leader"
+    JOINED = "joined"
+    REPLAYED = "replayed"
+
+    def __init__(self, service, completed_ttl: float = 30.0, max_completed: int = 256):
+        self.service = service
+        self.completed_ttl = completed_ttl
+        self.max_completed = max_completed
+        self._in_flight: Dict[str, _Flight] = {}
+        self._completed: "OrderedDict[str, _Flight]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {self.LEADER: 0, self.JOINED: 0, self.REPLAYED: 0}
+
+    @staticmethod
+    def key_of(payload: Dict[str, Any]) -> str:
+        """请求体的规范化哈希（键排序、紧凑序列化），与字段顺序和空白无关"""
+        canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def join(self, key: str) -> Tuple[_Flight, str]:
+        """加入相同请求的计算，返回(flight, 来源)；来源为LEADER时调用方需调用start发起计算"""
+        with self._lock:
+            self._expire()
+            flight = self._completed.get(key)
+            if flight is not None:
+                role = self.REPLAYED
+            else:
+                flight = self._in_flight.get(key)
+                if flight is not None:
+                    role = self.JOINED
+                else:
+                    flight = _Flight(key)
+                    self._in_flight[key] = flight
+                    role = self.LEADER
+            flight.subscribers += 1
+            self.stats[role] += 1
+        return flight, role
+
+    def start(self, flight: _Flight, user_data: PhysicalTestInput, profile: Optional[ProfileSession] = None):
+        """发起计算；给定profile时整个计算（含cpu池上的评分检索和本线程消费的大模型流）在该剖析会话下执行"""
+        flight.started = True
+        self.service.executors.io.submit(self._run, flight, user_data, profile)
+
+    def abandon(self, flight: _Flight, error: BaseException):
+        """发起方未能开始计算（如准入被拒），已并入的请求收到同样的错误"""
+        with self._lock:
+            if self._in_flight.get(flight.key) is flight:
+                del self._in_flight[flight.key]
+        flight.finish(error)
+
+    def leave(self, flight: _Flight):
+        """订阅者结束；最后一个订阅者在计算完成前离开时取消上游生成"""
+        with self._lock:
+            flight.subscribers -= 1
+            abandoned = flight.subscribers <= 0 and not flight.done
+            if abandoned and self._in_flight.get(flight.key) is flight:
+                # 之后的相同请求重新发起，不再并入已取消的计算
+                del self._in_flight[flight.key]
+        if abandoned:
+            flight.cancel_token.cancel()
+            if not flight.started:
+                flight.finish(RequestCancelled("请求已取消"))
+
+    def _run(self, flight: _Flight, user_data: PhysicalTestInput, profile: Optional[ProfileSession] = None):
+        # 先停止剖析采样再结束flight，等待方拿到结果时剖析数据已完整
+        if profile is not None:
+            error = profile.run(self._compute, flight, user_data)
+        else:
+            error = self._compute(flight, user_data)
+        # 分析失败时服务返回FailedReport作为报告，照常交给当前订阅者，但与异常一样不保留
+        failed = error is not None or isinstance(getattr(flight.result, "basic_analysis", None), FailedReport)
+        with self._lock:
+            if self._in_flight.get(flight.key) is flight:
+                del self._in_flight[flight.key]
+            if not failed and self.completed_ttl > 0:
+                # 失败和取消的结果不保留，重试时重新计算
+                self._completed[flight.key] = flight
+                self._completed.move_to_end(flight.key)
+                while len(self._completed) > self.max_completed:
+                    self._completed.popitem(last=False)
+        flight.finish(error)
+
+    def _compute(self, flight: _Flight, user_data: PhysicalTestInput) -> Optional[BaseException]:
+        try:
+            # 评分和检索是CPU密集型，放到cpu池；本线程随后消费大模型流
+            result = self.service.executors.cpu.submit(
+                in_current_context(self.service.analyze_physical_test), user_data, flight.cancel_token).result()
+            flight.set_result(result)
+            for chunk in result.basic_analysis or []:
+                flight.append(chunk)
+        except BaseException as e:
+            if not flight.cancel_token.cancelled:
+                logger.error(f"分析请求执行失败: {str(e)}")
+            return e
+        return None
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._completed:
+            key, flight = next(iter(self._completed.items()))
+            if now - flight.finished_at < self.completed_ttl:
+                break
+            del self._completed[key]
+
+    def subscribe(self, flight: _Flight, poll_interval: float = 1.0) -> Iterator[Tuple[str, Any]]:
+        """从头回放计算输出：依次产出("scores", 结果)、("delta", 文本)…，结束时产出("done", 结果)，失败时抛出原异常"""
+        offset = 0
+        scores_sent = False
+        while True:
+            with flight.condition:
+                while not flight.done and offset == len(flight.chunks) and (scores_sent or flight.result is None):
+                    # 定时醒来，使调用方有机会检测客户端断开
+                    if not flight.condition.wait(poll_interval):
+                        break
+                chunks = flight.chunks[offset:]
+                offset += len(chunks)
+                done = flight.done
+                result = flight.result
+            if result is not None and not scores_sent:
+                scores_sent = True
+                yield "scores", result
+            for chunk in chunks:
+                yield "delta", chunk
+            if done:
+                break
+            if not chunks:
+                yield "heartbeat", None
+        if flight.error is not None:
+            raise flight.error
+        yield "done", flight.result
+
+    def wait(self, flight: _Flight) -> Tuple[Any, str]:
+        """阻塞等待计算完成，返回(结果, 完整报告)，失败时抛出原异常"""
+        with flight.condition:
+            while not flight.done:
+                flight.condition.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, "".join(flight.chunks)
+
+    async def wait_async(self, flight: _Flight, timeout: Optional[float] = None) -> Tuple[Any, str]:
+        """在事件循环中等待计算完成，不占用线程池线程（等待方占满io池时_run仍能执行）；超时抛出asyncio.TimeoutError"""
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def resolve():
+            if not finished.done():
+                finished.set_result(None)
+        flight.add_done_callback(lambda: loop.call_soon_threadsafe(resolve))
+        await asyncio.wait_for(finished, timeout)
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, "".join(flight.chunks)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire()
+            return {"in_flight": len(self._in_flight), "completed": len(self._completed), **self.stats}
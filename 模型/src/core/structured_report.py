@@ -0,0 +1,193 @@
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from src.models.models import ExercisePhase, ExercisePrescription
+
+logger = logging.getLogger(__name__)
+
+# 报告正文之后的结构化计划块分隔符
+PLAN_BLOCK_START = "<<<PLAN_JSON>>>"
+PLAN_BLOCK_END = "<<<END_PLAN_JSON>>>"
+
+
+def build_plan_output_instructions(prescription: ExercisePrescription) -> str:
+    """生成要求大模型在报告后附加结构化计划块的提示词"""
+    example_phases = []
+    for i, phase in enumerate(prescription.phases, 1):
+        example_phases.append({
+            "name": f"阶段{i}",
+            "start_week": phase.start_week,
+            "end_week": phase.end_week,
+            "goal": "阶段目标",
+            "schedule": {key: "当日安排" for key in ExercisePhase.DAY_KEYS},
+            "notes": "注意事项"
+        })
+    example = json.dumps({"total_weeks": prescription.total_weeks, "phases": example_phases},
+                         ensure_ascii=False, separators=(',', ':'))
+    return f"""
+## 结构化计划输出
+在报告全部内容（包括最后的免责声明）输出完毕后，另起一行输出 {PLAN_BLOCK_START}，接着输出一个与上面分阶段计划内容完全一致的JSON对象，最后输出 {PLAN_BLOCK_END}。
+- JSON不要使用代码块包裹，不要包含注释，字段名必须与下面的结构一致
+- start_week和end_week为整数，schedule必须包含mon、tue、wed、thu、fri、sat、sun七个键，值为当日的运动类型、时长、强度和内容，休息日填写休息
+- JSON结构：{example}
+"""
+
+
+def phase_from_dict(data: Dict[str, Any]) -> ExercisePhase:
+    """校验并转换单个阶段的JSON对象，不合法时抛出ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError("阶段必须是JSON对象")
+    start_week, end_week = data.get("start_week"), data.get("end_week")
+    if not isinstance(start_week, int) or not isinstance(end_week, int) or start_week > end_week:
+        raise ValueError(f"阶段周次不合法: {start_week}-{end_week}")
+    goal = data.get("goal")
+    if not isinstance(goal, str):
+        raise ValueError("阶段缺少goal")
+    schedule = data.get("schedule")
+    if not isinstance(schedule, dict):
+        raise ValueError("阶段缺少schedule")
+    schedule = {key: str(schedule.get(key) or "") for key in ExercisePhase.DAY_KEYS}
+    return ExercisePhase(
+        weeks=f"第{start_week}-{end_week}周",
+        goal=goal,
+        plan="；".join(f"{ExercisePhase.DAY_NAMES[key]}：{value}" for key, value in schedule.items() if value),
+        title=f"{data.get('name') or '阶段'}（第{start_week}-{end_week}周）",
+        start_week=start_week,
+        end_week=end_week,
+        schedule=schedule,
+        notes=str(data.get("notes") or "")
+    )
+
+
+class PlanBlockParser:
+    """增量解析计划JSON块：phases数组中的阶段对象一闭合就立即解析，无需等待整块结束"""
+    # 顶层对象深度为1，phases数组为2，阶段对象为3
+    PHASE_DEPTH = 3
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._phase_start: Optional[int] = None
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """输入一段JSON文本，返回其中新闭合的阶段对象"""
+        self.buffer += text
+        buffer = self.buffer
+        completed = []
+        for i in range(self._pos, len(buffer)):
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{' or ch == '[':
+                self._depth += 1
+                if ch == '{' and self._depth == self.PHASE_DEPTH:
+                    self._phase_start = i
+            elif ch == '}' or ch == ']':
+                if ch == '}' and self._depth == self.PHASE_DEPTH and self._phase_start is not None:
+                    try:
+                        completed.append(json.loads(buffer[self._phase_start:i + 1]))
+                    except ValueError as e:
+                        logger.warning(f"阶段JSON解析失败: {str(e)}")
+                    self._phase_start = None
+                self._depth -= 1
+        self._pos = len(buffer)
+        return completed
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """解析完整的计划块（容忍代码块包裹），失败时返回None"""
+        start, end = self.buffer.find('{'), self.buffer.rfind('}')
+        if start < 0 or end < start:
+            return None
+        try:
+            return json.loads(self.buffer[start:end + 1])
+        except ValueError:
+            return None
+
+
+def _partial_marker_length(text: str, marker: str) -> int:
+    """text末尾可能是marker前缀的最大长度（需暂缓输出，等待下一个片段确认）"""
+    for length in range(min(len(marker) - 1, len(text)), 0, -1):
+        if text.endswith(marker[:length]):
+            return length
+    return 0
+
+
+def iter_structured_report(chunks: Iterable[str], prescription: ExercisePrescription) -> Iterator[str]:
+    """转发报告正文并剥离结构化计划块，计划块中的阶段闭合后立即写入prescription"""
+    parser = PlanBlockParser()
+    parsed_phases: List[ExercisePhase] = []
+    state = "markdown"
+    pending = ""
+
+    def accept(phases: List[Dict[str, Any]]):
+        for data in phases:
+            try:
+                parsed_phases.append(phase_from_dict(data))
+            except ValueError as e:
+                logger.warning(f"结构化阶段校验失败: {str(e)}")
+                continue
+            # 第一个结构化阶段到达后替换兜底阶段
+            prescription.phases = list(parsed_phases)
+            prescription.structured = True
+
+    def finish():
+        plan = parser.finish()
+        if plan is None:
+            logger.warning("结构化计划块不完整或不是合法JSON，保留已解析的阶段")
+            return
+        if isinstance(plan.get("total_weeks"), int) and prescription.structured:
+            prescription.total_weeks = plan["total_weeks"]
+        prescription.complete = prescription.structured
+
+    for chunk in chunks:
+        pending += chunk
+        while pending:
+            if state == "markdown":
+                idx = pending.find(PLAN_BLOCK_START)
+                if idx >= 0:
+                    if idx > 0:
+                        yield pending[:idx]
+                    pending = pending[idx + len(PLAN_BLOCK_START):]
+                    state = "plan"
+                    continue
+                keep = _partial_marker_length(pending, PLAN_BLOCK_START)
+                if len(pending) > keep:
+                    yield pending[:len(pending) - keep]
+                pending = pending[len(pending) - keep:]
+                break
+            elif state == "plan":
+                idx = pending.find(PLAN_BLOCK_END)
+                if idx >= 0:
+                    accept(parser.feed(pending[:idx]))
+                    finish()
+                    pending = pending[idx + len(PLAN_BLOCK_END):]
+                    state = "after"
+                    continue
+                keep = _partial_marker_length(pending, PLAN_BLOCK_END)
+                accept(parser.feed(pending[:len(pending) - keep]))
+                pending = pending[len(pending) - keep:]
+                break
+            else:
+                # 计划块之后如仍有正文则继续转发
+                if pending.strip():
+                    yield pending
+                pending = ""
+
+    if state == "markdown":
+        if pending:
+            yield pending
+        logger.warning("报告中未找到结构化计划块，使用兜底阶段计划")
+    elif state == "plan":
+        accept(parser.feed(pending))
+        finish()
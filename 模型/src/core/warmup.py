@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceWarmup:
+    """后台分阶段加载服务：先构造轻量的服务对象，再逐个加载重量级组件，并记录各组件的状态供健康探针查询"""
+    PENDING = "pending"
+    LOADING = "loading"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self, factory: Callable[[], Any], on_ready: Optional[Callable[[Any], None]] = None):
+        self.factory = factory
+        self.on_ready = on_ready
+        self.service = None
+        self.status = self.PENDING
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.components: Dict[str, Dict[str, Any]] = {"service": self._component()}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _component() -> Dict[str, Any]:
+        return {"status": ServiceWarmup.PENDING, "seconds": None, "error": None}
+
+    @property
+    def ready(self) -> bool:
+        return self.status == self.READY
+
+    @property
+    def failed(self) -> bool:
+        return self.status == self.FAILED
+
+    def start(self, background: bool = True):
+        """开始加载；background为False时在当前线程同步加载完毕再返回"""
+        if background:
+            self._thread = threading.Thread(target=self.run, name="service-warmup", daemon=True)
+            self._thread.start()
+        else:
+            self.run()
+
+    def run(self):
+        self.started_at = time.monotonic()
+        self.status = self.LOADING
+        try:
+            self._run_stage("service", self._construct)
+            stages: List = self.service.startup_stages()
+            with self._lock:
+                for name, _ in stages:
+                    self.components.setdefault(name, self._component())
+            for name, stage in stages:
+                self._run_stage(name, stage)
+            if self.on_ready is not None:
+                self.on_ready(self.service)
+            self.status = self.READY
+            logger.info(f"服务预热完成，耗时 {time.monotonic() - self.started_at:.1f}s")
+        except Exception as e:
+            self.status = self.FAILED
+            self.error = str(e)
+            logger.error(f"服务预热失败: {str(e)}")
+        finally:
+            self.finished_at = time.monotonic()
+
+    def _construct(self):
+        self.service = self.factory()
+
+    def _run_stage(self, name: str, stage: Callable[[], None]):
+        component = self.components[name]
+        component["status"] = self.LOADING
+        started = time.monotonic()
+        logger.info(f"正在加载组件: {name}")
+        try:
+            stage()
+        except Exception as e:
+            component["status"] = self.FAILED
+            component["error"] = str(e)
+            raise
+        finally:
+            component["seconds"] = round(time.monotonic() - started, 3)
+        component["status"] = self.READY
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前预热状态：整体状态、已完成组件数和各组件状态"""
+        with self._lock:
+            components = {name: dict(state) for name, state in self.components.items()}
+        end = self.finished_at or time.monotonic()
+        return {
+            "status": self.status,
+            "error": self.error,
+            "elapsed": round(end - self.started_at, 3) if self.started_at is not None else None,
+            "progress": f"{sum(1 for c in components.values() if c['status'] == self.READY)}/{len(components)}",
+            "components": components
+        }
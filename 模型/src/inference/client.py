@@ -0,0 +1,164 @@
+import itertools
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import Client
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.inference.server import DEFAULT_AUTHKEY
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceClient:
+    """推理旁路进程的客户端：线程安全，多个线程的调用复用同一连接，由后台线程按请求ID分发结果"""
+    def __init__(self, address, authkey: bytes = DEFAULT_AUTHKEY, timeout: float = 30.0):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._conn = None
+        self._pending: Dict[int, Future] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        self._conn = Client(self.address, authkey=self.authkey)
+        threading.Thread(target=self._read_loop, args=(self._conn,), name="inference-client", daemon=True).start()
+
+    def _read_loop(self, conn):
+        try:
+            while True:
+                req_id, ok, value = conn.recv()
+                with self._lock:
+                    future = self._pending.pop(req_id, None)
+                if future is None:
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(RuntimeError(f"推理服务错误: {value}"))
+        except (EOFError, OSError):
+            pass
+        except Exception as e:
+            # close()与recv()并发时连接对象可能抛出其他异常（如TypeError），同样按连接断开处理
+            if self._conn is conn:
+                logger.warning(f"推理服务连接读取失败: {str(e)}")
+        # 连接断开：未完成的调用全部失败，下次调用时重连
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(ConnectionError("推理服务连接已断开"))
+
+    def call(self, kind: str, model_path: str, items: List[Any], load_kwargs: Optional[Dict[str, Any]] = None,
+             **kwargs) -> np.ndarray:
+        """load_kwargs为旁路进程加载该模型时传给构造函数的参数，kwargs为encode/predict的调用参数"""
+        future = Future()
+        with self._lock:
+            if self._conn is None:
+                self._connect()
+            req_id = next(self._ids)
+            self._pending[req_id] = future
+            self._conn.send((req_id, kind, model_path, list(items), kwargs, load_kwargs or {}))
+        try:
+            return future.result(timeout=self.timeout)
+        finally:
+            # 超时或失败时结果不会再被读取，不能留在待分发表中
+            with self._lock:
+                self._pending.pop(req_id, None)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _reset_after_fork(self):
+        # 子进程不继承读取线程，也不能与父进程共用同一连接，下次调用时重新连接
+        self._conn = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+
+class RemoteSentenceTransformer:
+    """与SentenceTransformer.encode接口一致的远程嵌入模型"""
+    def __init__(self, client: InferenceClient, model_path: str, load_kwargs: Optional[Dict[str, Any]] = None):
+        self.client = client
+        self.model_path = model_path
+        self.load_kwargs = load_kwargs or {}
+
+    def encode(self, sentences, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        # 进度条等只影响本地展示的参数不传给服务端，避免拆散批次
+        kwargs.pop("show_progress_bar", None)
+        embeddings = self.client.call("encoder", self.model_path, [sentences] if single else sentences,
+                                      load_kwargs=self.load_kwargs, **kwargs)
+        return embeddings[0] if single else embeddings
+
+
+class RemoteCrossEncoder:
+    """与CrossEncoder.predict接口一致的远程重排模型"""
+    def __init__(self, client: InferenceClient, model_path: str, load_kwargs: Optional[Dict[str, Any]] = None):
+        self.client = client
+        self.model_path = model_path
+        self.load_kwargs = load_kwargs or {}
+
+    def predict(self, sentences, **kwargs) -> np.ndarray:
+        kwargs.pop("show_progress_bar", None)
+        return self.client.call("cross_encoder", self.model_path, sentences, load_kwargs=self.load_kwargs, **kwargs)
+
+
+_shared_clients: Dict[Any, InferenceClient] = {}
+_shared_lock = threading.Lock()
+
+
+def _reset_clients_after_fork():
+    global _shared_lock
+    _shared_lock = threading.Lock()
+    for client in _shared_clients.values():
+        client._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
+def get_inference_client(config) -> Optional[InferenceClient]:
+    """按配置获取进程内共享的推理客户端；未配置旁路进程或连接失败时返回None（调用方改用本地模型）"""
+    address = getattr(config, 'inference_server_address', None)
+    if not address:
+        return None
+    with _shared_lock:
+        client = _shared_clients.get(address)
+        if client is None:
+            try:
+                client = InferenceClient(address, authkey=getattr(config, 'inference_server_authkey', DEFAULT_AUTHKEY),
+                                         timeout=getattr(config, 'inference_timeout', 30.0))
+            except Exception as e:
+                logger.warning(f"连接推理服务失败，使用进程内模型: {str(e)}")
+                return None
+            _shared_clients[address] = client
+        return client
+
+
+def load_sentence_transformer(config, model_path: str):
+    """加载嵌入模型：配置了推理旁路进程时返回远程代理，否则在本进程加载"""
+    client = get_inference_client(config)
+    if client is not None:
+        return RemoteSentenceTransformer(client, model_path)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_path)
+
+
+def load_cross_encoder(config, model_path: str, **kwargs):
+    """加载重排模型：配置了推理旁路进程时返回远程代理（kwargs随请求传给旁路进程加载），否则在本进程加载"""
+    client = get_inference_client(config)
+    if client is not None:
+        return RemoteCrossEncoder(client, model_path, kwargs)
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_path, **kwargs)
@@ -0,0 +1,225 @@
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+from multiprocessing.connection import Listener
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUTHKEY = b"health-inference"
+
+
+def _load_model(kind: str, model_path: str, **load_kwargs):
+    """按类型加载本地模型：encoder为SentenceTransformer，cross_encoder为CrossEncoder，load_kwargs原样传给构造函数"""
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+    if kind == "encoder":
+        return SentenceTransformer(model_path, **load_kwargs)
+    return CrossEncoder(model_path, **load_kwargs)
+
+
+class _Request:
+    """一次encode/predict调用，items为待处理的文本或文本对"""
+    def __init__(self, conn_id: int, req_id: int, kind: str, model_path: str, items: List[Any],
+                 kwargs: Dict[str, Any], load_kwargs: Optional[Dict[str, Any]] = None):
+        self.conn_id = conn_id
+        self.req_id = req_id
+        self.kind = kind
+        self.model_path = model_path
+        self.items = items
+        self.kwargs = kwargs
+        self.load_kwargs = load_kwargs or {}
+
+    @property
+    def model_key(self) -> Tuple:
+        # 同一路径以不同参数加载（如trust_remote_code）视为不同的模型
+        return (self.kind, self.model_path, tuple(sorted(self.load_kwargs.items())))
+
+    @property
+    def group_key(self) -> Tuple:
+        # 只有模型和调用参数都相同的请求才能合并为同一批
+        return self.model_key + (tuple(sorted(self.kwargs.items())),)
+
+
+class InferenceServer:
+    """模型推理旁路进程：托管嵌入模型和重排模型，把各API worker的并发encode/predict调用合并为动态微批次
+
+    第一条请求到达后最多等待max_wait秒收集更多请求，或凑满max_batch_size条文本后立即执行一次前向计算。
+    """
+    def __init__(self, address, authkey: bytes = DEFAULT_AUTHKEY, max_batch_size: int = 64,
+                 max_wait: float = 0.005, loader: Optional[Callable[..., Any]] = None):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.loader = loader or _load_model
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.models: Dict[Tuple, Any] = {}
+        self.requests: "queue.Queue[_Request]" = queue.Queue()
+        self.batch_sizes: List[int] = []
+        self._connections: Dict[int, Any] = {}
+        self._send_locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+    def serve_forever(self):
+        threading.Thread(target=self._batch_loop, name="inference-batcher", daemon=True).start()
+        conn_id = 0
+        while not self._closed.is_set():
+            try:
+                conn = self.listener.accept()
+            except (OSError, EOFError):
+                if self._closed.is_set():
+                    break
+                continue
+            conn_id += 1
+            with self._lock:
+                self._connections[conn_id] = conn
+                self._send_locks[conn_id] = threading.Lock()
+            threading.Thread(target=self._read_loop, args=(conn_id, conn), name=f"inference-conn-{conn_id}",
+                             daemon=True).start()
+
+    def start(self) -> "InferenceServer":
+        """在后台线程中运行（测试和单进程部署用）"""
+        threading.Thread(target=self.serve_forever, name="inference-server", daemon=True).start()
+        return self
+
+    def close(self):
+        self._closed.set()
+        self.listener.close()
+
+    def _read_loop(self, conn_id: int, conn):
+        try:
+            while True:
+                # 第6项为模型加载参数（旧版客户端不发送）
+                req_id, kind, model_path, items, kwargs, *load_kwargs = conn.recv()
+                self.requests.put(_Request(conn_id, req_id, kind, model_path, items, kwargs,
+                                           load_kwargs[0] if load_kwargs else None))
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self._connections.pop(conn_id, None)
+                self._send_locks.pop(conn_id, None)
+            conn.close()
+
+    def _collect_batch(self) -> List[_Request]:
+        """阻塞等待第一条请求，然后在窗口期内继续收集，直到文本数达到上限"""
+        batch = [self.requests.get()]
+        size = len(batch[0].items)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.items)
+        return batch
+
+    def _batch_loop(self):
+        while not self._closed.is_set():
+            batch = self._collect_batch()
+            groups: Dict[Tuple, List[_Request]] = {}
+            for request in batch:
+                groups.setdefault(request.group_key, []).append(request)
+            for group in groups.values():
+                self._run_group(group)
+
+    def preload(self, kind: str, model_path: str, **load_kwargs):
+        """启动时预加载模型；load_kwargs需与客户端请求携带的加载参数一致，否则请求到达时会按新参数另行加载"""
+        self._get_model(_Request(0, 0, kind, model_path, [], {}, load_kwargs))
+
+    def _get_model(self, request: _Request):
+        key = request.model_key
+        if key not in self.models:
+            logger.info(f"推理服务加载模型: {request.kind} {request.model_path} {request.load_kwargs or ''}")
+            self.models[key] = self.loader(request.kind, request.model_path, **request.load_kwargs)
+        return self.models[key]
+
+    def _run_group(self, group: List[_Request]):
+        """对同一模型、同一参数的请求执行一次合并的前向计算，再按请求拆分结果"""
+        first = group[0]
+        items = [item for request in group for item in request.items]
+        try:
+            model = self._get_model(first)
+            if first.kind == "encoder":
+                outputs = model.encode(items, **first.kwargs)
+            else:
+                outputs = model.predict(items, **first.kwargs)
+            outputs = np.asarray(outputs)
+            self.batch_sizes.append(len(items))
+        except Exception as e:
+            logger.error(f"推理失败: {str(e)}")
+            for request in group:
+                self._reply(request, False, str(e))
+            return
+
+        offset = 0
+        for request in group:
+            self._reply(request, True, outputs[offset:offset + len(request.items)])
+            offset += len(request.items)
+
+    def _reply(self, request: _Request, ok: bool, value: Any):
+        with self._lock:
+            conn = self._connections.get(request.conn_id)
+            send_lock = self._send_locks.get(request.conn_id)
+        if conn is None:
+            return
+        try:
+            with send_lock:
+                conn.send((request.req_id, ok, value))
+        except (OSError, EOFError):
+            pass
+
+
+def _parse_preload(spec: str) -> Tuple[str, str, Dict[str, Any]]:
+    """解析KIND=PATH[,key=value...]，value按JSON解析（true、1等），无法解析时作为字符串"""
+    kind, _, rest = spec.partition("=")
+    model_path, *options = rest.split(",")
+    load_kwargs = {}
+    for option in options:
+        key, _, value = option.partition("=")
+        try:
+            load_kwargs[key] = json.loads(value)
+        except ValueError:
+            load_kwargs[key] = value
+    return kind, model_path, load_kwargs
+
+
+def main(argv: Optional[List[str]] = None):
+    from src.config.config import settings
+
+    parser = argparse.ArgumentParser(description="嵌入/重排模型推理旁路进程（动态微批次）")
+    parser.add_argument("--address", default=getattr(settings, 'inference_server_address', None),
+                        help="监听地址：Unix socket路径（Windows为\\\\.\\pipe\\名称）")
+    parser.add_argument("--max-batch-size", type=int, default=getattr(settings, 'inference_max_batch_size', 64))
+    parser.add_argument("--max-wait-ms", type=float, default=getattr(settings, 'inference_max_wait_ms', 5))
+    parser.add_argument("--preload", nargs="*", default=[], metavar="KIND=PATH[,key=value...]",
+                        help="启动时预加载的模型及加载参数（需与客户端一致），例如 encoder=bge_small_embeddings "
+                             "cross_encoder=bge_reranker,trust_remote_code=true")
+    args = parser.parse_args(argv)
+    if not args.address:
+        parser.error("请通过--address或配置inference_server_address指定监听地址")
+
+    authkey = getattr(settings, 'inference_server_authkey', DEFAULT_AUTHKEY)
+    server = InferenceServer(args.address, authkey=authkey, max_batch_size=args.max_batch_size,
+                             max_wait=args.max_wait_ms / 1000.0)
+    for spec in args.preload:
+        kind, path, load_kwargs = _parse_preload(spec)
+        server.preload(kind, path, **load_kwargs)
+    print(f"推理服务已启动: {server.address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 import json
-import pandas as pd
 import numpy as np
 import json
 import os
 from typing import List, Dict, Any, Optional, Tuple
-from sentence_transformers import SentenceTransformer
+from src.inference.client import load_sentence_transformer
+from src.utils.tracing import span, traced
 import faiss
 
 class KnowledgeGraphManager:
@@ -71,6 +71,7 @@ class KnowledgeGraphManager:
                                     'object': triple['tail']
                                 })
                 elif self.config.kg_triples_path.endswith('.csv'):
+                    import pandas as pd
                     df = pd.read_csv(self.config.kg_triples_path, encoding='utf-8')
                     # 确保三元组格式正确
                     if 'subject' in df.columns and 'predicate' in df.columns and 'object' in df.columns:
@@ -85,10 +86,10 @@ class KnowledgeGraphManager:
             local_model_path = "bge-reranker-v2-m3"
             if os.path.exists(local_model_path) and os.path.isdir(local_model_path):
                 print(f"正在尝试加载本地向量模型: {local_model_path}")
-                self.vector_model = SentenceTransformer(local_model_path)
+                self.vector_model = load_sentence_transformer(self.config, local_model_path)
             elif hasattr(self.config, 'embedding_model') and self.config.embedding_model:
                 print("尝试加载配置的嵌入模型...")
-                self.vector_model = SentenceTransformer(self.config.embedding_model)
+                self.vector_model = load_sentence_transformer(self.config, self.config.embedding_model)
             # 如果所有加载尝试失败，也不会中断程序运行
         except Exception as e:
             print(f"初始化向量模型失败，但程序继续运行: {str(e)}")
@@ -136,10 +137,12 @@ class KnowledgeGraphManager:
         
         try:
             # 生成查询向量
-            query_vector = self.vector_model.encode([query])[0].reshape(1, -1)
+            with span("kg.embed"):
+                query_vector = self.vector_model.encode([query])[0].reshape(1, -1)
             
             # 搜索相似实体
-            distances, indices = self.entity_vectors.search(query_vector, top_k)
+            with span("kg.faiss"):
+                distances, indices = self.entity_vectors.search(query_vector, top_k)
             
             # 格式化结果
             results = []
@@ -199,6 +202,12 @@ class KnowledgeGraphManager:
     
     def generate_knowledge_summary(self, query: str, max_length: int = 500) -> str:
         """生成知识摘要"""
+        summary, _ = self.generate_scored_summary(query, max_length)
+        return summary
+    
+    @traced("kg.summary")
+    def generate_scored_summary(self, query: str, max_length: int = 500) -> Tuple[str, float]:
+        """生成知识摘要及其相关度（取匹配实体的最高相似度）"""
         try:
             # 搜索相关知识
             search_results = self.search_knowledge(query)
@@ -233,7 +242,8 @@ class KnowledgeGraphManager:
             if len(summary) > max_length:
                 summary = summary[:max_length] + "..."
             
-            return summary
+            score = max((result['relevance_score'] for result in search_results), default=0.0)
+            return summary, score
         except Exception as e:
             print(f"生成知识摘要失败: {str(e)}")
-            return ""
\ No newline at end of file
+            return "", 0.0
\ No newline at end of file
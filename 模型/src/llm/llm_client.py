@@ -1,12 +1,138 @@
+import json
+import queue
+import socket
+import threading
 import time
 import requests
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import logging
+from src.llm.resilience import CancelToken, CircuitBreaker, LatencyTracker, LLMEndpoint, RequestCancelled
+from src.llm.prompt_cache import PromptCacheStats
+from src.llm.recorder import ResponseRecorder
+from src.llm.sse import SSEDecoder, StreamStats
+from src.utils.tracing import record_stage, traced
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class _StreamAttempt:
+    """一次流式请求尝试：后台线程负责建立连接并读取首个文本片段"""
+    def __init__(self, endpoint: LLMEndpoint, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                 timeout: float, chunk_size: int, events: "queue.Queue"):
+        self.endpoint = endpoint
+        self.url = url
+        self.headers = headers
+        self.payload = payload
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.events = events
+        self.stats = StreamStats()
+        self.response = None
+        self.contents = None
+        self.started_at = 0.0
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"llm-stream-{endpoint.name}", daemon=True)
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.thread.start()
+
+    def _run(self):
+        try:
+            response = requests.post(self.url, headers=self.headers, json=self.payload, stream=True, timeout=self.timeout)
+            self.response = response
+            if self.cancelled.is_set():
+                response.close()
+                return
+            if response.status_code != 200:
+                message = f"流式请求失败 (状态码: {response.status_code}): {response.text}"
+                response.close()
+                raise Exception(message)
+            self.contents = _iter_stream_content(response, self.chunk_size, self.stats)
+            first = next(self.contents, None)
+            if not self.cancelled.is_set():
+                self.events.put(("first", self, first))
+                return
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self.events.put(("error", self, e))
+                return
+        if self.response is not None:
+            self.response.close()
+
+    def cancel(self):
+        """取消该尝试并中断底层连接"""
+        self.cancelled.set()
+        if self.response is not None:
+            _abort_response(self.response)
+
+
+def _abort_response(response):
+    """立即中断响应连接：关闭socket使其他线程中阻塞的读取立即返回"""
+    raw = getattr(response, 'raw', None)
+    connection = getattr(raw, 'connection', None) or getattr(raw, '_connection', None)
+    sock = getattr(connection, 'sock', None)
+    if sock is None:
+        # 非keep-alive响应的连接对象已释放socket，从底层文件对象中获取
+        buffered = getattr(getattr(raw, '_fp', None), 'fp', None)
+        sock = getattr(getattr(buffered, 'raw', None), '_sock', None)
+    if sock is None:
+        response.close()
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def _iter_raw_chunks(response, chunk_size: int):
+    """读取字节块：优先使用read1，有多少数据就返回多少，不等待凑满chunk_size；按Content-Encoding解压"""
+    read1 = getattr(response.raw, 'read1', None)
+    if read1 is None:
+        yield from response.iter_content(chunk_size=chunk_size)
+        return
+    while True:
+        data = read1(chunk_size, decode_content=True)
+        if not data:
+            break
+        yield data
+
+
+def _iter_stream_content(response, chunk_size: int, stats: StreamStats):
+    """解析SSE格式的响应，每个网络字节块中的全部文本增量合并为一个片段产出"""
+    decoder = SSEDecoder()
+    for chunk in _iter_raw_chunks(response, chunk_size):
+        parts, done = _extract_deltas(decoder.feed(chunk), stats)
+        if parts:
+            yield parts[0] if len(parts) == 1 else "".join(parts)
+        if done:
+            return
+    parts, _ = _extract_deltas(decoder.flush(), stats)
+    if parts:
+        yield "".join(parts)
+
+
+def _extract_deltas(payloads: List[bytes], stats: StreamStats):
+    """从事件data中提取文本增量，返回(增量列表, 是否收到[DONE])"""
+    parts = []
+    for data in payloads:
+        if data == b'[DONE]':
+            return parts, True
+        try:
+            event = json.loads(data)
+            usage = event.get('usage')
+            if usage:
+                stats.usage = usage
+            content = event['choices'][0]['delta'].get('content')
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+            continue
+        if content:
+            stats.deltas += 1
+            parts.append(content)
+    return parts, False
+
+
 class DeepSeekAPIClient:
     """DeepSeek大模型API客户端"""
     def __init__(self, config):
@@ -15,26 +141,90 @@ class DeepSeekAPIClient:
         self.api_base_url = getattr(config, 'deepseek_api_base_url', 'https://api.deepseek.com')
         self.model = getattr(config, 'deepseek_model', 'deepseek-chat')
         self.max_tokens = getattr(config, 'deepseek_max_tokens', 4096)
+        self.request_timeout = getattr(config, 'llm_request_timeout', 60)
+        self.stream_timeout = getattr(config, 'llm_stream_timeout', 120)
+        
+        # 流式读取配置：网络读块大小和文本增量合并窗口
+        self.stream_chunk_size = getattr(config, 'llm_stream_chunk_size', 4096)
+        self.stream_coalesce_window = getattr(config, 'llm_stream_coalesce_ms', 0) / 1000.0
+        self.last_stream_stats: Optional[StreamStats] = None
+        # 各端点的提示词前缀缓存命中统计（解析自usage）
+        self.prompt_cache_stats = PromptCacheStats()
         
         # 重试配置
         self.max_retries = 3
         self.retry_delay = 2  # 秒
         self.retry_backoff = 2
+
+        # 对冲请求配置
+        self.hedge_enabled = getattr(config, 'llm_hedge_enabled', False)
+        self.hedge_percentile = getattr(config, 'llm_hedge_ttft_percentile', 95)
+        self.hedge_initial_delay = getattr(config, 'llm_hedge_initial_delay', 5.0)
+        self.hedge_min_delay = getattr(config, 'llm_hedge_min_delay', 1.0)
+        self.hedge_max_delay = getattr(config, 'llm_hedge_max_delay', 20.0)
+        self.hedge_min_samples = getattr(config, 'llm_hedge_min_samples', 20)
+        self.ttft_tracker = LatencyTracker()
+
+        # 主端点 + 备用端点
+        self.endpoints = self._build_endpoints()
+        
+        # 响应录制/回放（off/record/replay），用于离线压测和确定性测试
+        self.recorder = ResponseRecorder(
+            getattr(config, 'llm_record_dir', 'data/llm_recordings'),
+            getattr(config, 'llm_record_mode', 'off'),
+            getattr(config, 'llm_replay_realtime', False)
+        )
+    
+    def _build_endpoints(self) -> List[LLMEndpoint]:
+        """根据配置构建端点列表（主端点在前）"""
+        threshold = getattr(self.config, 'llm_circuit_failure_threshold', 5)
+        reset_timeout = getattr(self.config, 'llm_circuit_reset_timeout', 30.0)
+        endpoints = [LLMEndpoint("primary", self.api_base_url, self.api_key, self.model,
+                                 CircuitBreaker(threshold, reset_timeout))]
+        for i, item in enumerate(getattr(self.config, 'deepseek_fallback_endpoints', None) or [], 1):
+            endpoints.append(LLMEndpoint(
+                item.get('name', f"fallback-{i}"),
+                item.get('base_url', self.api_base_url),
+                item.get('api_key', self.api_key),
+                item.get('model', self.model),
+                CircuitBreaker(threshold, reset_timeout)
+            ))
+        return endpoints
+    
+    def _available_endpoints(self) -> List[LLMEndpoint]:
+        """返回未熔断的候选端点，全部熔断时抛出异常；实际发起请求前还需通过breaker.allow_request()（半开端点只放行一个试探）"""
+        endpoints = [endpoint for endpoint in self.endpoints if endpoint.breaker.state != CircuitBreaker.OPEN]
+        if not endpoints:
+            raise Exception("所有LLM端点均处于熔断状态，请稍后重试")
+        return endpoints
     
-    def _prepare_headers(self) -> Dict[str, str]:
+    def get_endpoint_health(self) -> List[Dict[str, Any]]:
+        """获取各端点的熔断状态"""
+        return [endpoint.to_dict() for endpoint in self.endpoints]
+    
+    def _hedge_delay(self) -> float:
+        """根据历史首字延迟分位数计算对冲触发延迟"""
+        if self.ttft_tracker.count < self.hedge_min_samples:
+            return self.hedge_initial_delay
+        delay = self.ttft_tracker.percentile(self.hedge_percentile)
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, delay))
+    
+    def _prepare_headers(self, api_key: Optional[str] = None) -> Dict[str, str]:
         """准备API请求头"""
         return {
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
+            "Authorization": f"Bearer {api_key if api_key is not None else self.api_key}"
         }
     
     def _prepare_payload(self, prompt: str, **kwargs) -> Dict[str, Any]:
-        """准备API请求体"""
+        """准备API请求体；传入system_prompt时作为system消息放在最前面，使固定说明成为可缓存的请求前缀"""
+        messages = [{"role": "user", "content": prompt}]
+        system_prompt = kwargs.get('system_prompt')
+        if system_prompt:
+            messages.insert(0, {"role": "system", "content": system_prompt})
         payload = {
             "model": self.model,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
+            "messages": messages,
             "max_tokens": kwargs.get('max_tokens', self.max_tokens),
             "temperature": kwargs.get('temperature', 0.7),
             "top_p": kwargs.get('top_p', 0.9),
@@ -44,20 +234,20 @@ class DeepSeekAPIClient:
         
         return payload
     
-    def _call_api(self, prompt: str, **kwargs) -> Dict[str, Any]:
-        """调用DeepSeek API"""
-        url = f"{self.api_base_url}/chat/completions"
-        headers = self._prepare_headers()
-        payload = self._prepare_payload(prompt, **kwargs)
+    def _call_endpoint(self, endpoint: LLMEndpoint, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """调用单个端点（带重试），失败时抛出异常"""
+        url = f"{endpoint.base_url}/chat/completions"
+        headers = self._prepare_headers(endpoint.api_key)
+        payload = dict(payload, model=endpoint.model)
         
         for attempt in range(self.max_retries):
             try:
-                response = requests.post(url, headers=headers, json=payload, timeout=60)
+                response = requests.post(url, headers=headers, json=payload, timeout=self.request_timeout)
                 
                 if response.status_code == 200:
                     return response.json()
                 else:
-                    logger.warning(f"API调用失败 (状态码: {response.status_code}): {response.text}")
+                    logger.warning(f"API调用失败 [{endpoint.name}] (状态码: {response.status_code}): {response.text}")
                     
                     # 处理速率限制或临时错误
                     if response.status_code in [429, 502, 503, 504]:
@@ -66,20 +256,45 @@ class DeepSeekAPIClient:
                             logger.info(f"等待 {delay} 秒后重试...")
                             time.sleep(delay)
                             continue
+                    break
             except requests.RequestException as e:
-                logger.warning(f"API请求异常: {str(e)}")
+                logger.warning(f"API请求异常 [{endpoint.name}]: {str(e)}")
                 
                 if attempt < self.max_retries - 1:
                     delay = self.retry_delay * (self.retry_backoff ** attempt)
                     logger.info(f"等待 {delay} 秒后重试...")
                     time.sleep(delay)
                     continue
+        
+        raise Exception(f"端点 {endpoint.name} 调用失败，已重试 {self.max_retries} 次")
+    
+    def _call_api(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """调用DeepSeek API，主端点失败时依次切换到备用端点"""
+        payload = self._prepare_payload(prompt, **kwargs)
+        if self.recorder.replaying:
+            return self.recorder.load_completion(payload)
+        
+        for endpoint in self._available_endpoints():
+            if not endpoint.breaker.allow_request():
+                # 半开端点的试探请求尚未结束
+                continue
+            try:
+                response = self._call_endpoint(endpoint, payload)
+                endpoint.breaker.record_success()
+                self.prompt_cache_stats.record(endpoint.name, response.get('usage'))
+                if self.recorder.recording:
+                    self.recorder.save_completion(payload, response)
+                return response
+            except Exception as e:
+                endpoint.breaker.record_failure()
+                logger.warning(f"{str(e)}，尝试切换端点")
             
-        # 所有重试都失败
-        error_msg = f"API调用失败，已重试 {self.max_retries} 次"
+        # 所有端点都失败
+        error_msg = "API调用失败，所有可用端点均不可用"
         logger.error(error_msg)
         raise Exception(error_msg)
     
+    @traced("llm.generate")
     def generate_text(self, prompt: str, **kwargs) -> str:
         """生成文本响应"""
         try:
@@ -94,42 +309,183 @@ class DeepSeekAPIClient:
             logger.error(f"文本生成失败: {str(e)}")
             raise
     
-    def stream_text(self, prompt: str, **kwargs):
-        """流式生成文本响应（生成器函数）"""
+    def stream_text(self, prompt: str, stream_stats: Optional[StreamStats] = None,
+                    cancel_token: Optional[CancelToken] = None, **kwargs):
+        """流式生成文本响应（生成器函数），性能统计写入stream_stats及last_stream_stats
+
+        cancel_token被取消时立即中断上游连接，生成器抛出RequestCancelled。
+        """
+        stats = stream_stats if stream_stats is not None else StreamStats()
+        self.last_stream_stats = stats
         try:
-            url = f"{self.api_base_url}/chat/completions"
-            headers = self._prepare_headers()
             payload = self._prepare_payload(prompt, **kwargs)
             payload['stream'] = True
-            
-            with requests.post(url, headers=headers, json=payload, stream=True, timeout=120) as response:
-                if response.status_code == 200:
-                    for chunk in response.iter_lines():
-                        if chunk:
-                            # 处理SSE格式的响应
-                            chunk_str = chunk.decode('utf-8').strip()
-                            if chunk_str.startswith('data: '):
-                                data = chunk_str[len('data: '):]
-                                if data == '[DONE]':
-                                    break
-                                try:
-                                    import json
-                                    chunk_data = json.loads(data)
-                                    if ('choices' in chunk_data and 
-                                        len(chunk_data['choices']) > 0 and 
-                                        'delta' in chunk_data['choices'][0] and 
-                                        'content' in chunk_data['choices'][0]['delta']):
-                                        content = chunk_data['choices'][0]['delta']['content']
-                                        # 实时yield生成的内容，实现一边生成一边输出
-                                        yield content
-                                except json.JSONDecodeError:
-                                    continue
-                else:
-                    raise Exception(f"流式请求失败 (状态码: {response.status_code}): {response.text}")
+            payload['stream_options'] = {"include_usage": True}
+            if self.recorder.replaying:
+                yield from self._replay_stream(payload, stats, cancel_token)
+            elif self.recorder.recording:
+                yield from self.recorder.record_stream(payload, self._hedged_stream(payload, stats, cancel_token),
+                                                       lambda: stats.usage)
+            else:
+                yield from self._hedged_stream(payload, stats, cancel_token)
+            if stats.time_to_first_token is not None:
+                cache_hit, cache_miss = self.prompt_cache_stats.record(stats.endpoint, stats.usage)
+                # 流式生成跨越多次迭代，结束后按实际起止时间补记span
+                started_at = time.time() - (time.monotonic() - stats.started_at)
+                record_stage("llm.time_to_first_token", stats.time_to_first_token, started_at, endpoint=stats.endpoint,
+                             prompt_cache_hit_tokens=cache_hit, prompt_cache_miss_tokens=cache_miss)
+                record_stage("llm.stream", (stats.finished_at or time.monotonic()) - stats.started_at, started_at, endpoint=stats.endpoint,
+                             completion_tokens=stats.completion_tokens)
+                cache_usage = f", 输入缓存命中 {cache_hit}/{cache_hit + cache_miss} tokens" if cache_hit is not None else ""
+                logger.info(f"流式生成完成 [{stats.endpoint}]: 首字延迟 {stats.time_to_first_token:.2f}s, "
+                            f"{stats.completion_tokens} tokens, {stats.tokens_per_second or 0:.1f} tokens/s{cache_usage}")
+        except RequestCancelled:
+            logger.info(f"流式生成已取消，已输出 {stats.chars} 字符")
+            raise
         except Exception as e:
             logger.error(f"流式文本生成失败: {str(e)}")
             raise
     
+    def _replay_stream(self, payload: Dict[str, Any], stats: StreamStats, cancel_token: Optional[CancelToken] = None):
+        """从录制文件回放流式响应"""
+        stats.endpoint = "replay"
+        for chunk in self.recorder.replay_stream(payload):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            if stats.first_token_at is None:
+                stats.first_token_at = time.monotonic()
+            stats.deltas += 1
+            stats.chars += len(chunk)
+            yield chunk
+        stats.finished_at = time.monotonic()
+        stats.usage = self.recorder.load_stream_usage(payload) or {}
+    
+    def _hedged_stream(self, payload: Dict[str, Any], stats: StreamStats, cancel_token: Optional[CancelToken] = None):
+        """对冲流式请求：首字前失败则切换端点，启用对冲时首字超时也会向下一端点发起请求，先出字者胜出，其余请求被取消"""
+        cancel_token = cancel_token or CancelToken()
+        cancel_token.raise_if_cancelled()
+        pending = self._available_endpoints()
+        events = queue.Queue()
+        attempts = []
+        running = 0
+        winner = None
+        first = None
+        next_hedge_at = None
+        last_error = None
+        
+        def launch() -> bool:
+            """向下一个放行的端点发起请求并更新下一次对冲时间；半开端点的试探名额已被占用时跳过，没有端点放行时返回False"""
+            nonlocal next_hedge_at
+            while pending:
+                endpoint = pending.pop(0)
+                if endpoint.breaker.allow_request():
+                    break
+            else:
+                next_hedge_at = None
+                return False
+            url = f"{endpoint.base_url}/chat/completions"
+            attempt = _StreamAttempt(endpoint, url, self._prepare_headers(endpoint.api_key),
+                                     dict(payload, model=endpoint.model), self.stream_timeout,
+                                     self.stream_chunk_size, events)
+            attempts.append(attempt)
+            attempt.start()
+            if len(attempts) > 1:
+                logger.info(f"发起对冲/切换流式请求 -> {endpoint.name}")
+            next_hedge_at = time.monotonic() + self._hedge_delay() if self.hedge_enabled and pending else None
+            return True
+        
+        def abort_all():
+            # 调用方取消：中断所有连接（包括胜出者），并唤醒等待首字的循环
+            for attempt in list(attempts):
+                attempt.cancel()
+            events.put(("cancelled", None, None))
+        
+        cancel_token.add_callback(abort_all)
+        try:
+            if not launch():
+                raise Exception("所有LLM端点均处于熔断状态，请稍后重试")
+            running = 1
+            while winner is None:
+                if next_hedge_at is not None:
+                    timeout = max(0.0, next_hedge_at - time.monotonic())
+                else:
+                    timeout = self.stream_timeout
+                try:
+                    kind, attempt, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    if next_hedge_at is not None:
+                        logger.info("首字延迟超过对冲阈值")
+                        if launch():
+                            running += 1
+                        continue
+                    raise Exception("流式请求等待首字超时")
+                
+                if kind == "cancelled":
+                    raise RequestCancelled("请求已取消")
+                if kind == "first":
+                    winner, first = attempt, value
+                    break
+                
+                # 该尝试在首字前失败
+                running -= 1
+                last_error = value
+                attempt.endpoint.breaker.record_failure()
+                logger.warning(f"流式请求失败 [{attempt.endpoint.name}]: {str(value)}")
+                if running > 0:
+                    continue
+                if launch():
+                    running += 1
+                    continue
+                raise last_error
+        except BaseException:
+            cancel_token.remove_callback(abort_all)
+            raise
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancel()
+        
+        stats.first_token_at = time.monotonic()
+        stats.endpoint = winner.endpoint.name
+        self.ttft_tracker.record(stats.first_token_at - winner.started_at)
+        try:
+            if first is not None:
+                stats.chars += len(first)
+                yield first
+            # 实时yield生成的内容，实现一边生成一边输出；设置合并窗口时窗口内的增量合并后输出
+            window = self.stream_coalesce_window
+            buffered = []
+            last_flush = stats.first_token_at
+            for content in winner.contents:
+                stats.chars += len(content)
+                if window <= 0:
+                    yield content
+                    continue
+                buffered.append(content)
+                now = time.monotonic()
+                if now - last_flush >= window:
+                    yield "".join(buffered)
+                    buffered = []
+                    last_flush = now
+            if buffered:
+                yield "".join(buffered)
+            # 连接被取消回调中断时读取会提前结束，不计入端点健康状态
+            cancel_token.raise_if_cancelled()
+            winner.endpoint.breaker.record_success()
+        except RequestCancelled:
+            raise
+        except Exception:
+            if cancel_token.cancelled:
+                raise RequestCancelled("请求已取消")
+            winner.endpoint.breaker.record_failure()
+            raise
+        finally:
+            cancel_token.remove_callback(abort_all)
+            stats.finished_at = time.monotonic()
+            stats.deltas = winner.stats.deltas
+            stats.usage = winner.stats.usage
+            winner.response.close()
+    
     def check_api_connection(self) -> bool:
         """检查API连接是否正常"""
         try:
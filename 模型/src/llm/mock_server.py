@@ -0,0 +1,299 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.llm.prompt_budget import TokenCounter
+
+# 默认返回的报告文本（结构与真实报告一致，便于下游解析和压测）
+DEFAULT_RESPONSE_TEXT = """# 个性化运动处方报告
+
+## 1. 体质分析总结
+您的整体体质处于合格水平，心肺耐力和柔韧性有提升空间，力量素质较为均衡。
+
+## 2. 各项指标评价
+| 指标 | 得分 | 评价等级 |
+| --- | --- | --- |
+| BMI | 100分 | 正常 |
+| 体质测试总评 | 72.5分 | 合格 |
+
+## 3. 运动处方目标
+12周内提升心肺耐力和下肢力量，改善柔韧性。
+
+## 4. 分阶段计划
+### 阶段1（第1-4周）
+- 阶段目标：建立运动习惯，掌握正确动作姿势
+- 周一：快走30分钟，强度40%HRR
+- 周三：徒手深蹲3组×12次，强度40%1-RM
+- 周五：快走30分钟，强度40%HRR
+### 阶段2（第5-8周）
+- 阶段目标：提高运动量和强度
+- 周一：慢跑30分钟，强度50%HRR
+- 周三：哑铃抗阻训练3组×10次，强度60%1-RM
+- 周五：慢跑35分钟，强度55%HRR
+### 阶段3（第9-12周）
+- 阶段目标：巩固训练成果，优化运动表现
+- 周一：间歇跑40分钟，强度65%HRR
+- 周三：综合力量训练4组×8次，强度70%1-RM
+- 周五：慢跑40分钟，强度60%HRR
+
+## 5. 运动禁忌
+避免憋气发力和突然的高强度冲刺。
+
+## 6. 进度监测
+每4周复测一次心肺耐力和力量指标。
+
+## 7. 营养建议
+保证优质蛋白摄入，运动前后适量补水。
+
+本运动推荐仅供参考，请您务必在专业人士指导下进行运动
+<<<PLAN_JSON>>>
+{"total_weeks":12,"phases":[{"name":"阶段1","start_week":1,"end_week":4,"goal":"建立运动习惯，掌握正确动作姿势","schedule":{"mon":"快走30分钟，强度40%HRR","tue":"休息","wed":"徒手深蹲3组×12次，强度40%1-RM","thu":"休息","fri":"快走30分钟，强度40%HRR","sat":"休息","sun":"休息"},"notes":"循序渐进，避免憋气发力"},{"name":"阶段2","start_week":5,"end_week":8,"goal":"提高运动量和强度","schedule":{"mon":"慢跑30分钟，强度50%HRR","tue":"休息","wed":"哑铃抗阻训练3组×10次，强度60%1-RM","thu":"休息","fri":"慢跑35分钟，强度55%HRR","sat":"休息","sun":"休息"},"notes":"循序渐进，避免憋气发力"},{"name":"阶段3","start_week":9,"end_week":12,"goal":"巩固训练成果，优化运动表现","schedule":{"mon":"间歇跑40分钟，强度65%HRR","tue":"休息","wed":"综合力量训练4组×8次，强度70%1-RM","thu":"休息","fri":"慢跑40分钟，强度60%HRR","sat":"休息","sun":"休息"},"notes":"循序渐进，避免憋气发力"}]}
+<<<END_PLAN_JSON>>>"""
+
+
+class MockLLMServer:
+    """本地OpenAI兼容的LLM桩服务器，支持可配置的首字延迟、生成速率、错误注入和SSE流式输出
+
+    用于在不访问DeepSeek的情况下压测和基准测试检索、知识图谱及评分链路的自身开销。
+    同时模拟DeepSeek的前缀缓存：usage中返回prompt_cache_hit_tokens/prompt_cache_miss_tokens，
+    设置prefill_tokens_per_second时未命中缓存的输入token按该速率计入首字延迟；gzip时流式响应按Content-Encoding: gzip压缩。
+    """
+    # 前缀缓存的块大小（按字符近似DeepSeek的64 token缓存单元）
+    CACHE_BLOCK_CHARS = 64
+    CACHE_MAX_ENTRIES = 100000
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 ttft: float = 0.2,
+                 tokens_per_second: float = 50.0,
+                 error_rate: float = 0.0,
+                 error_status: int = 503,
+                 stall_rate: float = 0.0,
+                 stall_seconds: float = 10.0,
+                 response_text: Optional[str] = None,
+                 response_tokens: Optional[int] = None,
+                 token_chars: int = 2,
+                 prefill_tokens_per_second: float = 0.0,
+                 gzip: bool = False,
+                 seed: Optional[int] = None):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.token_chars = max(1, token_chars)
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.gzip = gzip
+        self._cached_prefixes = set()
+        self.tokens = self._build_tokens(response_text or DEFAULT_RESPONSE_TEXT, response_tokens)
+        self.random = random.Random(seed)
+        self.counter = TokenCounter()
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockLLMServer":
+        """在后台线程启动服务器"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _build_tokens(self, text: str, response_tokens: Optional[int]) -> List[str]:
+        """把响应文本切分为token序列，指定response_tokens时循环或截断到该长度"""
+        tokens = [text[i:i + self.token_chars] for i in range(0, len(text), self.token_chars)]
+        if response_tokens is not None and tokens:
+            tokens = (tokens * (response_tokens // len(tokens) + 1))[:response_tokens]
+        return tokens
+
+    def _roll(self, rate: float) -> bool:
+        with self._lock:
+            return rate > 0 and self.random.random() < rate
+
+    def _prompt_cache(self, payload: Dict[str, Any]) -> Tuple[int, int]:
+        """按消息顺序拼接输入，以整块前缀的哈希判断命中并写入缓存，返回(命中, 未命中)token数"""
+        text = "".join(str(m.get("content", "")) for m in payload.get("messages", []))
+        prompt_tokens = sum(self.counter.count(str(m.get("content", ""))) for m in payload.get("messages", []))
+        digest = hashlib.blake2b(digest_size=16)
+        prefixes = []
+        for end in range(self.CACHE_BLOCK_CHARS, len(text) + 1, self.CACHE_BLOCK_CHARS):
+            digest.update(text[end - self.CACHE_BLOCK_CHARS:end].encode("utf-8"))
+            prefixes.append(digest.digest())
+        with self._lock:
+            hit_blocks = 0
+            for prefix in prefixes:
+                if prefix not in self._cached_prefixes:
+                    break
+                hit_blocks += 1
+            if len(self._cached_prefixes) + len(prefixes) > self.CACHE_MAX_ENTRIES:
+                self._cached_prefixes.clear()
+            self._cached_prefixes.update(prefixes)
+        hit = min(self.counter.count(text[:hit_blocks * self.CACHE_BLOCK_CHARS]), prompt_tokens)
+        return hit, prompt_tokens - hit
+
+    def _usage(self, cache: Tuple[int, int], completion_tokens: int) -> Dict[str, int]:
+        hit, miss = cache
+        return {
+            "prompt_tokens": hit + miss,
+            "completion_tokens": completion_tokens,
+            "total_tokens": hit + miss + completion_tokens,
+            "prompt_cache_hit_tokens": hit,
+            "prompt_cache_miss_tokens": miss
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, body: Dict[str, Any]):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": "mock-chat", "object": "model"}]})
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+
+                with server._lock:
+                    server.request_count += 1
+                if server._roll(server.error_rate):
+                    self._send_json(server.error_status, {"error": {"message": "injected error"}})
+                    return
+
+                cache = server._prompt_cache(payload)
+                delay = server.ttft + (server.stall_seconds if server._roll(server.stall_rate) else 0.0)
+                if server.prefill_tokens_per_second > 0:
+                    delay += cache[1] / server.prefill_tokens_per_second
+                tokens = server.tokens[:payload.get("max_tokens") or len(server.tokens)]
+                model = payload.get("model", "mock-chat")
+                try:
+                    if payload.get("stream"):
+                        self._stream(payload, model, tokens, delay, cache)
+                    else:
+                        time.sleep(delay + len(tokens) / server.tokens_per_second)
+                        self._send_json(200, {
+                            "id": f"mock-{uuid.uuid4().hex}",
+                            "object": "chat.completion",
+                            "created": int(time.time()),
+                            "model": model,
+                            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                                         "finish_reason": "stop"}],
+                            "usage": server._usage(cache, len(tokens))
+                        })
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def _stream(self, payload: Dict[str, Any], model: str, tokens: List[str], delay: float,
+                        cache: Tuple[int, int]):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                # 每个事件压缩后立即同步刷新，客户端逐块解压仍能实时收到增量
+                compressor = zlib.compressobj(wbits=31) if server.gzip else None
+                if compressor is not None:
+                    self.send_header("Content-Encoding", "gzip")
+                self.end_headers()
+                time.sleep(delay)
+
+                def write_event(data: bytes):
+                    if compressor is not None:
+                        data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                    self._write_chunk(data)
+
+                completion_id = f"mock-{uuid.uuid4().hex}"
+                interval = 1.0 / server.tokens_per_second
+                for token in tokens:
+                    event = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                             "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                    write_event(b"data: " + json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n\n")
+                    time.sleep(interval)
+
+                final = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                if (payload.get("stream_options") or {}).get("include_usage"):
+                    final["usage"] = server._usage(cache, len(tokens))
+                write_event(b"data: " + json.dumps(final).encode("utf-8") + b"\n\n")
+                write_event(b"data: [DONE]\n\n")
+                if compressor is not None:
+                    self._write_chunk(compressor.flush())
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容LLM桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft", type=float, default=0.2, help="首字延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="生成速率")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的请求比例")
+    parser.add_argument("--error-status", type=int, default=503, help="注入错误的HTTP状态码")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="首字前卡顿的请求比例")
+    parser.add_argument("--stall-seconds", type=float, default=10.0, help="卡顿时长（秒）")
+    parser.add_argument("--response-file", help="响应文本文件，默认使用内置报告")
+    parser.add_argument("--response-tokens", type=int, help="响应token数（循环或截断响应文本）")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="未命中前缀缓存的输入token处理速率，计入首字延迟（0表示不模拟）")
+    parser.add_argument("--gzip", action="store_true", help="流式响应使用Content-Encoding: gzip")
+    parser.add_argument("--seed", type=int, help="错误注入随机种子")
+    args = parser.parse_args()
+
+    response_text = None
+    if args.response_file:
+        with open(args.response_file, 'r', encoding='utf-8') as f:
+            response_text = f.read()
+
+    server = MockLLMServer(args.host, args.port, ttft=args.ttft, tokens_per_second=args.tokens_per_second,
+                           error_rate=args.error_rate, error_status=args.error_status,
+                           stall_rate=args.stall_rate, stall_seconds=args.stall_seconds,
+                           response_text=response_text, response_tokens=args.response_tokens,
+                           prefill_tokens_per_second=args.prefill_tokens_per_second, gzip=args.gzip,
+                           seed=args.seed)
+    print(f"Mock LLM服务器已启动: {server.base_url}（将 deepseek_api_base_url 指向该地址）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import logging
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCounter:
+    """本地token计数器：优先使用本地DeepSeek分词器，不可用时按字符类别估算
+
+    估算规则参考DeepSeek官方换算：1个中文字符约0.6 token，1个英文字符约0.3 token。
+    """
+    def __init__(self, tokenizer_path: Optional[str] = None):
+        self.tokenizer = None
+        if tokenizer_path and os.path.isdir(tokenizer_path):
+            try:
+                from transformers import AutoTokenizer
+                self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path, trust_remote_code=True)
+                logger.info(f"已加载本地分词器: {tokenizer_path}")
+            except Exception as e:
+                logger.warning(f"加载本地分词器失败，使用字符估算: {str(e)}")
+
+    def count(self, text: str) -> int:
+        """计算文本的token数"""
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        non_ascii = len(text) - len(text.encode('ascii', 'ignore'))
+        return math.ceil(non_ascii * 0.6 + (len(text) - non_ascii) * 0.3)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """将文本截断到不超过max_tokens个token"""
+        if max_tokens <= 0:
+            return ""
+        if self.tokenizer is not None:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)
+            if len(ids) <= max_tokens:
+                return text
+            return self.tokenizer.decode(ids[:max_tokens])
+        if self.count(text) <= max_tokens:
+            return text
+        # 二分查找满足预算的最长前缀
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+
+class ContextSnippet:
+    """一条候选上下文片段（所属分区、文本、相关度分数、原始顺序）"""
+    def __init__(self, section: str, text: str, score: float = 0.0, order: int = 0):
+        self.section = section
+        self.text = text
+        self.score = score
+        self.order = order
+        self.tokens = 0
+
+
+class PromptBudgeter:
+    """按相关度分数在token预算内挑选上下文片段，并统计各分区的token用量"""
+    def __init__(self, counter: TokenCounter, section_weights: Optional[Dict[str, float]] = None,
+                 min_snippet_tokens: int = 64):
+        self.counter = counter
+        self.section_weights = section_weights or {}
+        self.min_snippet_tokens = min_snippet_tokens
+
+    def fit(self, snippets: List[ContextSnippet], budget: int) -> Tuple[List[ContextSnippet], Dict[str, Any]]:
+        """在budget个token内按加权分数从高到低选取片段，返回(按原始顺序排列的入选片段, 用量报告)"""
+        for snippet in snippets:
+            snippet.tokens = self.counter.count(snippet.text)
+
+        ranked = sorted(snippets, key=lambda s: (-s.score * self.section_weights.get(s.section, 1.0), s.order))
+        remaining = max(0, budget)
+        selected = []
+        for snippet in ranked:
+            if snippet.tokens <= remaining:
+                selected.append(snippet)
+                remaining -= snippet.tokens
+            elif remaining >= self.min_snippet_tokens:
+                # 预算不足以容纳整条片段时截断保留前半部分
+                text = self.counter.truncate(snippet.text, remaining)
+                truncated = ContextSnippet(snippet.section, text, snippet.score, snippet.order)
+                truncated.tokens = self.counter.count(text)
+                selected.append(truncated)
+                remaining -= truncated.tokens
+
+        selected.sort(key=lambda s: s.order)
+        return selected, self._build_report(snippets, selected, budget)
+
+    def _build_report(self, snippets: List[ContextSnippet], selected: List[ContextSnippet], budget: int) -> Dict[str, Any]:
+        """统计各分区候选/入选片段数和token数"""
+        sections: Dict[str, Dict[str, int]] = {}
+        for snippet in snippets:
+            stats = sections.setdefault(snippet.section, {"candidates": 0, "candidate_tokens": 0, "selected": 0, "tokens": 0})
+            stats["candidates"] += 1
+            stats["candidate_tokens"] += snippet.tokens
+        for snippet in selected:
+            stats = sections[snippet.section]
+            stats["selected"] += 1
+            stats["tokens"] += snippet.tokens
+        return {
+            "budget": budget,
+            "used": sum(s.tokens for s in selected),
+            "sections": sections
+        }
@@ -0,0 +1,52 @@
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+
+def prompt_cache_tokens(usage: Optional[Dict[str, Any]]) -> Tuple[Optional[int], Optional[int]]:
+    """从API返回的usage中解析(命中缓存, 未命中缓存)的输入token数
+
+    DeepSeek返回prompt_cache_hit_tokens/prompt_cache_miss_tokens；其他OpenAI兼容服务返回
+    prompt_tokens_details.cached_tokens，未命中部分按prompt_tokens相减。usage不含缓存信息时返回(None, None)。
+    """
+    if not usage:
+        return None, None
+    hit = usage.get("prompt_cache_hit_tokens")
+    miss = usage.get("prompt_cache_miss_tokens")
+    if hit is None and miss is None:
+        details = usage.get("prompt_tokens_details") or {}
+        hit = details.get("cached_tokens")
+        if hit is None:
+            return None, None
+        prompt_tokens = usage.get("prompt_tokens")
+        miss = max(prompt_tokens - hit, 0) if prompt_tokens is not None else None
+    return hit or 0, miss or 0
+
+
+class PromptCacheStats:
+    """按端点累计的提示词前缀缓存命中情况（线程安全）"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, int]] = {}
+
+    def record(self, endpoint: Optional[str], usage: Optional[Dict[str, Any]]) -> Tuple[Optional[int], Optional[int]]:
+        """记录一次请求的usage，返回解析出的(命中, 未命中)token数"""
+        hit, miss = prompt_cache_tokens(usage)
+        with self._lock:
+            counts = self._endpoints.setdefault(endpoint or "unknown", {
+                "requests": 0, "reported": 0, "hit_tokens": 0, "miss_tokens": 0
+            })
+            counts["requests"] += 1
+            if hit is not None:
+                counts["reported"] += 1
+                counts["hit_tokens"] += hit
+                counts["miss_tokens"] += miss or 0
+        return hit, miss
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """各端点的累计请求数、带缓存信息的请求数、命中/未命中token数和命中率"""
+        with self._lock:
+            result = {}
+            for endpoint, counts in self._endpoints.items():
+                total = counts["hit_tokens"] + counts["miss_tokens"]
+                result[endpoint] = dict(counts, hit_ratio=counts["hit_tokens"] / total if total else None)
+            return result
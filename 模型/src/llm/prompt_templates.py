@@ -0,0 +1,35 @@
+from string import Formatter
+from typing import Any, List, Optional, Tuple
+
+_FORMATTER = Formatter()
+
+
+class PromptTemplate:
+    """预编译的提示词模板：构造时把{name}/{name:spec}占位符解析为(静态文本, 字段, 格式)序列
+
+    渲染时只做字段格式化和一次join，不再重复解析模板或拼接大段常量。
+    """
+    __slots__ = ("source", "fields", "_parts")
+
+    def __init__(self, source: str):
+        self.source = source
+        parts: List[Tuple[str, Optional[str], str]] = []
+        for literal, field, spec, conversion in _FORMATTER.parse(source):
+            if conversion:
+                raise ValueError(f"提示词模板不支持!{conversion}转换: {field}")
+            parts.append((literal, field or None, spec or ""))
+        self._parts = tuple(parts)
+        self.fields = tuple(dict.fromkeys(field for _, field, _ in parts if field))
+
+    def render(self, **values: Any) -> str:
+        """按字段名填充模板，缺少字段时抛出KeyError"""
+        chunks = []
+        for literal, field, spec in self._parts:
+            chunks.append(literal)
+            if field is not None:
+                value = values[field]
+                chunks.append(format(value, spec) if spec else str(value))
+        return "".join(chunks)
+
+    def __repr__(self) -> str:
+        return f"PromptTemplate(fields={self.fields})"
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+class ResponseRecorder:
+    """LLM响应录制/回放器：record模式把真实响应写入磁盘，replay模式按请求内容回放
+
+    录制文件以请求体的规范化JSON哈希命名，同一提示词和参数总是命中同一份录制。
+    """
+    MODES = ("off", "record", "replay")
+
+    # 不影响生成内容的请求字段，不参与哈希
+    _VOLATILE_FIELDS = ("stream_options",)
+
+    def __init__(self, directory: str, mode: str = "off", realtime: bool = False):
+        if mode not in self.MODES:
+            raise ValueError(f"不支持的录制模式: {mode}，可选: {', '.join(self.MODES)}")
+        self.directory = directory
+        self.mode = mode
+        self.realtime = realtime
+        if mode == "record":
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def key(self, payload: Dict[str, Any]) -> str:
+        """计算请求体的录制键"""
+        stable = {k: v for k, v in payload.items() if k not in self._VOLATILE_FIELDS}
+        canonical = json.dumps(stable, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+    def _path(self, payload: Dict[str, Any]) -> str:
+        return os.path.join(self.directory, f"{self.key(payload)}.json")
+
+    def _load(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        path = self._path(payload)
+        if not os.path.exists(path):
+            raise Exception(f"回放模式下未找到录制响应: {path}")
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save(self, payload: Dict[str, Any], record: Dict[str, Any]):
+        record["payload"] = payload
+        record["recorded_at"] = time.time()
+        path = self._path(payload)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def save_completion(self, payload: Dict[str, Any], response: Dict[str, Any]):
+        """录制一次非流式响应"""
+        self._save(payload, {"kind": "completion", "response": response})
+
+    def load_completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """回放一次非流式响应"""
+        return self._load(payload)["response"]
+
+    def record_stream(self, payload: Dict[str, Any], chunks: Iterable[str],
+                      usage_getter=None) -> Iterator[str]:
+        """边转发边录制流式响应，流完整结束后才写入磁盘"""
+        started = time.monotonic()
+        recorded: List[Dict[str, Any]] = []
+        for chunk in chunks:
+            recorded.append({"t": round(time.monotonic() - started, 4), "text": chunk})
+            yield chunk
+        usage = usage_getter() if usage_getter else {}
+        self._save(payload, {"kind": "stream", "chunks": recorded, "usage": usage})
+
+    def replay_stream(self, payload: Dict[str, Any]) -> Iterator[str]:
+        """回放流式响应，realtime为True时按录制时的时间间隔输出"""
+        record = self._load(payload)
+        started = time.monotonic()
+        for chunk in record["chunks"]:
+            if self.realtime:
+                delay = chunk["t"] - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            yield chunk["text"]
+
+    def load_stream_usage(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return self._load(payload).get("usage")
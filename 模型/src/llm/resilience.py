@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+class CircuitBreaker:
+    """端点熔断器：连续失败达到阈值后熔断，冷却时间过后进入半开状态，同一时间只放行一个试探请求"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _refresh(self, now: float):
+        # 调用方持有锁；冷却结束的熔断器进入半开
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_started_at = None
+
+    @property
+    def state(self) -> str:
+        """当前状态（冷却结束的熔断器视为半开）"""
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def allow_request(self) -> bool:
+        """是否允许向该端点发起请求；半开状态只放行一个试探请求，试探结束（记录成功或失败）前其余请求被拒绝
+
+        返回True即占用试探名额，调用方须随后发起请求。试探超过reset_timeout仍未记录结果（如被取消）时视为丢失，放行新的试探。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                return False
+            if self._probe_started_at is not None and now - self._probe_started_at < self.reset_timeout:
+                return False
+            self._probe_started_at = now
+            return True
+
+    def record_success(self):
+        """记录一次成功，关闭熔断器"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._probe_started_at = None
+
+    def record_failure(self):
+        """记录一次失败，达到阈值或半开试探失败时熔断"""
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started_at = None
+
+
+class LatencyTracker:
+    """滚动窗口记录延迟样本，用于计算对冲请求的触发阈值"""
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """记录一个延迟样本（秒）"""
+        with self._lock:
+            self._samples.append(seconds)
+
+    @property
+    def count(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """计算第p百分位延迟，无样本时返回None"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = min(len(samples) - 1, max(0, int(round(p / 100.0 * (len(samples) - 1)))))
+        return samples[rank]
+
+
+class LLMEndpoint:
+    """单个LLM端点（地址、密钥、模型）及其健康状态"""
+    def __init__(self, name: str, base_url: str, api_key: str, model: str, breaker: CircuitBreaker):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.model = model
+        self.breaker = breaker
+
+    def to_dict(self) -> Dict[str, Any]:
+        """端点健康信息（不包含密钥）"""
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "model": self.model,
+            "state": self.breaker.state
+        }
+
+
+class RequestCancelled(Exception):
+    """请求已被调用方取消（如客户端断开连接）"""
+
+
+class CancelToken:
+    """请求取消令牌：调用方取消时立即执行已注册的回调（如中断上游LLM连接）"""
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def add_callback(self, callback):
+        """注册取消回调，令牌已取消时立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RequestCancelled("请求已取消")
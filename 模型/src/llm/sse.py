@@ -0,0 +1,105 @@
+import time
+from typing import Any, Dict, List, Optional
+
+from src.llm.prompt_cache import prompt_cache_tokens
+
+
+class SSEDecoder:
+    """增量SSE解码器：直接在原始字节块上切分事件，只返回data字段的字节内容
+
+    事件可以跨越任意字节块边界，不做逐行解码，JSON解析可直接作用于返回的bytes。
+    """
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """输入一个字节块，返回其中已完整的事件data列表"""
+        buffer = self._buffer + chunk if self._buffer else chunk
+        if b"\r" in buffer:
+            buffer = buffer.replace(b"\r\n", b"\n")
+
+        payloads = []
+        start = 0
+        while True:
+            end = buffer.find(b"\n\n", start)
+            if end < 0:
+                break
+            data = self._parse_event(buffer[start:end])
+            if data is not None:
+                payloads.append(data)
+            start = end + 2
+
+        self._buffer = buffer[start:]
+        return payloads
+
+    def flush(self) -> List[bytes]:
+        """流结束时处理缓冲区中未以空行结尾的最后一个事件"""
+        buffer, self._buffer = self._buffer, b""
+        data = self._parse_event(buffer.strip(b"\r\n")) if buffer.strip() else None
+        return [data] if data is not None else []
+
+    @staticmethod
+    def _parse_event(block: bytes) -> Optional[bytes]:
+        """提取事件中的data字段（多行data按规范以换行拼接），忽略注释和其他字段"""
+        if block.startswith(b"data:") and b"\n" not in block:
+            data = block[5:]
+            return data[1:] if data.startswith(b" ") else data
+
+        lines = []
+        for line in block.split(b"\n"):
+            if line.startswith(b"data:"):
+                data = line[5:]
+                lines.append(data[1:] if data.startswith(b" ") else data)
+        return b"\n".join(lines) if lines else None
+
+
+class StreamStats:
+    """单次流式生成的性能统计（首字延迟、生成速率、token用量）"""
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.endpoint: Optional[str] = None
+        self.deltas = 0  # 收到的增量事件数
+        self.chars = 0
+        self.usage: Dict[str, Any] = {}
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def completion_tokens(self) -> int:
+        """优先使用API返回的usage，缺失时以增量事件数近似"""
+        return self.usage.get("completion_tokens") or self.deltas
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if self.first_token_at is None or self.finished_at is None:
+            return None
+        elapsed = self.finished_at - self.first_token_at
+        return self.completion_tokens / elapsed if elapsed > 0 else None
+
+    @property
+    def prompt_cache_hit_tokens(self) -> Optional[int]:
+        """命中服务端前缀缓存的输入token数（usage不含缓存信息时为None）"""
+        return prompt_cache_tokens(self.usage)[0]
+
+    @property
+    def prompt_cache_miss_tokens(self) -> Optional[int]:
+        return prompt_cache_tokens(self.usage)[1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "endpoint": self.endpoint,
+            "time_to_first_token": self.time_to_first_token,
+            "total_time": (self.finished_at - self.started_at) if self.finished_at is not None else None,
+            "completion_tokens": self.completion_tokens,
+            "tokens_per_second": self.tokens_per_second,
+            "chars": self.chars,
+            "prompt_cache_hit_tokens": self.prompt_cache_hit_tokens,
+            "prompt_cache_miss_tokens": self.prompt_cache_miss_tokens,
+            "usage": self.usage
+        }
@@ -0,0 +1,111 @@
+from typing import Any, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from src.models.models import INTEGER_METRICS, METRIC_KEYS, Gender, Metric, PhysicalTestInput, score_value
+
+# 性别编码（genders列的取值即下标）
+GENDERS = (Gender.MALE, Gender.FEMALE)
+
+
+class PhysicalTestBatch:
+    """列式的体测数据批次：指标为(n, len(Metric))的float64矩阵（NaN表示未测），不为每条记录创建对象
+
+    column()返回矩阵的列视图（不复制）；row(i)按需构造单条PhysicalTestInput供逐条评分。
+    """
+    __slots__ = ("ages", "genders", "values", "names", "diseases", "exercise_preferences",
+                 "exercise_risk_levels", "uses_equipment")
+
+    def __init__(self, ages: np.ndarray, genders: np.ndarray, values: np.ndarray,
+                 names: Optional[List[str]] = None, diseases: Optional[List[List[str]]] = None,
+                 exercise_preferences: Optional[List[List[str]]] = None,
+                 exercise_risk_levels: Optional[List[Optional[str]]] = None,
+                 uses_equipment: Optional[List[Optional[bool]]] = None):
+        if values.shape != (len(ages), len(Metric)) or len(genders) != len(ages):
+            raise ValueError(f"列长度不一致: ages={len(ages)}, genders={len(genders)}, values={values.shape}")
+        count = len(ages)
+        self.ages = ages
+        self.genders = genders
+        self.values = values
+        self.names = names if names is not None else ["未知用户"] * count
+        self.diseases = diseases if diseases is not None else [None] * count
+        self.exercise_preferences = exercise_preferences if exercise_preferences is not None else [None] * count
+        self.exercise_risk_levels = exercise_risk_levels if exercise_risk_levels is not None else [None] * count
+        self.uses_equipment = uses_equipment if uses_equipment is not None else [None] * count
+
+    @classmethod
+    def from_records(cls, records: Sequence[Any]) -> "PhysicalTestBatch":
+        """从带同名属性的对象构造（PhysicalTestInput或接口的pydantic请求体，性别可以是Gender或"男"/"女"）"""
+        def gender_code(gender) -> int:
+            value = gender.value if isinstance(gender, Gender) else gender
+            return 0 if value == Gender.MALE.value else 1
+
+        # None按float64转换为NaN
+        values = np.array([[getattr(record, key, None) for key in METRIC_KEYS] for record in records],
+                          dtype=np.float64).reshape(len(records), len(Metric))
+        return cls(
+            ages=np.fromiter((record.age for record in records), dtype=np.int16, count=len(records)),
+            genders=np.fromiter((gender_code(record.gender) for record in records), dtype=np.int8, count=len(records)),
+            values=values,
+            names=[getattr(record, "name", None) or "未知用户" for record in records],
+            diseases=[getattr(record, "diseases", None) for record in records],
+            exercise_preferences=[getattr(record, "exercise_preferences", None) for record in records],
+            exercise_risk_levels=[getattr(record, "exercise_risk_level", None) for record in records],
+            uses_equipment=[getattr(record, "uses_equipment", None) for record in records]
+        )
+
+    def __len__(self) -> int:
+        return len(self.ages)
+
+    def column(self, metric: Metric) -> np.ndarray:
+        """某项指标的列视图（不复制）"""
+        return self.values[:, metric]
+
+    def row(self, index: int) -> PhysicalTestInput:
+        user = PhysicalTestInput.__new__(PhysicalTestInput)
+        user.age = int(self.ages[index])
+        user.gender = GENDERS[self.genders[index]]
+        for metric, value in zip(Metric, self.values[index].tolist()):
+            if value != value:
+                value = None
+            elif metric in INTEGER_METRICS:
+                value = int(value)
+            setattr(user, METRIC_KEYS[metric], value)
+        user.name = self.names[index]
+        user.diseases = self.diseases[index] or []
+        user.exercise_preferences = self.exercise_preferences[index] or []
+        user.exercise_risk_level = self.exercise_risk_levels[index]
+        user.uses_equipment = self.uses_equipment[index]
+        return user
+
+    def __iter__(self) -> Iterator[PhysicalTestInput]:
+        return (self.row(i) for i in range(len(self)))
+
+
+class BatchScores:
+    """批量评分结果（列式）：scores为(n, len(Metric))得分矩阵（NaN表示未评），ratings为每行按Metric排列的评级列表"""
+    __slots__ = ("scores", "ratings", "overall_scores", "overall_ratings")
+
+    def __init__(self, count: int):
+        self.scores = np.full((count, len(Metric)), np.nan)
+        self.ratings: List[List[Optional[str]]] = [[None] * len(Metric) for _ in range(count)]
+        self.overall_scores = np.zeros(count)
+        self.overall_ratings: List[str] = [""] * count
+
+    def __len__(self) -> int:
+        return len(self.overall_scores)
+
+    def column(self, metric: Metric) -> np.ndarray:
+        return self.scores[:, metric]
+
+    def records(self) -> Iterable[dict]:
+        """逐行转换为与单条评分相同结构的字典（用于JSON输出）"""
+        for i in range(len(self)):
+            row = self.scores[i]
+            yield {
+                "overall_score": float(self.overall_scores[i]),
+                "overall_rating": self.overall_ratings[i],
+                "individual_scores": {METRIC_KEYS[m]: score_value(row[m]) for m in range(len(Metric)) if row[m] == row[m]},
+                "individual_ratings": {METRIC_KEYS[m]: rating for m, rating in enumerate(self.ratings[i])
+                                       if rating is not None}
+            }
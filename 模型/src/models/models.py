@@ -1,13 +1,116 @@
-from enum import Enum
-from typing import List, Optional, Dict, Any
+from array import array
+from collections.abc import MutableMapping
+from enum import Enum, IntEnum
+from typing import Any, Dict, Iterator, List, Optional
 
 class Gender(Enum):
     """性别枚举"""
     MALE = "男"
     FEMALE = "女"
 
+# 未测指标在数值数组中记为NaN
+_MISSING = float("nan")
+
+
+class Metric(IntEnum):
+    """体质指标，取值即EvaluationResult得分/评级数组和PhysicalTestBatch指标矩阵中的下标"""
+    HEIGHT = 0
+    WEIGHT = 1
+    BMI = 2
+    BODY_FAT_RATE = 3
+    VITAL_CAPACITY = 4
+    MAX_OXYGEN_UPTAKE = 5
+    SIT_AND_REACH = 6
+    SINGLE_LEG_STAND = 7
+    REACTION_TIME = 8
+    GRIP_STRENGTH = 9
+    SIT_UPS_PER_MINUTE = 10
+    PUSH_UPS = 11
+    VERTICAL_JUMP = 12
+    HIGH_KNEES_2MIN = 13
+    SIT_TO_STAND_30S = 14
+
+    @property
+    def key(self) -> str:
+        """字段名（如"body_fat_rate"），与接口请求体、结果字典的键一致"""
+        return self.name.lower()
+
+
+METRIC_KEYS = tuple(metric.key for metric in Metric)
+# 计数类指标，从float64矩阵取出时还原为整数
+INTEGER_METRICS = frozenset({Metric.VITAL_CAPACITY, Metric.SIT_UPS_PER_MINUTE, Metric.PUSH_UPS,
+                             Metric.HIGH_KNEES_2MIN, Metric.SIT_TO_STAND_30S})
+# 字段名、Metric和整数下标都可作为键
+_METRIC_INDEX: Dict[Any, int] = {**{metric.key: int(metric) for metric in Metric}, **{int(metric): int(metric) for metric in Metric}}
+
+
+def _is_present(value) -> bool:
+    return value is not None and value == value
+
+
+def score_value(value: float):
+    """得分数组中的值还原为输出形式：整数得分返回int（100而不是100.0），与改为定长数组存储前的JSON和提示词一致"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+class MetricView(MutableMapping):
+    """定长指标数组的字典视图：键为字段名（也接受Metric），未测/未评的指标不出现在键中"""
+    __slots__ = ("values", "missing")
+
+    def __init__(self, values, missing=_MISSING):
+        self.values = values
+        self.missing = missing
+
+    def __getitem__(self, key):
+        value = self.values[_METRIC_INDEX[key]]
+        if not _is_present(value):
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.values[_METRIC_INDEX[key]] = value
+
+    def __delitem__(self, key):
+        index = _METRIC_INDEX[key]
+        if not _is_present(self.values[index]):
+            raise KeyError(key)
+        self.values[index] = self.missing
+
+    # get/__contains__不经过KeyError，评分汇总按指标逐项读取时更快
+    def get(self, key, default=None):
+        index = _METRIC_INDEX.get(key)
+        if index is None:
+            return default
+        value = self.values[index]
+        return value if value is not None and value == value else default
+
+    def __contains__(self, key) -> bool:
+        index = _METRIC_INDEX.get(key)
+        if index is None:
+            return False
+        value = self.values[index]
+        return value is not None and value == value
+
+    def __iter__(self) -> Iterator[str]:
+        return (METRIC_KEYS[i] for i, value in enumerate(self.values) if value is not None and value == value)
+
+    def __len__(self) -> int:
+        return sum(1 for value in self.values if value is not None and value == value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """普通字典（按指标顺序），用于JSON序列化"""
+        return {METRIC_KEYS[i]: value for i, value in enumerate(self.values) if _is_present(value)}
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+
 class PhysicalTestInput:
     """体质测试输入数据模型"""
+    __slots__ = ("age", "gender", *METRIC_KEYS, "name", "diseases", "exercise_preferences", "exercise_risk_level",
+                 "uses_equipment")
+
     def __init__(self,
                  age: int,
                  gender: Gender,
@@ -55,6 +158,19 @@ class PhysicalTestInput:
         self.exercise_risk_level = exercise_risk_level
         self.uses_equipment = uses_equipment
 
+    @classmethod
+    def from_fields(cls, source, **overrides) -> "PhysicalTestInput":
+        """从带同名属性的对象（如接口的pydantic请求体）构造，overrides覆盖对应字段；列表字段直接引用不复制"""
+        user = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(user, name, overrides[name] if name in overrides else getattr(source, name, None))
+        user.diseases = user.diseases or []
+        user.exercise_preferences = user.exercise_preferences or []
+        return user
+
+    def metric(self, metric: Metric) -> Optional[float]:
+        return getattr(self, METRIC_KEYS[metric])
+
     def to_dict(self) -> Dict[str, Any]:
         """将模型转换为字典格式"""
         result = {
@@ -68,39 +184,103 @@ class PhysicalTestInput:
         }
         
         # 添加可选的体质指标
-        metrics = [
-            "height", "weight", "bmi", "body_fat_rate", "vital_capacity",
-            "max_oxygen_uptake", "sit_and_reach", "single_leg_stand",
-            "reaction_time", "grip_strength", "sit_ups_per_minute",
-            "push_ups", "vertical_jump", "high_knees_2min", "sit_to_stand_30s"
-        ]
-        
-        for metric in metrics:
+        for metric in METRIC_KEYS:
             value = getattr(self, metric)
             if value is not None:
                 result[metric] = value
         
         return result
 
+
+class FailedReport:
+    """分析或报告准备失败时的报告：产出一条错误信息；请求合并据此识别失败结果，不缓存回放"""
+    __slots__ = ("message",)
+
+    def __init__(self, message: str):
+        self.message = message
+
+    def __iter__(self) -> Iterator[str]:
+        yield self.message
+
+
 class EvaluationResult:
-    """评估结果数据模型"""
-    def __init__(self):
-        self.individual_scores: Dict[str, float] = {}  # 各项指标得分
-        self.individual_ratings: Dict[str, str] = {}  # 各项指标评级
+    """评估结果数据模型（各项得分、评级存放在按Metric下标的定长数组中）"""
+    __slots__ = ("scores", "ratings", "individual_scores", "individual_ratings", "overall_score", "overall_rating",
+                 "basic_analysis", "exercise_prescription", "stream_stats", "retrieval_report", "prompt_budget_report")
+
+    def __init__(self, scores=None, ratings: Optional[List[Optional[str]]] = None):
+        """scores/ratings可传入外部存储（如批量评分结果矩阵的行），各指标直接写入其中"""
+        self.scores = scores if scores is not None else array("d", [_MISSING]) * len(Metric)
+        self.ratings = ratings if ratings is not None else [None] * len(Metric)
+        self.individual_scores = MetricView(self.scores)  # 各项指标得分
+        self.individual_ratings = MetricView(self.ratings, None)  # 各项指标评级
         self.overall_score: float = 0.0  # 综合得分
         self.overall_rating: str = ""  # 综合评级
         self.basic_analysis: str = ""  # 基础分析报告
         self.exercise_prescription = None  # 运动处方
+        self.stream_stats = None  # 报告流式生成统计
+        self.retrieval_report = None  # 报告上下文各检索来源的取舍
+        self.prompt_budget_report = None  # 提示词各分区的token用量
+
+    def scores_dict(self) -> Dict[str, Any]:
+        """各项指标得分的普通字典（用于JSON输出，整数得分为int）"""
+        return {METRIC_KEYS[i]: score_value(value) for i, value in enumerate(self.scores) if value == value}
+
+    def set_metric(self, metric: Metric, score: float, rating: str):
+        self.scores[metric] = score
+        self.ratings[metric] = rating
+
 
 class ExercisePhase:
     """运动阶段计划模型"""
-    def __init__(self, weeks: str, goal: str, plan: str):
+    # 每周训练安排的日期键，与Java端计划数据保持一致
+    DAY_KEYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+    DAY_NAMES = {"mon": "周一", "tue": "周二", "wed": "周三", "thu": "周四", "fri": "周五", "sat": "周六", "sun": "周日"}
+
+    def __init__(self, weeks: str, goal: str, plan: str,
+                 title: str = "",
+                 start_week: Optional[int] = None,
+                 end_week: Optional[int] = None,
+                 schedule: Optional[Dict[str, str]] = None,
+                 notes: str = ""):
         self.weeks = weeks
         self.goal = goal
         self.plan = plan
+        self.title = title
+        self.start_week = start_week
+        self.end_week = end_week
+        self.schedule = schedule or {}  # 日期键 -> 当日训练安排
+        self.notes = notes
+
+    def to_plan_data(self) -> Dict[str, Any]:
+        """转换为Java端plan_data中的阶段格式"""
+        return {
+            "title": self.title or self.weeks,
+            "startWeek": self.start_week,
+            "endWeek": self.end_week,
+            "goal": self.goal,
+            "notes": self.notes,
+            "week": [
+                {
+                    "dayKey": key,
+                    "dayName": self.DAY_NAMES[key],
+                    "summary": self.schedule.get(key, ""),
+                    "detail": self.schedule.get(key, "")
+                }
+                for key in self.DAY_KEYS
+            ]
+        }
 
 class ExercisePrescription:
     """运动处方模型"""
     def __init__(self, total_weeks: int):
         self.total_weeks = total_weeks
-        self.phases: List[ExercisePhase] = []
\ No newline at end of file
+        self.phases: List[ExercisePhase] = []
+        self.structured = False  # 阶段计划是否来自大模型的结构化输出
+        self.complete = False  # 结构化输出是否已完整解析
+
+    def to_plan_data(self) -> Optional[Dict[str, Any]]:
+        """转换为Java端plan_data格式，仅结构化输出的处方包含逐日安排"""
+        if not self.structured or not self.phases:
+            return None
+        return {"phases": [phase.to_plan_data() for phase in self.phases]}
@@ -4,7 +4,8 @@ import faiss
 import os
 import json
 from typing import List, Dict, Any, Optional, Tuple
-from sentence_transformers import SentenceTransformer, CrossEncoder
+from src.inference.client import load_cross_encoder, load_sentence_transformer
+from src.utils.tracing import span, traced
 
 class FAISSRetriever:
     """基于FAISS的向量检索器"""
@@ -29,7 +30,7 @@ class FAISSRetriever:
             if os.path.exists(faiss_index_path) and os.path.exists(embeddings_dir):
                 print(f"正在加载预计算的FAISS索引和嵌入模型")
                 # 加载FAISS索引
-                self.index = faiss.read_index(faiss_index_path)
+                self.index = self._read_index(faiss_index_path)
                 
                 # 加载文档映射
                 slice_mapping_path = os.path.join(embeddings_dir, "slice_mapping.json")
@@ -43,7 +44,7 @@ class FAISSRetriever:
             else:
                 # 加载嵌入模型
                 if hasattr(self.config, 'embedding_model') and self.config.embedding_model:
-                    self.embedding_model = SentenceTransformer(self.config.embedding_model)
+                    self.embedding_model = load_sentence_transformer(self.config, self.config.embedding_model)
                     # 获取模型维度
                     sample_embedding = self.embedding_model.encode(["sample"])
                     self.dimension = sample_embedding.shape[1]
@@ -53,6 +54,15 @@ class FAISSRetriever:
         except Exception as e:
             print(f"初始化检索器失败: {str(e)}")
     
+    def _read_index(self, index_path: str):
+        """读取FAISS索引，配置faiss_mmap时以mmap方式映射文件（多个worker进程共享同一份页缓存）"""
+        if getattr(self.config, 'faiss_mmap', False):
+            try:
+                return faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+            except Exception as e:
+                print(f"mmap读取索引失败，改为完整加载: {str(e)}")
+        return faiss.read_index(index_path)
+    
     def add_documents(self, documents: List[Dict[str, Any]]):
         """添加文档到检索器"""
         if not self.embedding_model or not self.index:
@@ -84,10 +94,12 @@ class FAISSRetriever:
             k = top_k if top_k is not None else getattr(self.config, 'retriever_top_k', 10)
             
             # 生成查询向量
-            query_embedding = self.embedding_model.encode([query])[0].reshape(1, -1)
+            with span("rag.embed"):
+                query_embedding = self.embedding_model.encode([query])[0].reshape(1, -1)
             
             # 搜索相似文档
-            distances, indices = self.index.search(query_embedding, k)
+            with span("rag.faiss"):
+                distances, indices = self.index.search(query_embedding, k)
             
             # 格式化结果
             results = []
@@ -115,15 +127,16 @@ class FAISSRetriever:
         """加载FAISS索引"""
         try:
             if os.path.exists(index_path):
-                self.index = faiss.read_index(index_path)
+                self.index = self._read_index(index_path)
         except Exception as e:
             print(f"加载索引失败: {str(e)}")
 
 class BGEReranker:
     """基于BGE的结果重排器"""
-    def __init__(self, model_path: str = "bge-reranker-v2-m3"):
+    def __init__(self, model_path: str = "bge-reranker-v2-m3", config=None):
         self.reranker_model = None
         self.model_path = model_path
+        self.config = config
         
         # 初始化重排器
         self._initialize_reranker()
@@ -135,10 +148,10 @@ class BGEReranker:
             # 检查本地模型路径是否存在
             if os.path.exists(self.model_path) and os.path.isdir(self.model_path):
                 print(f"正在加载本地重排器模型: {self.model_path}")
-                self.reranker_model = CrossEncoder(self.model_path, trust_remote_code=True)
+                self.reranker_model = load_cross_encoder(self.config, self.model_path, trust_remote_code=True)
             else:
                 print(f"本地模型路径不存在，尝试加载默认模型")
-                self.reranker_model = CrossEncoder("BAAI/bge-reranker-large")
+                self.reranker_model = load_cross_encoder(self.config, "BAAI/bge-reranker-large")
         except Exception as e:
             print(f"初始化重排器失败: {str(e)}")
     
@@ -152,7 +165,8 @@ class BGEReranker:
             pairs = [[query, doc.get('content', '')] for doc in documents]
             
             # 获取重排分数
-            scores = self.reranker_model.predict(pairs)
+            with span("rag.rerank", documents=len(pairs)):
+                scores = self.reranker_model.predict(pairs)
             
             # 添加分数到文档
             for i, doc in enumerate(documents):
@@ -174,12 +188,13 @@ class RAGPipeline:
         
         project_root = getattr(config, 'project_root', '.')
         reranker_model_path = os.path.join(project_root, "bge-reranker-v2-m3")
-        self.reranker = BGEReranker(model_path=reranker_model_path)
+        self.reranker = BGEReranker(model_path=reranker_model_path, config=config)
     
     def add_documents(self, documents: List[Dict[str, Any]]):
         """添加文档到RAG流水线"""
         self.retriever.add_documents(documents)
     
+    @traced("rag.search")
     def search(self, query: str, retrieve_top_k: Optional[int] = None, rerank_top_k: Optional[int] = None) -> List[Dict[str, Any]]:
         """执行RAG搜索"""
         # 1. 检索相关文档
@@ -0,0 +1,193 @@
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        # wbits=31：带gzip头的deflate流
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """同步刷新：输出当前全部数据，客户端可立即解压（用于SSE逐事件推送）"""
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encodings() -> Dict[str, Tuple[type, int]]:
+    """服务端支持的压缩算法（按优先级排列）及默认压缩级别，brotli/zstd依赖未安装时跳过"""
+    encodings = {}
+    if zstandard is not None:
+        encodings["zstd"] = (_ZstdEncoder, 3)
+    if brotli is not None:
+        encodings["br"] = (_BrotliEncoder, 4)
+    encodings["gzip"] = (_GzipEncoder, 6)
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str, supported: List[str]) -> Optional[str]:
+    """按Accept-Encoding的q值和服务端优先级选择压缩算法，都不可接受时返回None"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    best, best_q = None, 0.0
+    for name in supported:
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class CompressionMiddleware:
+    """按Accept-Encoding协商zstd/br/gzip压缩的ASGI中间件
+
+    普通响应小于minimum_size时不压缩；流式响应（SSE、NDJSON）每个分片压缩后立即刷新，
+    不会因压缩器内部缓冲而推迟事件送达客户端。
+    """
+    # 已压缩或不宜压缩的内容类型
+    SKIP_CONTENT_TYPES = ("image/", "video/", "audio/", "application/zip", "application/gzip",
+                          "application/vnd.apache.arrow")
+
+    def __init__(self, app, minimum_size: int = 1024, levels: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoders = {}
+        for name, (encoder_cls, level) in available_encodings().items():
+            self.encoders[name] = (encoder_cls, (levels or {}).get(name, level))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        encoding = negotiate_encoding(headers.get("accept-encoding", ""), list(self.encoders))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressedResponder(self, encoding)(self.app, scope, receive, send)
+
+
+class _CompressedResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, app, scope, receive, send):
+        self.send = send
+        await app(scope, receive, self._send)
+
+    def _should_skip(self, headers) -> bool:
+        for key, value in headers:
+            key = key.lower()
+            if key == b"content-encoding":
+                return True
+            if key == b"content-type" and value.decode("latin-1").startswith(self.middleware.SKIP_CONTENT_TYPES):
+                return True
+        return False
+
+    def _compressed_headers(self, body_length: Optional[int]):
+        headers = [(k, v) for k, v in self.start_message["headers"] if k.lower() not in (b"content-length", b"vary")]
+        vary = [v for k, v in self.start_message["headers"] if k.lower() == b"vary"]
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+        if body_length is not None:
+            headers.append((b"content-length", str(body_length).encode("latin-1")))
+        return headers
+
+    async def _send(self, message):
+        if message["type"] == "http.response.start":
+            # 等到第一个body分片才能判断是普通响应还是流式响应
+            self.start_message = dict(message)
+            self.passthrough = self._should_skip(message.get("headers", []))
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.passthrough:
+            if self.start_message is not None:
+                await self.send(self.start_message)
+                self.start_message = None
+            await self.send(message)
+            return
+
+        encoder_cls, level = self.middleware.encoders[self.encoding]
+        if self.encoder is None:
+            if not more_body:
+                # 普通响应：一次性压缩，过小时原样返回
+                if len(body) < self.middleware.minimum_size:
+                    await self.send(self.start_message)
+                    await self.send(message)
+                    return
+                encoder = encoder_cls(level)
+                compressed = encoder.compress(body) + encoder.finish()
+                self.start_message["headers"] = self._compressed_headers(len(compressed))
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+            # 流式响应：分块传输，每个分片刷新后立即发送
+            self.encoder = encoder_cls(level)
+            self.start_message["headers"] = self._compressed_headers(None)
+            await self.send(self.start_message)
+
+        data = self.encoder.compress(body)
+        data += self.encoder.flush() if more_body else self.encoder.finish()
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
@@ -1,20 +1,23 @@
 import os
-import pandas as pd
 import json
-from typing import List, Dict, Any, Optional
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 class FitnessDataLoader:
     """体质数据加载器"""
     def __init__(self, data_dir: str = "data"):
         self.data_dir = data_dir
-        
-        # 确保数据目录存在
-        if not os.path.exists(self.data_dir):
-            os.makedirs(self.data_dir)
     
-    def load_test_data(self, filename: str) -> Optional[pd.DataFrame]:
+    def _ensure_data_dir(self):
+        """写入前确保数据目录存在"""
+        os.makedirs(self.data_dir, exist_ok=True)
+    
+    def load_test_data(self, filename: str) -> Optional["pd.DataFrame"]:
         """加载测试数据"""
         try:
+            import pandas as pd
             file_path = os.path.join(self.data_dir, filename)
             
             # 根据文件扩展名选择加载方法
@@ -61,6 +64,7 @@ class FitnessDataLoader:
     def save_exercise_preferences(self, preferences: List[str]):
         """保存运动偏好列表"""
         try:
+            self._ensure_data_dir()
             file_path = os.path.join(self.data_dir, "exercise_preferences.json")
             
             with open(file_path, 'w', encoding='utf-8') as f:
@@ -96,6 +100,7 @@ class FitnessDataLoader:
     def save_disease_list(self, diseases: List[str]):
         """保存疾病列表"""
         try:
+            self._ensure_data_dir()
             file_path = os.path.join(self.data_dir, "diseases.json")
             
             with open(file_path, 'w', encoding='utf-8') as f:
@@ -129,6 +134,7 @@ class FitnessDataLoader:
     def save_evaluation_standards(self, standards: Dict[str, Any]):
         """保存评估标准"""
         try:
+            self._ensure_data_dir()
             file_path = os.path.join(self.data_dir, "evaluation_standards.json")
             
             with open(file_path, 'w', encoding='utf-8') as f:
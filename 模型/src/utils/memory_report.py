@@ -0,0 +1,310 @@
+import argparse
+import gc
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 不计入对象大小的类型（共享的模块、类和函数对象）
+_SKIP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+               types.CodeType, types.FrameType)
+
+
+def _native_size(obj) -> Optional[int]:
+    """张量/数组/索引等原生内存的大小，非此类对象返回None"""
+    module = type(obj).__module__ or ""
+    if module.startswith("numpy") and hasattr(obj, "nbytes"):
+        return int(obj.nbytes)
+    if module.startswith("pandas") and hasattr(obj, "memory_usage"):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if module.startswith("faiss"):
+        # 平铺类索引的向量存储为ntotal*code_size；以mmap方式读取的索引实际由页缓存承担
+        ntotal = getattr(obj, "ntotal", None)
+        if ntotal is None:
+            return sys.getsizeof(obj)
+        code_size = getattr(obj, "code_size", None)
+        if code_size is None:
+            code_size = getattr(obj, "d", 0) * 4
+        return int(ntotal * code_size)
+    if callable(getattr(obj, "parameters", None)) and callable(getattr(obj, "buffers", None)):
+        # torch模块（SentenceTransformer、CrossEncoder底层模型）：参数和缓冲区
+        tensors = list(obj.parameters()) + list(obj.buffers())
+        return int(sum(t.numel() * t.element_size() for t in tensors))
+    return None
+
+
+def deep_sizeof(obj, seen: Optional[set] = None) -> int:
+    """对象及其引用的容器、属性的总字节数（估算）；seen在多次调用间共享时，同一对象只计一次"""
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _SKIP_TYPES):
+            continue
+        seen.add(id(current))
+        native = _native_size(current)
+        if native is not None:
+            total += native
+            continue
+        total += sys.getsizeof(current)
+        if isinstance(current, (str, bytes, bytearray, int, float, bool)) or current is None:
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            stack.extend(current)
+        else:
+            attributes = getattr(current, "__dict__", None)
+            if attributes is not None:
+                stack.append(attributes)
+            for name in getattr(type(current), "__slots__", ()):
+                if hasattr(current, name):
+                    stack.append(getattr(current, name))
+    return total
+
+
+def _count(obj) -> Optional[int]:
+    ntotal = getattr(obj, "ntotal", None)
+    if ntotal is not None:
+        return int(ntotal)
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+def service_components(service) -> Dict[str, Any]:
+    """服务中按组件划分的主要内存占用对象（组件名 -> 对象），未加载的组件不列出"""
+    components = {}
+    kg = getattr(service, "kg_manager", None)
+    if kg is not None:
+        components["kg.triples"] = kg.triples
+        components["kg.entities"] = kg.entities
+        components["kg.relations"] = kg.relations
+        components["kg.entity_index"] = (kg.entity_to_index, kg.index_to_entity)
+        components["kg.entity_vectors"] = kg.entity_vectors
+        components["kg.vector_model"] = kg.vector_model
+    rag = getattr(service, "rag_pipeline", None)
+    if rag is not None:
+        components["rag.documents"] = rag.retriever.documents
+        components["rag.index"] = rag.retriever.index
+        components["rag.embedding_model"] = rag.retriever.embedding_model
+        components["rag.reranker_model"] = rag.reranker.reranker_model
+    cache = getattr(service, "knowledge_cache", None)
+    if cache is not None:
+        components["knowledge_cache"] = cache._entries
+    if "pandas" in sys.modules:
+        # 仍被引用的DataFrame（Excel加载后本应释放）
+        frame_type = sys.modules["pandas"].DataFrame
+        components["pandas.frames"] = [obj for obj in gc.get_objects() if isinstance(obj, frame_type)]
+    return {name: obj for name, obj in components.items() if obj is not None}
+
+
+def measure_components(service) -> Dict[str, Dict[str, Any]]:
+    """各组件的字节数和条目数；多个组件共享的对象（如同一个模型实例）只计入先列出的组件"""
+    seen: set = set()
+    sizes = {}
+    for name, obj in service_components(service).items():
+        sizes[name] = {"bytes": deep_sizeof(obj, seen), "items": _count(obj)}
+    return sizes
+
+
+def process_memory() -> Dict[str, Optional[int]]:
+    """进程常驻内存（rss）和峰值（peak_rss），字节"""
+    rss = peak = None
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        try:
+            import resource
+            # ru_maxrss在Linux上以KB为单位，macOS上以字节为单位
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            peak = peak if sys.platform == "darwin" else peak * 1024
+        except ImportError:
+            pass
+    return {"rss": rss, "peak_rss": peak}
+
+
+def find_leaks(service, history: List[Dict[str, Any]], min_samples: int = 3,
+               min_growth: int = 1 << 20) -> List[Dict[str, Any]]:
+    """可疑的内存泄漏：检索文档与索引条数不一致、重复添加的文档、连续增长的组件"""
+    leaks = []
+    rag = getattr(service, "rag_pipeline", None)
+    if rag is not None:
+        documents = rag.retriever.documents
+        index = rag.retriever.index
+        if index is not None and index.ntotal != len(documents):
+            leaks.append({"component": "rag.documents", "kind": "index_mismatch",
+                          "detail": f"文档{len(documents)}条，FAISS索引{index.ntotal}条"})
+        keys = {(doc.get("title"), doc.get("content")) for doc in documents if isinstance(doc, dict)}
+        duplicates = len(documents) - len(keys)
+        if duplicates > 0:
+            leaks.append({"component": "rag.documents", "kind": "duplicates",
+                          "detail": f"{duplicates}条文档重复（add_documents被重复调用？）"})
+    recent = history[-min_samples:]
+    if len(recent) >= min_samples:
+        for name in recent[-1]["components"]:
+            values = [sample["components"].get(name, {}).get("bytes", 0) for sample in recent]
+            growth = values[-1] - values[0]
+            if growth >= min_growth and all(b > a for a, b in zip(values, values[1:])):
+                leaks.append({"component": name, "kind": "growing",
+                              "detail": f"最近{min_samples}次采样持续增长{growth}字节"})
+    return leaks
+
+
+class MemoryTracker:
+    """按组件的内存采样：保留最近max_samples次采样用于增长趋势和泄漏判断，tracemalloc开启时附带分配热点"""
+    def __init__(self, service_provider: Callable[[], Any], max_samples: int = 120, top: int = 10):
+        self.service_provider = service_provider
+        self.top = top
+        self.history: deque = deque(maxlen=max_samples)
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self) -> Optional[Dict[str, Any]]:
+        """采样一次（服务尚未创建时返回None）"""
+        service = self.service_provider()
+        if service is None:
+            return None
+        with self._lock:
+            sample = {"time": time.time(), **process_memory(), "components": measure_components(service)}
+            self.history.append(sample)
+        return sample
+
+    def _tracemalloc_report(self) -> Optional[Dict[str, Any]]:
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        report = {
+            "current": current,
+            "peak": peak,
+            "top": [{"location": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:self.top]]
+        }
+        with self._lock:
+            previous, self._snapshot = self._snapshot, snapshot
+        if previous is not None:
+            # 与上一次报告相比增长最多的分配位置
+            report["growth"] = [{"location": str(stat.traceback), "bytes": stat.size_diff, "count": stat.count_diff}
+                                for stat in snapshot.compare_to(previous, "lineno")[:self.top] if stat.size_diff > 0]
+        return report
+
+    def report(self) -> Dict[str, Any]:
+        """新采样一次并返回完整报告：进程内存、各组件大小（降序）、增长、泄漏嫌疑和tracemalloc热点"""
+        sample = self.sample()
+        with self._lock:
+            history = list(self.history)
+        if sample is None:
+            return {**process_memory(), "components": [], "history": [], "leaks": [],
+                    "tracemalloc": self._tracemalloc_report()}
+        first = history[0]["components"]
+        components = sorted(
+            ({"name": name, **size, "growth": size["bytes"] - first.get(name, {}).get("bytes", 0)}
+             for name, size in sample["components"].items()),
+            key=lambda item: item["bytes"], reverse=True)
+        return {
+            "rss": sample["rss"],
+            "peak_rss": sample["peak_rss"],
+            "components_total": sum(item["bytes"] for item in components),
+            "components": components,
+            "history": [{"time": item["time"], "rss": item["rss"],
+                         "components_total": sum(size["bytes"] for size in item["components"].values())}
+                        for item in history],
+            "leaks": find_leaks(self.service_provider(), history),
+            "tracemalloc": self._tracemalloc_report()
+        }
+
+    def start(self, interval: float):
+        """后台每interval秒采样一次"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name="memory-sampler", daemon=True)
+        self._thread.start()
+
+    def _loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning(f"内存采样失败: {str(e)}")
+
+    def stop(self):
+        self._stop.set()
+
+
+def _format_bytes(value: Optional[int]) -> str:
+    if value is None:
+        return "-"
+    for unit in ("B", "KB", "MB"):
+        if abs(value) < 1024:
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.2f}GB"
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"进程常驻内存: {_format_bytes(report['rss'])}（峰值 {_format_bytes(report['peak_rss'])}），"
+             f"组件合计: {_format_bytes(report.get('components_total'))}"]
+    for item in report["components"]:
+        items = "" if item["items"] is None else f"  {item['items']}条"
+        growth = f"  增长{_format_bytes(item['growth'])}" if item["growth"] else ""
+        lines.append(f"  {item['name']:<22}{_format_bytes(item['bytes']):>10}{items}{growth}")
+    for leak in report["leaks"]:
+        lines.append(f"[疑似泄漏] {leak['component']}: {leak['detail']}")
+    traced = report.get("tracemalloc")
+    if traced:
+        lines.append(f"tracemalloc: 当前{_format_bytes(traced['current'])}，峰值{_format_bytes(traced['peak'])}")
+        for stat in traced["top"]:
+            lines.append(f"  {_format_bytes(stat['bytes']):>10}  {stat['location']}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="加载服务并报告各组件的内存占用")
+    parser.add_argument("--tracemalloc", type=int, default=0, metavar="FRAMES",
+                        help="加载前开启tracemalloc并保留的栈深度（0为不开启，开启后加载明显变慢）")
+    parser.add_argument("--samples", type=int, default=1, help="采样次数，大于1时报告增长和泄漏嫌疑")
+    parser.add_argument("--interval", type=float, default=10.0, help="采样间隔（秒）")
+    parser.add_argument("--top", type=int, default=10, help="tracemalloc热点条数")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    if args.tracemalloc > 0:
+        tracemalloc.start(args.tracemalloc)
+
+    from src.config.config import settings
+    from src.core.core_service import IntegratedFitnessRAGService
+
+    service = IntegratedFitnessRAGService(settings)
+    tracker = MemoryTracker(lambda: service, top=args.top)
+    for _ in range(args.samples - 1):
+        tracker.sample()
+        time.sleep(args.interval)
+    report = tracker.report()
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+    service.executors.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import gc
+import logging
+import os
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def pin_torch_threads(num_threads: Optional[int] = None):
+    """固定当前进程的torch计算线程数（未安装torch时忽略），num_threads为空时按CPU核数均分给各worker"""
+    if not num_threads:
+        workers = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+        num_threads = max(1, (os.cpu_count() or 1) // workers)
+    # 环境变量对之后才初始化的OpenMP/MKL线程池生效
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[name] = str(num_threads)
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(num_threads)
+    logger.info(f"进程{os.getpid()}的torch线程数固定为{num_threads}")
+
+
+def freeze_shared_heap():
+    """把预加载的对象移入GC永久代：fork后子进程的垃圾回收不再扫描（写入）这些对象，减少写时复制"""
+    gc.collect()
+    gc.freeze()
+    logger.info(f"已冻结{gc.get_freeze_count()}个预加载对象")
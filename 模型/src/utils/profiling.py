@@ -0,0 +1,192 @@
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# 当前请求的剖析会话，随上下文传递到检索线程池（见tracing.in_current_context）
+_current_session: contextvars.ContextVar = contextvars.ContextVar("profile_session", default=None)
+
+_NAME_PATTERN = re.compile(r"^[\w.-]+$")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    # 项目内文件显示相对路径，第三方库只保留包名之后的部分
+    for marker in (os.sep + "src" + os.sep, "site-packages" + os.sep):
+        idx = filename.rfind(marker)
+        if idx >= 0:
+            filename = filename[idx + 1:] if marker.startswith(os.sep) else filename[idx + len(marker):]
+            break
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    """单个请求的采样剖析：后台线程每interval秒采样一次登记线程的调用栈，汇总为折叠栈（flamegraph/speedscope格式）
+
+    只采样正在为该请求工作的线程（发起线程及通过上下文登记的检索线程），并发的其他请求不计入。
+    """
+    def __init__(self, label: str, interval: float = 0.005):
+        self.label = label
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.started_at: Optional[float] = None
+        self.elapsed = 0.0
+        self._threads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @contextmanager
+    def attach(self):
+        """把当前线程登记为该请求的工作线程（可嵌套）"""
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads[ident] -= 1
+                if not self._threads[ident]:
+                    del self._threads[ident]
+
+    def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """在剖析下执行fn（阻塞直到返回）"""
+        token = _current_session.set(self)
+        sampler = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+        self.started_at = time.time()
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            with self.attach():
+                return fn(*args, **kwargs)
+        finally:
+            self.elapsed = time.perf_counter() - started
+            self._stop.set()
+            sampler.join()
+            _current_session.reset(token)
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                idents = [ident for ident in self._threads if ident != own]
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """折叠栈文本：每行“栈帧;栈帧;… 采样数”，可直接导入speedscope或flamegraph.pl"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def top_functions(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """按自身耗时（栈顶采样数）排序的函数，附累计耗时（出现在栈中的采样数）"""
+        own, total = Counter(), Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        return [{"function": label, "self_samples": count, "total_samples": total[label],
+                 "self_seconds": round(count * self.interval, 4)}
+                for label, count in own.most_common(limit)]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "label": self.label,
+            "started_at": self.started_at,
+            "elapsed": round(self.elapsed, 4),
+            "interval": self.interval,
+            "samples": sum(self.samples.values()),
+            "top_functions": self.top_functions()
+        }
+
+
+@contextmanager
+def attach_profile():
+    """若当前上下文处于请求剖析中，把当前线程登记为该请求的工作线程"""
+    session = _current_session.get()
+    if session is None:
+        yield
+        return
+    with session.attach():
+        yield
+
+
+class ProfileStore:
+    """剖析结果目录：每个请求保存<名称>.folded（折叠栈）和<名称>.json（摘要），超出max_files时删除最旧的"""
+    def __init__(self, directory: str, max_files: int = 200):
+        self.directory = directory
+        self.max_files = max_files
+
+    def save(self, session: ProfileSession) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(session.started_at))}-{session.label}-{uuid.uuid4().hex[:8]}"
+        with open(os.path.join(self.directory, f"{name}.folded"), "w", encoding="utf-8") as f:
+            f.write(session.folded())
+        with open(os.path.join(self.directory, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(session.summary(), f, ensure_ascii=False, indent=2)
+        self._prune()
+        return name
+
+    def _names(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        # 按写入时间排序（同一秒内保存的名称前缀相同）
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".json"):
+                try:
+                    entries.append((os.stat(os.path.join(self.directory, filename)).st_mtime_ns, filename[:-5]))
+                except FileNotFoundError:
+                    pass
+        return [name for _, name in sorted(entries)]
+
+    def _prune(self):
+        names = self._names()
+        for name in names[:max(0, len(names) - self.max_files)]:
+            for suffix in (".json", ".folded"):
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> List[Dict[str, Any]]:
+        """最新的在前，只返回摘要中的概要字段"""
+        profiles = []
+        for name in reversed(self._names()):
+            summary = self.load_summary(name)
+            if summary is not None:
+                profiles.append({"name": name, **{key: summary.get(key) for key in
+                                                  ("label", "started_at", "elapsed", "samples")}})
+        return profiles
+
+    def path(self, name: str, suffix: str) -> Optional[str]:
+        """校验名称（防止路径穿越）并返回文件路径，不存在时返回None"""
+        if not _NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.directory, name + suffix)
+        return path if os.path.isfile(path) else None
+
+    def load_summary(self, name: str) -> Optional[Dict[str, Any]]:
+        path = self.path(name, ".json")
+        if path is None:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
@@ -0,0 +1,72 @@
+from typing import Any, Dict, List, Optional
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+ARROW = "arrow"
+
+MEDIA_TYPES = {
+    JSON: "application/json",
+    MSGPACK: "application/x-msgpack",
+    ARROW: "application/vnd.apache.arrow.stream"
+}
+
+
+class UnsupportedEncodingError(Exception):
+    """请求的编码格式依赖未安装"""
+
+
+def negotiate_format(accept: str = "", requested: Optional[str] = None) -> str:
+    """确定批量结果的编码格式：显式的format参数优先，其次是Accept头，默认JSON"""
+    if requested:
+        requested = requested.lower()
+        if requested not in MEDIA_TYPES:
+            raise UnsupportedEncodingError(f"不支持的格式: {requested}，可选: {', '.join(MEDIA_TYPES)}")
+        return requested
+    accept = accept.lower()
+    for name in (ARROW, MSGPACK):
+        if MEDIA_TYPES[name] in accept:
+            return name
+    return JSON
+
+
+def encode_msgpack(payload: Any) -> bytes:
+    if msgpack is None:
+        raise UnsupportedEncodingError("MessagePack编码需要安装msgpack")
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def encode_scores_arrow(results: List[Dict[str, Any]]) -> bytes:
+    """把批量评分结果编码为Arrow IPC流：每条记录一行，各指标展开为<指标>_score和<指标>_rating两列"""
+    # pyarrow导入较慢（约0.1秒），只在请求Arrow格式时导入
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        raise UnsupportedEncodingError("Arrow编码需要安装pyarrow")
+    metrics = []
+    for result in results:
+        for metric in result.get("individual_scores") or {}:
+            if metric not in metrics:
+                metrics.append(metric)
+
+    columns = {
+        "overall_score": pyarrow.array([r.get("overall_score") for r in results], pyarrow.float64()),
+        "overall_rating": pyarrow.array([r.get("overall_rating") for r in results], pyarrow.string()).dictionary_encode()
+    }
+    for metric in metrics:
+        columns[f"{metric}_score"] = pyarrow.array(
+            [(r.get("individual_scores") or {}).get(metric) for r in results], pyarrow.float64())
+        # 评级取值很少，字典编码显著减小体积
+        columns[f"{metric}_rating"] = pyarrow.array(
+            [(r.get("individual_ratings") or {}).get(metric) for r in results], pyarrow.string()).dictionary_encode()
+
+    table = pyarrow.table(columns)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,200 @@
+import contextvars
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from src.utils.profiling import attach_profile
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+# 延迟直方图的默认分桶（秒），覆盖毫秒级的评分到数十秒的报告生成
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    """Prometheus直方图（累积分桶），按标签值分别统计"""
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            # 各桶计数（非累积）、总和、总数
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0.0
+            for i, bound in enumerate(self.buckets):
+                cumulative += series[i]
+                labels = _format_labels(self.label_names, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative:g}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {series[-2]!r}")
+            lines.append(f"{self.name}_count{labels} {series[-1]:g}")
+        return lines
+
+
+class Gauge:
+    """抓取时通过回调取值的Prometheus仪表盘指标，回调返回{标签值元组: 数值}"""
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str],
+                 collect: Callable[[], Dict[Tuple[str, ...], float]]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.collect() or {}
+        except Exception:
+            values = {}
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内指标注册表，render输出Prometheus文本格式（供/metrics抓取）"""
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, label_names, buckets)
+            return self._metrics[name]
+
+    def gauge(self, name: str, help_text: str, label_names: Sequence[str],
+              collect: Callable[[], Dict[Tuple[str, ...], float]]) -> Gauge:
+        with self._lock:
+            self._metrics[name] = Gauge(name, help_text, label_names, collect)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram("fitness_stage_duration_seconds", "分析流水线各阶段耗时（秒）", ("stage",))
+
+
+class _NoopSpan:
+    """未安装opentelemetry时的空span"""
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def add_event(self, name, attributes=None):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _tracer():
+    return otel_trace.get_tracer("fitness.analyze") if otel_trace is not None else None
+
+
+def _span_attributes(attributes: Dict) -> Optional[Dict]:
+    # OpenTelemetry的属性值不能为None
+    return {key: value for key, value in attributes.items() if value is not None} or None
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator:
+    """计时一个阶段：记录到阶段耗时直方图，安装了opentelemetry时同时生成span（未配置SDK时为空操作）"""
+    started = time.perf_counter()
+    tracer = _tracer()
+    try:
+        if tracer is None:
+            yield _NOOP_SPAN
+        else:
+            with tracer.start_as_current_span(name, attributes=_span_attributes(attributes)) as current:
+                yield current
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+def traced(name: str):
+    """把函数整体包在span(name)中的装饰器"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_stage(name: str, seconds: float, started_at: Optional[float] = None, **attributes):
+    """记录已在别处测得的阶段耗时（如跨多次迭代的流式生成），started_at为time.time()时间戳"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    tracer = _tracer()
+    if tracer is not None:
+        start = started_at if started_at is not None else time.time() - seconds
+        current = tracer.start_span(name, attributes=_span_attributes(attributes), start_time=int(start * 1e9))
+        current.end(end_time=int((start + seconds) * 1e9))
+
+
+def in_current_context(func: Callable) -> Callable:
+    """绑定当前上下文（含当前span和请求剖析会话），提交到线程池后子阶段仍归属同一请求；每次提交需单独调用"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        with attach_profile():
+            return func(*args, **kwargs)
+    return lambda *args, **kwargs: context.run(run, *args, **kwargs)
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import random
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+import pytest
+
+from src.config.config import settings
+from src.core.core_service import IntegratedFitnessRAGService
+from src.kg.kg_manager import KnowledgeGraphManager
+from src.llm.mock_server import DEFAULT_RESPONSE_TEXT
+from src.models.models import Gender, PhysicalTestInput
+from src.rag.rag_components import BGEReranker, FAISSRetriever, RAGPipeline
+from src.utils.evaluation_loader import EvaluationStandardLoader
+
+# 设置真实模型路径后，嵌入和重排基准使用真实模型，否则跳过（合成编码器的耗时没有参考意义）
+EMBEDDING_MODEL_PATH = os.environ.get("BENCH_EMBEDDING_MODEL")
+RERANKER_MODEL_PATH = os.environ.get("BENCH_RERANKER_MODEL")
+
+DISEASES = ["高血压", "糖尿病", "高血脂", "膝关节炎", "腰椎间盘突出", "骨质疏松"]
+PREFERENCES = ["跑步", "游泳", "骑行", "瑜伽", "太极", "力量训练", "羽毛球", "广场舞"]
+SPORTS = ["快走", "慢跑", "深蹲", "平板支撑", "哑铃推举", "弹力带划船", "开合跳", "箭步蹲"]
+METRICS = ["bmi", "body_fat_rate", "vital_capacity", "max_oxygen_uptake", "sit_and_reach", "single_leg_stand",
+           "reaction_time", "grip_strength", "sit_ups_per_minute", "push_ups"]
+
+
+class HashingEncoder:
+    """确定性的合成句向量编码器（哈希到固定维度），用于构建FAISS和知识图谱索引"""
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def encode(self, sentences, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        vectors = np.zeros((len(sentences), self.dimension), dtype="float32")
+        for row, sentence in enumerate(sentences):
+            for token in sentence:
+                digest = hashlib.md5(token.encode("utf-8")).digest()
+                vectors[row, int.from_bytes(digest[:4], "little") % self.dimension] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-6)
+
+
+class StubLLMClient:
+    """立即返回的大模型客户端桩，端到端基准只测量本地链路开销"""
+    def __init__(self, text: str = DEFAULT_RESPONSE_TEXT, chunk_chars: int = 8):
+        self.chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+
+    def generate_text(self, prompt, **kwargs):
+        return "".join(self.chunks)
+
+    def stream_text(self, prompt, stream_stats=None, cancel_token=None, **kwargs):
+        yield from self.chunks
+
+
+def make_cohort(size: int, seed: int = 0):
+    """合成体质测试人群：20-79岁、男女各半，指标取值覆盖各评级区间"""
+    rng = random.Random(seed)
+    cohort = []
+    for i in range(size):
+        age = rng.randint(20, 79)
+        height = rng.uniform(150, 190)
+        weight = rng.uniform(45, 100)
+        cohort.append(PhysicalTestInput(
+            age=age,
+            gender=Gender.MALE if i % 2 == 0 else Gender.FEMALE,
+            height=round(height, 1),
+            weight=round(weight, 1),
+            bmi=round(weight / (height / 100) ** 2, 1),
+            body_fat_rate=round(rng.uniform(8, 40), 1),
+            vital_capacity=rng.randint(1500, 6000),
+            max_oxygen_uptake=round(rng.uniform(15, 60), 1),
+            sit_and_reach=round(rng.uniform(-10, 30), 1),
+            single_leg_stand=round(rng.uniform(2, 90), 1),
+            reaction_time=round(rng.uniform(0.3, 1.0), 2),
+            grip_strength=round(rng.uniform(10, 65), 1),
+            sit_ups_per_minute=rng.randint(0, 60) if age < 60 else None,
+            push_ups=rng.randint(0, 50) if age < 60 else None,
+            vertical_jump=round(rng.uniform(10, 60), 1) if age < 50 else None,
+            high_knees_2min=rng.randint(40, 160) if age >= 60 else None,
+            sit_to_stand_30s=rng.randint(5, 30) if age >= 60 else None,
+            name=f"用户{i}",
+            diseases=rng.sample(DISEASES, rng.randint(0, 2)),
+            exercise_preferences=rng.sample(PREFERENCES, rng.randint(1, 3)),
+            exercise_risk_level=rng.choice(["低", "中", "高"]),
+            uses_equipment=rng.random() < 0.5
+        ))
+    return cohort
+
+
+def make_standards(age_groups=("20-39岁", "40-59岁")):
+    """合成评价标准（与Excel解析结果结构一致），每个指标每个年龄段、性别5个分值区间"""
+    ratings = [(100, "优秀"), (85, "良好"), (70, "合格"), (60, "合格"), (40, "不合格")]
+    standards = {}
+    for metric in METRICS:
+        items = []
+        for age_group in age_groups:
+            for gender in ("男", "女"):
+                bounds = [-float("inf"), 10.0, 20.0, 30.0, 40.0, float("inf")]
+                for (score, rating), low, high in zip(ratings, bounds, bounds[1:]):
+                    items.append({"age_group": age_group, "gender": gender, "score": float(score),
+                                  "min_val": low, "max_val": high, "rating": rating,
+                                  "primary_weight": 1.0, "secondary_weight": 1.0})
+        standards[metric] = items
+    return standards
+
+
+def make_corpus(size: int, seed: int = 0):
+    """合成动作方案库文档"""
+    rng = random.Random(seed)
+    documents = []
+    for i in range(size):
+        sport = rng.choice(SPORTS)
+        documents.append({
+            "content": f"动作名称: {sport}{i}\n适用人群: {rng.randint(20, 79)}岁{rng.choice(['男', '女'])}性"
+                       f"{rng.choice(PREFERENCES)}爱好者\n动作要领: {sport}保持核心收紧，{rng.randint(2, 5)}组×{rng.randint(8, 20)}次",
+            "title": f"动作方案_{i}",
+            "source": "合成动作方案库"
+        })
+    return documents
+
+
+def write_knowledge_graph(directory, entities: int = 2000, triples_per_entity: int = 5, seed: int = 0):
+    """写出合成知识图谱文件（实体、关系和三元组JSON），返回对应的配置"""
+    rng = random.Random(seed)
+    names = [f"{rng.choice(DISEASES + PREFERENCES + SPORTS)}知识{i}" for i in range(entities)]
+    entity_map = {name: {"类型": rng.choice(["疾病", "运动", "动作"]), "描述": f"{name}的说明"} for name in names}
+    triples = []
+    for name in names:
+        for _ in range(triples_per_entity):
+            triples.append({"head": name, "relation": rng.choice(["适合", "禁忌", "注意事项", "推荐强度"]),
+                            "tail": rng.choice(names)})
+    paths = {}
+    for key, data in (("entities", entity_map), ("relations", {"适合": {}, "禁忌": {}}), ("triples", triples)):
+        path = os.path.join(str(directory), f"kg_{key}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        paths[f"kg_{key}_path"] = path
+    return SimpleNamespace(**paths)
+
+
+@pytest.fixture(scope="session")
+def embedding_model_path():
+    if not EMBEDDING_MODEL_PATH:
+        pytest.skip("未设置BENCH_EMBEDDING_MODEL")
+    return EMBEDDING_MODEL_PATH
+
+
+@pytest.fixture(scope="session")
+def reranker_model_path():
+    if not RERANKER_MODEL_PATH:
+        pytest.skip("未设置BENCH_RERANKER_MODEL")
+    return RERANKER_MODEL_PATH
+
+
+@pytest.fixture(scope="session")
+def corpus():
+    """嵌入基准使用的合成文档"""
+    return make_corpus(64)
+
+
+@pytest.fixture(scope="session")
+def encoder():
+    return HashingEncoder()
+
+
+@pytest.fixture(scope="session")
+def cohort():
+    return make_cohort(1000)
+
+
+@pytest.fixture(scope="session")
+def standards_loader():
+    loader = EvaluationStandardLoader()
+    loader.adult_standards = make_standards(("20-39岁", "40-59岁"))
+    loader.elderly_standards = make_standards(("60-69岁", "70-79岁"))
+    return loader
+
+
+@pytest.fixture(scope="session")
+def retriever(encoder):
+    retriever = FAISSRetriever(SimpleNamespace(project_root="/nonexistent", retriever_top_k=10))
+    retriever.embedding_model = encoder
+    retriever.index = faiss.IndexFlatL2(encoder.dimension)
+    retriever.add_documents(make_corpus(5000))
+    return retriever
+
+
+@pytest.fixture(scope="session")
+def knowledge_graph(tmp_path_factory, encoder):
+    kg = KnowledgeGraphManager(write_knowledge_graph(tmp_path_factory.mktemp("kg")))
+    kg.vector_model = encoder
+    kg._build_entity_vector_index()
+    return kg
+
+
+@pytest.fixture(scope="session")
+def rag_pipeline(retriever):
+    pipeline = RAGPipeline.__new__(RAGPipeline)
+    pipeline.config = SimpleNamespace(reranker_top_k=5)
+    pipeline.retriever = retriever
+    # 未设置真实重排模型时重排为直通
+    pipeline.reranker = BGEReranker.__new__(BGEReranker)
+    pipeline.reranker.reranker_model = None
+    return pipeline
+
+
+@pytest.fixture(scope="session")
+def service(knowledge_graph, rag_pipeline):
+    service = IntegratedFitnessRAGService(settings, defer_startup=True)
+    service.kg_manager = knowledge_graph
+    service.rag_pipeline = rag_pipeline
+    service.llm_client = StubLLMClient()
+    # 每轮都走真实检索，不命中跨请求缓存
+    service.knowledge_cache.max_entries = 0
+    yield service
+    service.executors.shutdown(wait=False)
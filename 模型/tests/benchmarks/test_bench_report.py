@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_prompt_assembly(benchmark, service, cohort):
+    user = cohort[1]
+    result = service.evaluate_scores(user)
+    result.exercise_prescription = service._generate_default_prescription(12)
+    snippets = service._collect_knowledge_snippets(user, result)
+    system_prompt, prompt = benchmark(service._prepare_report_messages, user, result, snippets)
+    assert user.name in prompt and user.name not in system_prompt
+
+
+def test_analyze_end_to_end_stub_llm(benchmark, service, cohort):
+    """评分、处方、并行检索、提示词构建和报告流解析的完整链路（大模型为立即返回的桩）"""
+    users = iter(cohort * 10)
+
+    def analyze():
+        result = service.analyze_physical_test(next(users))
+        return result, "".join(result.basic_analysis)
+
+    result, report = benchmark(analyze)
+    assert "运动处方" in report
@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+QUERY = "男45岁合格体质使用器械 ['跑步', '力量训练']运动方案"
+
+
+def test_faiss_search(benchmark, retriever, encoder):
+    query_vector = encoder.encode([QUERY])
+    distances, indices = benchmark(retriever.index.search, query_vector, 10)
+    assert indices.shape == (1, 10)
+
+
+def test_retriever_retrieve(benchmark, retriever):
+    results = benchmark(retriever.retrieve, QUERY)
+    assert len(results) == 10
+
+
+def test_rag_pipeline_search(benchmark, rag_pipeline):
+    results = benchmark(rag_pipeline.search, QUERY)
+    assert results
+
+
+def test_kg_relation_query(benchmark, knowledge_graph):
+    entity = knowledge_graph.index_to_entity[len(knowledge_graph.index_to_entity) // 2]
+    relations = benchmark(knowledge_graph.query_relations, entity)
+    assert relations
+
+
+def test_kg_scored_summary(benchmark, knowledge_graph):
+    summary, score = benchmark(knowledge_graph.generate_scored_summary, "高血压患者运动建议")
+    assert summary and score > 0
+
+
+def test_embedding_batch(benchmark, embedding_model_path, corpus):
+    sentence_transformers = pytest.importorskip("sentence_transformers")
+    model = sentence_transformers.SentenceTransformer(embedding_model_path)
+    texts = [doc["content"] for doc in corpus]
+    vectors = benchmark(model.encode, texts)
+    assert len(vectors) == len(texts)
+
+
+def test_rerank_top10(benchmark, retriever, reranker_model_path):
+    sentence_transformers = pytest.importorskip("sentence_transformers")
+    from src.rag.rag_components import BGEReranker
+    reranker = BGEReranker.__new__(BGEReranker)
+    reranker.reranker_model = sentence_transformers.CrossEncoder(reranker_model_path)
+    documents = retriever.retrieve(QUERY)
+    results = benchmark(lambda: reranker.rerank(QUERY, [dict(doc) for doc in documents], 5))
+    assert len(results) == 5
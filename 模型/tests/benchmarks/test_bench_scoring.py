@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_score_single(benchmark, service, cohort):
+    result = benchmark(service.evaluate_scores, cohort[0])
+    assert result.overall_rating
+
+
+def test_score_bulk_1000(benchmark, service, cohort):
+    results = benchmark(lambda: [service.evaluate_scores(user) for user in cohort])
+    assert len(results) == len(cohort)
+
+
+def test_score_batch_columnar_1000(benchmark, service, cohort):
+    from src.models.batch import PhysicalTestBatch
+    batch = PhysicalTestBatch.from_records(cohort)
+    scores = benchmark(service.evaluate_scores_batch, batch)
+    assert len(scores) == len(cohort)
+
+
+def test_standard_loader_evaluate_cohort(benchmark, standards_loader, cohort):
+    cases = [(metric, getattr(user, metric), user.age, user.gender.value)
+             for user in cohort[:200] for metric in ("bmi", "grip_strength", "sit_and_reach", "vital_capacity")]
+
+    def evaluate():
+        return [standards_loader.evaluate_metric(metric, value, age, gender) for metric, value, age, gender in cases]
+
+    results = benchmark(evaluate)
+    assert len(results) == len(cases)
@@ -0,0 +1,164 @@
+import json
+import os
+import sys
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.config.config import settings
+from src.core.core_service import IntegratedFitnessRAGService
+from src.core.warmup import ServiceWarmup
+from src.models.models import EvaluationResult
+from src.utils.profiling import ProfileStore
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+import main  # noqa: E402
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = IntegratedFitnessRAGService(settings, defer_startup=True)
+    monkeypatch.setattr(main.warmup, "service", service)
+    monkeypatch.setattr(main.warmup, "status", ServiceWarmup.READY)
+    yield service
+    service.executors.shutdown(wait=False)
+
+
+def person(name, age=30):
+    return {"name": name, "age": age, "gender": "男", "bmi": 22.0, "grip_strength": 40.0}
+
+
+def test_failed_batch_item_does_not_abort_the_rest(service, monkeypatch):
+    def analyze(user_data, cancel_token=None, query_memo=None):
+        result = EvaluationResult()
+        result.overall_score = 80.0
+
+        def report():
+            if user_data.name == "失败":
+                raise Exception("大模型流式生成失败")
+            yield f"{user_data.name}的报告"
+        result.basic_analysis = report()
+        return result
+
+    monkeypatch.setattr(service, "analyze_physical_test", analyze)
+    response = TestClient(main.app).post("/analyze/batch", json=[person("甲"), person("失败"), person("乙")])
+    lines = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda line: line["index"])
+    assert [line["index"] for line in lines] == [0, 1, 2]
+    assert lines[1] == {"index": 1, "error": "大模型流式生成失败"}
+    assert lines[0]["report"] == "甲的报告" and lines[2]["report"] == "乙的报告"
+
+
+def test_bulk_evaluate_matches_single_records(service):
+    client = TestClient(main.app)
+    people = [person("甲"), {**person("乙", age=65), "gender": "女", "vital_capacity": 1800}, person("丙", age=15)]
+    response = client.post("/evaluate", json=people)
+    bulk = response.json()["data"]
+    assert bulk == [client.post("/evaluate", json=item).json()["data"] for item in people]
+    # 整数得分输出为100而不是100.0
+    assert '"bmi":100,' in response.text.replace(" ", "") and bulk[0]["individual_scores"]["bmi"] == 100
+
+
+def test_bulk_evaluate_is_capped_and_offloaded(service, monkeypatch):
+    client = TestClient(main.app)
+    monkeypatch.setattr(settings, "evaluate_max_items", 3, raising=False)
+    assert client.post("/evaluate", json=[person(str(i)) for i in range(4)]).status_code == 413
+
+    offloaded = []
+    run_cpu = service.executors.run_cpu
+
+    async def record_run_cpu(fn, *args, **kwargs):
+        offloaded.append(fn)
+        return await run_cpu(fn, *args, **kwargs)
+
+    monkeypatch.setattr(service.executors, "run_cpu", record_run_cpu)
+    monkeypatch.setattr(settings, "evaluate_offload_items", 2, raising=False)
+    assert len(client.post("/evaluate", json=[person("甲"), person("乙")]).json()["data"]) == 2
+    assert not offloaded
+    assert len(client.post("/evaluate", json=[person(str(i)) for i in range(3)]).json()["data"]) == 3
+    assert len(offloaded) == 1
+
+
+def test_profiled_analyze_runs_on_the_cpu_pool(service, monkeypatch, tmp_path):
+    threads = []
+
+    def analyze(user_data, cancel_token=None, query_memo=None):
+        threads.append(threading.current_thread().name)
+        result = EvaluationResult()
+        result.overall_score = 80.0
+        result.basic_analysis = iter(["报告"])
+        return result
+
+    monkeypatch.setattr(service, "analyze_physical_test", analyze)
+    monkeypatch.setattr(main, "profile_store", ProfileStore(str(tmp_path)))
+    monkeypatch.setattr(main, "report_flights", None)
+    client = TestClient(main.app)
+    monkeypatch.setattr(settings, "admin_token", None, raising=False)
+    # 未配置令牌时剖析和内存报告接口关闭
+    assert client.post("/analyze?profile=true", json=person("甲")).status_code == 403
+    assert client.get("/debug/memory").status_code == 403
+    monkeypatch.setattr(settings, "admin_token", "secret", raising=False)
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    response = client.post("/analyze?profile=true", json=person("甲"), headers={"X-Admin-Token": "secret"})
+    assert response.json()["data"]["report"] == "报告"
+    assert response.headers["X-Profile-Id"] and response.headers["X-Request-Coalesced"] == "leader"
+    assert len(threads) == 1 and threads[0].startswith("service-cpu")
+
+    # 随机抽样的请求照常合并，只有发起生成的请求带剖析结果
+    monkeypatch.setattr(settings, "profile_sample_rate", 1.0, raising=False)
+    first = client.post("/analyze", json=person("乙"))
+    replayed = client.post("/analyze", json=person("乙"))
+    assert "X-Profile-Id" in first.headers and first.headers["X-Request-Coalesced"] == "leader"
+    assert "X-Profile-Id" not in replayed.headers and replayed.headers["X-Request-Coalesced"] != "leader"
+    assert len(threads) == 2
+
+
+def test_binary_encoding_runs_on_the_cpu_pool(service, monkeypatch):
+    msgpack = pytest.importorskip("msgpack")
+    offloaded = []
+    run_cpu = service.executors.run_cpu
+
+    async def record_run_cpu(fn, *args, **kwargs):
+        offloaded.append(fn.__name__)
+        return await run_cpu(fn, *args, **kwargs)
+
+    monkeypatch.setattr(service.executors, "run_cpu", record_run_cpu)
+    response = TestClient(main.app).post("/evaluate?format=msgpack", json=[person("甲"), person("乙")])
+    assert response.headers["content-type"] == "application/x-msgpack"
+    assert len(msgpack.unpackb(response.content)["data"]) == 2
+    assert offloaded == ["encode_msgpack"]
+
+
+def test_scoring_survives_a_failed_component(service, monkeypatch):
+    monkeypatch.setattr(main.warmup, "status", ServiceWarmup.FAILED)
+    monkeypatch.setattr(main.warmup, "error", "索引文件损坏")
+    client = TestClient(main.app)
+    assert client.post("/evaluate", json=person("甲")).json()["data"]["individual_scores"]["bmi"] == 100
+    assert client.post("/analyze", json=person("甲")).status_code == 500
+    ready = client.get("/health/ready")
+    assert ready.status_code == 503 and ready.json()["data"]["scoring_available"] is True
+
+
+def test_job_endpoints_keep_sqlite_off_the_event_loop(service, monkeypatch, tmp_path):
+    def analyze(user_data, cancel_token=None, query_memo=None):
+        result = EvaluationResult()
+        result.basic_analysis = iter(["报告"])
+        return result
+
+    monkeypatch.setattr(service, "analyze_physical_test", analyze)
+    monkeypatch.setattr(settings, "report_job_db_path", str(tmp_path / "jobs.sqlite3"), raising=False)
+    monkeypatch.setattr(main, "job_queue", None)
+    offloaded = []
+    run_io = service.executors.run_io
+
+    async def record_run_io(fn, *args, **kwargs):
+        offloaded.append(getattr(fn, "__name__", fn))
+        return await run_io(fn, *args, **kwargs)
+
+    monkeypatch.setattr(service.executors, "run_io", record_run_io)
+    client = TestClient(main.app)
+    job_id = client.post("/analyze?async_mode=true", json=person("甲")).json()["data"]["job_id"]
+    main.job_queue.shutdown()
+    assert client.get(f"/jobs/{job_id}").json()["data"]["report"] == "报告"
+    assert offloaded == ["get_job_queue", "submit", "get_job_queue", "get"]
+    main.job_queue.store.close()
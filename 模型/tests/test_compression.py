@@ -0,0 +1,51 @@
+import asyncio
+import zlib
+
+from src.utils.compression import CompressionMiddleware, negotiate_encoding
+
+
+def run_app(app, accept_encoding):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=100)(scope, receive, send))
+    return messages
+
+
+def make_app(chunks, content_type=b"text/event-stream"):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type)]})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+    return app
+
+
+def test_negotiate_encoding_respects_q_values():
+    assert negotiate_encoding("gzip, br;q=0.5", ["zstd", "br", "gzip"]) == "gzip"
+    assert negotiate_encoding("*", ["zstd", "gzip"]) == "zstd"
+    assert negotiate_encoding("identity", ["gzip"]) is None
+
+
+def test_streamed_chunks_are_decodable_immediately():
+    events = [b"event: delta\ndata: {\"text\": \"\xe6\x8a\xa5\xe5\x91\x8a\"}\n\n" * 3, b"event: done\ndata: {}\n\n", b""]
+    messages = run_app(make_app(events), "gzip")
+    headers = dict(messages[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+
+    decoder = zlib.decompressobj(31)
+    # 每个分片发送后即可完整解出对应的事件，无需等待后续数据
+    assert decoder.decompress(messages[1]["body"]) == events[0]
+    assert decoder.decompress(messages[2]["body"]) == events[1]
+
+
+def test_small_responses_are_not_compressed():
+    messages = run_app(make_app([b"{}"], b"application/json"), "gzip")
+    assert b"content-encoding" not in dict(messages[0]["headers"])
+    assert messages[1]["body"] == b"{}"
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from src.core.executors import AdmissionLimiter, AdmissionRejected, ServiceExecutors
+
+
+def test_admission_limiter_queues_then_rejects():
+    async def scenario():
+        limiter = AdmissionLimiter("analyze", limit=1, max_queue=1, queue_timeout=1.0)
+        await limiter.acquire()
+        queued = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.snapshot()["queue_depth"] == 1
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()
+        limiter.release()
+        await queued
+        assert (limiter.in_flight, limiter.waiting, limiter.rejected) == (1, 0, 1)
+        limiter.release()
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_queued_request_times_out():
+    async def scenario():
+        limiter = AdmissionLimiter("analyze", limit=1, max_queue=4, queue_timeout=0.05)
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()
+        assert limiter.waiting == 0
+
+    asyncio.run(scenario())
+
+
+def test_iterate_io_drains_blocking_generator():
+    executors = ServiceExecutors(cpu_workers=1, io_workers=1)
+
+    async def scenario():
+        return [chunk async for chunk in executors.iterate_io(iter(["报", "告"]))]
+
+    assert asyncio.run(scenario()) == ["报", "告"]
+    executors.shutdown()
@@ -0,0 +1,50 @@
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只评分的路径不应导入的重量级模块（模型、向量检索、数据处理和HTTP客户端）
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "faiss", "numpy", "pandas", "pyarrow", "requests")
+
+SCORES_ONLY = """
+import json, os, sys
+created = []
+makedirs = os.makedirs
+os.makedirs = lambda path, *args, **kwargs: created.append(path) or makedirs(path, *args, **kwargs)
+sys.path.insert(0, "backend")
+import main
+from src.config.config import settings
+from src.core.core_service import IntegratedFitnessRAGService
+from src.models.models import Gender, PhysicalTestInput
+service = IntegratedFitnessRAGService(settings, defer_startup=True)
+result = service.evaluate_scores(PhysicalTestInput(age=30, gender=Gender.MALE, bmi=22.0, grip_strength=40.0))
+service.executors.shutdown(wait=False)
+print(json.dumps({"modules": sorted(set(sys.modules)), "created": created, "score": result.overall_score}))
+"""
+
+
+def run_scores_only():
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", SCORES_ONLY], cwd=PROJECT_ROOT,
+                               capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr[-2000:]
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def slowest_imports(importtime_output, limit=10):
+    """-X importtime输出中累计耗时最长的模块，用于失败信息"""
+    rows = []
+    for line in importtime_output.splitlines():
+        parts = line.split("|")
+        if line.startswith("import time:") and len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def test_scores_only_path_skips_heavy_imports_and_filesystem_side_effects():
+    report, importtime_output = run_scores_only()
+    heavy = [name for name in HEAVY_MODULES if name in report["modules"]]
+    assert not heavy, f"只评分路径导入了{heavy}，最慢的导入: {slowest_imports(importtime_output)}"
+    assert report["created"] == []
+    assert report["score"] > 0
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.inference.client import InferenceClient, RemoteCrossEncoder, RemoteSentenceTransformer
+from src.inference import server as server_module
+from src.inference.server import InferenceServer
+
+
+class FakeEncoder:
+    def encode(self, sentences, **kwargs):
+        return np.array([[len(s), 1.0] for s in sentences], dtype="float32")
+
+
+class FakeCrossEncoder:
+    def predict(self, pairs, **kwargs):
+        return np.array([float(len(a) + len(b)) for a, b in pairs])
+
+
+def start_server(tmp_path, max_wait=0.05):
+    loader = lambda kind, path: FakeEncoder() if kind == "encoder" else FakeCrossEncoder()
+    return InferenceServer(str(tmp_path / "inference.sock"), max_wait=max_wait, loader=loader).start()
+
+
+def test_concurrent_calls_are_coalesced_into_one_batch(tmp_path):
+    server = start_server(tmp_path)
+    client = InferenceClient(server.address)
+    model = RemoteSentenceTransformer(client, "bge")
+    results = {}
+
+    def encode(i):
+        results[i] = model.encode(["字" * i, "ab"])
+
+    threads = [threading.Thread(target=encode, args=(i,)) for i in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for i in range(1, 9):
+        assert results[i].tolist() == [[i, 1.0], [2, 1.0]]
+    assert sum(server.batch_sizes) == 16
+    assert len(server.batch_sizes) < 8
+    client.close()
+    server.close()
+
+
+def test_remote_cross_encoder_and_single_sentence(tmp_path):
+    server = start_server(tmp_path, max_wait=0.0)
+    client = InferenceClient(server.address)
+    assert RemoteCrossEncoder(client, "reranker").predict([["问", "答案"]]).tolist() == [3.0]
+    assert RemoteSentenceTransformer(client, "bge").encode("你好").tolist() == [2, 1.0]
+    client.close()
+    server.close()
+
+
+def test_load_kwargs_reach_the_server_and_timeouts_are_cleaned_up(tmp_path):
+    loaded = []
+
+    def loader(kind, path, **load_kwargs):
+        loaded.append((path, load_kwargs))
+        return FakeCrossEncoder()
+
+    server = InferenceServer(str(tmp_path / "inference.sock"), max_wait=0.0, loader=loader).start()
+    client = InferenceClient(server.address)
+    RemoteCrossEncoder(client, "reranker", {"trust_remote_code": True}).predict([["问", "答"]])
+    RemoteCrossEncoder(client, "BAAI/bge-reranker-large").predict([["问", "答"]])
+    assert loaded == [("reranker", {"trust_remote_code": True}), ("BAAI/bge-reranker-large", {})]
+
+    # 服务端卡住时调用超时，待分发表不残留该请求
+    server.loader = lambda kind, path, **load_kwargs: time.sleep(0.5) or FakeCrossEncoder()
+    client.timeout = 0.05
+    with pytest.raises(TimeoutError):
+        RemoteCrossEncoder(client, "slow").predict([["问", "答"]])
+    assert client._pending == {}
+    client.close()
+    server.close()
+
+
+def test_preloaded_model_is_reused_by_client_requests(tmp_path, monkeypatch):
+    loaded = []
+
+    def loader(kind, path, **load_kwargs):
+        loaded.append((kind, path, load_kwargs))
+        return FakeCrossEncoder()
+
+    started = []
+    serve_forever = InferenceServer.serve_forever
+    monkeypatch.setattr(server_module, "_load_model", loader)
+    monkeypatch.setattr(InferenceServer, "serve_forever", lambda self: started.append(self))
+    server_module.main(["--address", str(tmp_path / "inference.sock"),
+                        "--preload", "cross_encoder=reranker,trust_remote_code=true"])
+    assert loaded == [("cross_encoder", "reranker", {"trust_remote_code": True})]
+
+    server = started[0]
+    threading.Thread(target=serve_forever, args=(server,), daemon=True).start()
+    client = InferenceClient(server.address)
+    RemoteCrossEncoder(client, "reranker", {"trust_remote_code": True}).predict([["问", "答"]])
+    assert len(loaded) == 1
+    client.close()
+    server.close()
+
+
+def test_close_during_recv_fails_pending_calls(tmp_path):
+    server = InferenceServer(str(tmp_path / "inference.sock"), max_wait=0.0,
+                             loader=lambda kind, path: time.sleep(0.3) or FakeCrossEncoder()).start()
+    client = InferenceClient(server.address)
+    errors = []
+
+    def predict():
+        try:
+            RemoteCrossEncoder(client, "slow").predict([["问", "答"]])
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=predict)
+    thread.start()
+    time.sleep(0.05)
+    client.close()
+    thread.join(2.0)
+    # 读取线程正常退出，等待中的调用立即失败而不是等到超时
+    assert not thread.is_alive() and isinstance(errors[0], ConnectionError)
+    server.close()
@@ -0,0 +1,174 @@
+import threading
+import time
+
+import pytest
+
+from src.llm.llm_client import DeepSeekAPIClient
+from src.llm.mock_server import MockLLMServer
+from src.llm.prompt_cache import prompt_cache_tokens
+from src.llm.resilience import CancelToken, CircuitBreaker, RequestCancelled
+from src.llm.sse import SSEDecoder, StreamStats
+
+
+def start_stub_server(tokens, first_token_delay=0.0, status=200, gzip=False):
+    """启动返回固定文本的本地桩服务器，返回(server, base_url)"""
+    server = MockLLMServer(ttft=first_token_delay, tokens_per_second=1000,
+                           error_rate=0.0 if status == 200 else 1.0, error_status=status,
+                           response_text="".join(tokens), token_chars=1, gzip=gzip).start()
+    return server, server.base_url
+
+
+class Config:
+    def __init__(self, primary, fallbacks, hedge=True, record_mode="off", record_dir=None):
+        self.deepseek_api_key = "test"
+        self.deepseek_api_base_url = primary
+        self.deepseek_fallback_endpoints = [{"name": f"backup-{i}", "base_url": url} for i, url in enumerate(fallbacks)]
+        self.llm_hedge_enabled = hedge
+        self.llm_hedge_initial_delay = 0.2
+        self.llm_stream_timeout = 10
+        self.llm_record_mode = record_mode
+        self.llm_record_dir = record_dir
+
+
+def test_hedged_stream_uses_faster_endpoint():
+    slow, slow_url = start_stub_server(["慢"], first_token_delay=3.0)
+    fast, fast_url = start_stub_server(["快", "速"])
+    try:
+        client = DeepSeekAPIClient(Config(slow_url, [fast_url]))
+        started = time.monotonic()
+        assert "".join(client.stream_text("你好")) == "快速"
+        assert time.monotonic() - started < 2.0
+    finally:
+        slow.stop()
+        fast.stop()
+
+
+def test_stream_fails_over_when_primary_errors():
+    broken, broken_url = start_stub_server([], status=503)
+    backup, backup_url = start_stub_server(["备", "用"])
+    try:
+        client = DeepSeekAPIClient(Config(broken_url, [backup_url], hedge=False))
+        assert "".join(client.stream_text("你好")) == "备用"
+        assert client.endpoints[0].breaker._consecutive_failures == 1
+    finally:
+        broken.stop()
+        backup.stop()
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_breaker_admits_one_probe_at_a_time():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    # 冷却结束后的并发请求只有一个作为试探放行
+    assert [breaker.allow_request() for _ in range(5)] == [True, False, False, False, False]
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request() and not breaker.allow_request()
+    # 试探被取消而未记录结果时，超过reset_timeout后放行新的试探
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert all(breaker.allow_request() for _ in range(3))
+
+
+def test_sse_decoder_handles_split_chunks():
+    stream = b'data: {"a": 1}\r\n\r\n: keep-alive\n\nevent: x\ndata: line1\ndata: line2\n\ndata: [DONE]\n\n'
+    decoder = SSEDecoder()
+    payloads = []
+    for i in range(0, len(stream), 3):
+        payloads.extend(decoder.feed(stream[i:i + 3]))
+    payloads.extend(decoder.flush())
+    assert payloads == [b'{"a": 1}', b'line1\nline2', b'[DONE]']
+
+
+def test_stream_records_first_token_stats():
+    server, url = start_stub_server(["a", "b", "c"])
+    try:
+        client = DeepSeekAPIClient(Config(url, [], hedge=False))
+        stats = StreamStats()
+        assert "".join(client.stream_text("你好", stream_stats=stats)) == "abc"
+        assert stats.endpoint == "primary"
+        assert stats.time_to_first_token is not None
+        assert stats.completion_tokens == 3
+        assert stats.chars == 3
+    finally:
+        server.stop()
+
+
+def test_gzip_encoded_stream_is_decoded():
+    server, url = start_stub_server(["压", "缩"], gzip=True)
+    try:
+        client = DeepSeekAPIClient(Config(url, [], hedge=False))
+        stats = StreamStats()
+        assert "".join(client.stream_text("你好", stream_stats=stats)) == "压缩"
+        assert stats.completion_tokens == 2
+    finally:
+        server.stop()
+
+
+def test_record_then_replay_without_server(tmp_path):
+    server, url = start_stub_server(["录", "制"])
+    try:
+        recorder = DeepSeekAPIClient(Config(url, [], hedge=False, record_mode="record", record_dir=str(tmp_path)))
+        assert "".join(recorder.stream_text("你好")) == "录制"
+        assert recorder.generate_text("你好") == "录制"
+    finally:
+        server.stop()
+
+    replayer = DeepSeekAPIClient(Config(url, [], hedge=False, record_mode="replay", record_dir=str(tmp_path)))
+    assert "".join(replayer.stream_text("你好")) == "录制"
+    assert replayer.generate_text("你好") == "录制"
+    assert replayer.last_stream_stats.usage["completion_tokens"] == 2
+
+
+def test_cancel_aborts_upstream_stream():
+    server = MockLLMServer(ttft=0.0, tokens_per_second=5, response_text="abcdefghij", token_chars=1).start()
+    try:
+        client = DeepSeekAPIClient(Config(server.base_url, [], hedge=False))
+        token = CancelToken()
+        stream = client.stream_text("你好", cancel_token=token)
+        assert next(stream) == "a"
+        threading.Timer(0.05, token.cancel).start()
+        started = time.monotonic()
+        with pytest.raises(RequestCancelled):
+            list(stream)
+        assert time.monotonic() - started < 1.0
+        assert client.endpoints[0].breaker._consecutive_failures == 0
+    finally:
+        server.stop()
+
+
+def test_prompt_cache_usage_is_parsed_and_aggregated():
+    assert prompt_cache_tokens({"prompt_cache_hit_tokens": 640, "prompt_cache_miss_tokens": 20}) == (640, 20)
+    assert prompt_cache_tokens({"prompt_tokens": 100, "prompt_tokens_details": {"cached_tokens": 64}}) == (64, 36)
+    assert prompt_cache_tokens({"prompt_tokens": 100}) == (None, None)
+
+    server = MockLLMServer(ttft=0.0, tokens_per_second=1000, response_text="ok", token_chars=1).start()
+    try:
+        client = DeepSeekAPIClient(Config(server.base_url, [], hedge=False))
+        instructions = "请根据用户数据生成运动处方报告，有氧运动强度使用储备心率表示。" * 20
+        stats = [StreamStats(), StreamStats()]
+        for name, stream_stats in zip(("张三", "李四"), stats):
+            "".join(client.stream_text(f"姓名：{name}", system_prompt=instructions, stream_stats=stream_stats))
+        assert stats[0].prompt_cache_hit_tokens == 0
+        assert stats[1].prompt_cache_hit_tokens > 0 and stats[1].prompt_cache_miss_tokens > 0
+        totals = client.prompt_cache_stats.snapshot()["primary"]
+        assert totals["requests"] == totals["reported"] == 2
+        assert totals["hit_tokens"] == stats[1].prompt_cache_hit_tokens
+    finally:
+        server.stop()
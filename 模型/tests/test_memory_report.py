@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+
+from src.rag.rag_components import FAISSRetriever
+from src.utils.memory_report import MemoryTracker, deep_sizeof, measure_components
+
+
+class TinyEncoder:
+    def encode(self, texts, **kwargs):
+        return np.ones((len(texts), 8), dtype="float32")
+
+
+def make_service():
+    retriever = FAISSRetriever(SimpleNamespace(project_root="/nonexistent", retriever_top_k=5))
+    retriever.embedding_model = TinyEncoder()
+    retriever.index = faiss.IndexFlatL2(8)
+    pipeline = SimpleNamespace(retriever=retriever, reranker=SimpleNamespace(reranker_model=None))
+    return SimpleNamespace(rag_pipeline=pipeline, kg_manager=None, knowledge_cache=None)
+
+
+def test_shared_objects_are_counted_once():
+    vectors = np.zeros((1000, 64), dtype="float32")
+    seen = set()
+    first = deep_sizeof({"a": vectors}, seen)
+    second = deep_sizeof([vectors], seen)
+    assert first >= vectors.nbytes
+    assert second < vectors.nbytes
+
+
+def test_repeated_add_documents_is_reported():
+    service = make_service()
+    documents = [{"title": f"动作方案_{i}", "content": "深蹲" * 200, "source": "动作方案库"} for i in range(50)]
+    tracker = MemoryTracker(lambda: service, top=5)
+    for _ in range(3):
+        # 重复加载同一个动作方案库
+        service.rag_pipeline.retriever.add_documents(documents)
+        tracker.sample()
+
+    sizes = measure_components(service)
+    assert sizes["rag.index"] == {"bytes": 150 * 8 * 4, "items": 150}
+    assert sizes["rag.documents"]["items"] == 150
+
+    report = tracker.report()
+    assert [item["name"] for item in report["components"]][0] == "rag.documents"
+    kinds = {leak["kind"] for leak in report["leaks"] if leak["component"] == "rag.documents"}
+    assert "duplicates" in kinds
+    assert len(report["history"]) == 4
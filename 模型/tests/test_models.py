@@ -0,0 +1,57 @@
+import json
+import pickle
+
+import numpy as np
+
+from src.config.config import settings
+from src.core.core_service import IntegratedFitnessRAGService
+from src.models.batch import PhysicalTestBatch
+from src.models.models import EvaluationResult, Gender, Metric, PhysicalTestInput
+
+
+def make_user(**overrides):
+    fields = dict(age=35, gender=Gender.FEMALE, bmi=21.5, body_fat_rate=26.0, vital_capacity=3100,
+                  sit_and_reach=12.0, grip_strength=28.0, push_ups=None, name="李四", diseases=["高血压"])
+    fields.update(overrides)
+    return PhysicalTestInput(**fields)
+
+
+def test_models_are_slotted():
+    user = make_user()
+    result = EvaluationResult()
+    assert not hasattr(user, "__dict__") and not hasattr(result, "__dict__")
+    assert user.metric(Metric.VITAL_CAPACITY) == 3100
+    assert user.to_dict()["vital_capacity"] == 3100 and "push_ups" not in user.to_dict()
+
+
+def test_metric_views_behave_like_dicts():
+    result = EvaluationResult()
+    result.set_metric(Metric.BMI, 100.0, "优秀")
+    result.individual_scores["grip_strength"] = 70.0
+    result.individual_ratings[Metric.GRIP_STRENGTH] = "合格"
+
+    assert dict(result.individual_scores) == {"bmi": 100.0, "grip_strength": 70.0}
+    assert result.individual_ratings == {"bmi": "优秀", "grip_strength": "合格"}
+    assert "push_ups" not in result.individual_scores and result.individual_scores.get("push_ups", 0) == 0
+    assert json.dumps(dict(result.individual_ratings), ensure_ascii=False) == '{"bmi": "优秀", "grip_strength": "合格"}'
+
+    restored = pickle.loads(pickle.dumps(result))
+    restored.individual_scores["bmi"] = 90.0
+    assert restored.scores[Metric.BMI] == 90.0
+
+
+def test_batch_scoring_matches_row_scoring():
+    service = IntegratedFitnessRAGService(settings, defer_startup=True)
+    users = [make_user(), make_user(age=65, gender=Gender.MALE, vital_capacity=None, grip_strength=35.0),
+             make_user(age=15, bmi=None)]
+    batch = PhysicalTestBatch.from_records(users)
+    assert np.shares_memory(batch.column(Metric.VITAL_CAPACITY), batch.values)
+    assert np.isnan(batch.values[1, Metric.VITAL_CAPACITY])
+
+    scores = service.evaluate_scores_batch(batch)
+    for user, record in zip(users, scores.records()):
+        expected = service.evaluate_scores(user)
+        assert record == {"overall_score": expected.overall_score, "overall_rating": expected.overall_rating,
+                          "individual_scores": dict(expected.individual_scores),
+                          "individual_ratings": dict(expected.individual_ratings)}
+    service.executors.shutdown(wait=False)
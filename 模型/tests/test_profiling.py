@@ -0,0 +1,48 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.profiling import ProfileSession, ProfileStore
+from src.utils.tracing import in_current_context
+
+
+def busy_retrieval(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def unrelated_request(stop):
+    while not stop.is_set():
+        pass
+
+
+def test_profile_covers_pool_threads_of_the_request_only(tmp_path):
+    pool = ThreadPoolExecutor(max_workers=2)
+    stop = threading.Event()
+    other = threading.Thread(target=unrelated_request, args=(stop,))
+    other.start()
+
+    def analyze():
+        # 与检索扇出相同：提交时绑定上下文，工作线程登记到本请求
+        pool.submit(in_current_context(busy_retrieval), 0.1).result()
+
+    session = ProfileSession("analyze", interval=0.002)
+    session.run(analyze)
+    stop.set()
+    other.join()
+    pool.shutdown()
+
+    folded = session.folded()
+    assert "busy_retrieval" in folded
+    assert "unrelated_request" not in folded
+    # 墙钟采样：发起线程等待检索的时间同样计入
+    top = {entry["function"].split(" ")[0] for entry in session.top_functions()}
+    assert {"busy_retrieval", "wait"} <= top
+
+    store = ProfileStore(str(tmp_path), max_files=1)
+    store.save(session)
+    name = store.save(session)
+    assert [p["name"] for p in store.list()] == [name]
+    assert store.path(name, ".folded") is not None
+    assert store.path("../etc/passwd", ".folded") is None
@@ -0,0 +1,24 @@
+from src.llm.prompt_budget import ContextSnippet, PromptBudgeter, TokenCounter
+
+
+def test_token_counter_estimates_cjk_and_ascii():
+    counter = TokenCounter()
+    assert counter.count("") == 0
+    assert counter.count("运动处方") == 3  # 4 * 0.6
+    assert counter.count("abcdefghij") == 3  # 10 * 0.3
+    assert counter.count(counter.truncate("运动" * 100, 30)) <= 30
+
+
+def test_budgeter_keeps_highest_scoring_snippets_in_original_order():
+    counter = TokenCounter()
+    snippets = [
+        ContextSnippet("profile", "体质" * 50, score=0.2, order=0),
+        ContextSnippet("disease", "高血压" * 20, score=0.9, order=1),
+        ContextSnippet("rag", "动作" * 50, score=0.5, order=2),
+    ]
+    budgeter = PromptBudgeter(counter, min_snippet_tokens=1000)
+    selected, report = budgeter.fit(snippets, budget=100)
+    assert [s.section for s in selected] == ["disease", "rag"]
+    assert report["used"] <= 100
+    assert report["sections"]["profile"]["selected"] == 0
+    assert report["sections"]["disease"]["tokens"] == 36
@@ -0,0 +1,25 @@
+import threading
+import time
+
+from src.core.query_memo import QueryMemo
+
+
+def test_concurrent_identical_queries_run_once():
+    memo = QueryMemo()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return "结果"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(memo.get_or_compute(("kg", "q"), compute)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["结果"] * 5
+    assert len(calls) == 1
+    assert (memo.hits, memo.misses) == (4, 1)
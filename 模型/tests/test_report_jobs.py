@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+
+import pytest
+
+from src.core.report_jobs import CallbackNotAllowedError, JobStore, ReportJobQueue, check_callback_url
+from src.models.models import EvaluationResult
+
+
+class FakeService:
+    def __init__(self, chunks, gate=None):
+        self.chunks = chunks
+        self.gate = gate
+
+    def analyze_physical_test(self, user_data):
+        result = EvaluationResult()
+        result.overall_score = 80.0
+        result.overall_rating = "良好"
+
+        def report():
+            for i, chunk in enumerate(self.chunks):
+                if i == 1 and self.gate is not None:
+                    self.gate.wait()
+                yield chunk
+        result.basic_analysis = report()
+        return result
+
+
+def test_job_streams_partial_report_and_persists_result(tmp_path):
+    gate = threading.Event()
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    jobs = ReportJobQueue(FakeService(["第一段", "第二段"], gate), store, max_workers=1, flush_interval=0)
+    job_id = jobs.submit(None, {"age": 30})
+
+    events = jobs.subscribe(job_id, poll_interval=0.05)
+    seen = []
+    for kind, value in events:
+        if kind == "heartbeat":
+            continue
+        seen.append((kind, value))
+        if kind == "delta":
+            break
+    assert seen[0] == ("scores", {"overall_score": 80.0, "overall_rating": "良好",
+                                  "individual_scores": {}, "individual_ratings": {}})
+    assert seen[1] == ("delta", "第一段")
+    assert jobs.get(job_id)["status"] == JobStore.RUNNING
+    assert jobs.get(job_id)["report"] == "第一段"
+
+    gate.set()
+    rest = [(kind, value) for kind, value in events if kind != "heartbeat"]
+    assert rest[0] == ("delta", "第二段")
+    assert rest[-1][0] == "done"
+    jobs.shutdown()
+
+    # 重新打开存储后仍可查询结果
+    job = JobStore(str(tmp_path / "jobs.sqlite3")).get(job_id)
+    assert job["status"] == JobStore.SUCCEEDED
+    assert job["report"] == "第一段第二段"
+
+
+def test_job_running_in_another_worker_is_followed_through_the_store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    jobs = ReportJobQueue(FakeService([]), store, max_workers=1)
+    # 另一个存活的worker进程（此处借用父进程pid）创建并生成中的任务
+    job_id = store.create({"age": 30})
+    store.update(job_id, status=JobStore.RUNNING, worker_pid=os.getppid(), scores={"overall_score": 80})
+
+    def other_worker():
+        time.sleep(0.05)
+        store.update(job_id, report="第一段")
+        time.sleep(0.05)
+        store.update(job_id, report="第一段第二段", status=JobStore.SUCCEEDED)
+    threading.Thread(target=other_worker).start()
+
+    events = [(kind, value) for kind, value in jobs.subscribe(job_id, poll_interval=0.01) if kind != "heartbeat"]
+    assert events[:3] == [("scores", {"overall_score": 80}), ("delta", "第一段"), ("delta", "第二段")]
+    assert events[-1][0] == "done" and events[-1][1]["status"] == JobStore.SUCCEEDED
+    jobs.shutdown()
+
+
+def test_callback_url_must_be_an_allowed_http_host(tmp_path):
+    jobs = ReportJobQueue(FakeService(["报告"]), JobStore(str(tmp_path / "jobs.sqlite3")), max_workers=1,
+                          callback_hosts=["hooks.example.com"])
+    for url in ("file:///etc/passwd", "http://169.254.169.254/latest/meta-data", "gopher://hooks.example.com/"):
+        with pytest.raises(CallbackNotAllowedError):
+            jobs.submit(None, {"age": 30}, url)
+    assert jobs.pending_count() == 0
+    check_callback_url("https://HOOKS.example.com:8443/done", jobs.callback_hosts)
+    jobs.shutdown()
@@ -0,0 +1,67 @@
+import datetime
+
+import pytest
+
+from src.config.config import settings
+from src.core.core_service import IntegratedFitnessRAGService
+from src.core.report_prompt import KNOWLEDGE_HEADER, PRESCRIPTION_INSTRUCTIONS, REPORT_INSTRUCTIONS
+from src.llm.prompt_budget import ContextSnippet
+from src.llm.prompt_templates import PromptTemplate
+from src.models.models import Gender, PhysicalTestInput
+
+
+@pytest.fixture
+def service():
+    service = IntegratedFitnessRAGService(settings, defer_startup=True)
+    yield service
+    service.executors.shutdown(wait=False)
+
+
+def scored(service, **fields):
+    user = PhysicalTestInput(**fields)
+    result = service.evaluate_scores(user)
+    result.exercise_prescription = service._generate_default_prescription(12)
+    return user, result
+
+
+def test_template_is_compiled_once():
+    template = PromptTemplate("得分：{score:.1f}分，{rating}\n")
+    assert template.fields == ("score", "rating")
+    assert template.render(score=86.25, rating="良好") == "得分：86.2分，良好\n"
+    with pytest.raises(KeyError):
+        template.render(score=1.0)
+
+
+def test_report_messages_keep_user_data_out_of_system_prompt(service):
+    first = scored(service, age=30, gender=Gender.MALE, bmi=22.0, grip_strength=40.0, name="张三")
+    second = scored(service, age=65, gender=Gender.FEMALE, vital_capacity=1800, name="李四", diseases=["高血压"])
+    now = datetime.datetime(2024, 5, 1, 8, 30)
+    builder = service.report_prompt_builder
+
+    messages = [builder.messages(user, result, now=now) for user, result in (first, second)]
+    for system_prompt, prompt in messages:
+        assert system_prompt is REPORT_INSTRUCTIONS and prompt.endswith(KNOWLEDGE_HEADER)
+        assert "2024年05月01日 08:30:00" in prompt and "% current_time" not in prompt
+    assert "- 握力：40.0 kg\n" in messages[0][1] and "- 疾病：高血压\n" in messages[1][1]
+    assert "- BMI：100分，" in messages[0][1]
+
+    hybrid = [builder.system_prompt(result.exercise_prescription, plan_block=True) for _, result in (first, second)]
+    assert hybrid[0] is hybrid[1]
+    service.report_output_mode = "markdown"
+    assert service._prepare_report_messages(*first)[0] is REPORT_INSTRUCTIONS
+    service.report_output_mode = "hybrid"
+    assert service._prepare_report_messages(*first)[0] is hybrid[0]
+
+    system_prompt, prompt = builder.prescription_messages(*first, (4, 4, 4))
+    assert system_prompt is PRESCRIPTION_INSTRUCTIONS and "共12周" in prompt
+
+
+def test_knowledge_stays_with_its_request(service):
+    first = scored(service, age=30, gender=Gender.MALE, bmi=22.0, name="张三")
+    second = scored(service, age=65, gender=Gender.FEMALE, bmi=24.0, name="李四")
+    _, prompt = service._prepare_report_messages(*first, [ContextSnippet("disease", "张三的专属知识", 0.9)])
+    assert prompt.endswith("张三的专属知识")
+    assert first[1].prompt_budget_report["sections"]["disease"]["selected"] == 1
+
+    _, prompt = service._prepare_report_messages(*second)
+    assert prompt.endswith(KNOWLEDGE_HEADER) and second[1].prompt_budget_report is None
@@ -0,0 +1,87 @@
+import time
+
+from src.config.config import settings
+from src.core.core_service import IntegratedFitnessRAGService
+from src.models.models import EvaluationResult, Gender, PhysicalTestInput
+
+
+class SlowKnowledgeGraph:
+    def generate_scored_summary(self, query):
+        time.sleep(0.2)
+        return f"知识：{query}", 0.5
+
+
+class StalledRAG:
+    def search(self, query):
+        time.sleep(1.0)
+        return [{"content": "动作方案", "relevance_score": 0.9}]
+
+
+def test_sources_run_in_parallel_and_stalled_source_is_dropped():
+    service = IntegratedFitnessRAGService(settings, defer_startup=True)
+    service.kg_manager = SlowKnowledgeGraph()
+    service.rag_pipeline = StalledRAG()
+    service.retrieval_timeouts = {"rag": 0.4}
+    user = PhysicalTestInput(age=30, gender=Gender.MALE, diseases=["高血压", "糖尿病"],
+                             exercise_preferences=["跑步"], exercise_risk_level="中")
+    result = EvaluationResult()
+    result.overall_rating = "合格"
+
+    started = time.monotonic()
+    snippets, report = service._gather_knowledge_snippets(service._start_knowledge_retrieval(user, result))
+    elapsed = time.monotonic() - started
+
+    # 5路知识图谱查询并行执行，RAG超时被跳过而不阻塞
+    assert elapsed < 0.8
+    assert [s.section for s in snippets] == ["profile", "risk", "disease", "disease", "preference"]
+    assert "高血压" in snippets[2].text and "糖尿病" in snippets[3].text
+    assert [d["section"] for d in report["dropped"]] == ["rag"]
+    service.executors.shutdown(wait=False)
+
+
+def test_late_sources_fill_cache_for_later_reports():
+    service = IntegratedFitnessRAGService(settings, defer_startup=True)
+    service.report_speculative_start = True
+    service.kg_manager = SlowKnowledgeGraph()
+    service.rag_pipeline = StalledRAG()
+    user = PhysicalTestInput(age=30, gender=Gender.MALE)
+    result = EvaluationResult()
+    result.overall_rating = "合格"
+
+    retrieval = service._start_knowledge_retrieval(user, result)
+    snippets, report = service._gather_knowledge_snippets(retrieval, latency_budget=0.05)
+    assert snippets == []
+    assert [d["decision"] for d in report["decisions"]] == ["late", "late"]
+
+    # 超出预算的检索在后台完成后写入缓存，下一次报告直接命中
+    for future in retrieval[1]:
+        future.result()
+    deadline = time.monotonic() + 1.0
+    while service.knowledge_cache.snapshot()["entries"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    snippets, report = service._gather_knowledge_snippets(service._start_knowledge_retrieval(user, result),
+                                                          latency_budget=0.05)
+    assert [s.section for s in snippets] == ["profile", "rag"]
+    assert [d["decision"] for d in report["decisions"]] == ["cache", "cache"]
+    service.executors.shutdown(wait=False)
+
+
+def test_cache_is_opt_in_and_cleared_on_kg_reload(monkeypatch):
+    service = IntegratedFitnessRAGService(settings, defer_startup=True)
+    service.kg_manager = SlowKnowledgeGraph()
+    service.rag_pipeline = StalledRAG()
+    service.retrieval_timeouts = {"rag": 0.05}
+    user = PhysicalTestInput(age=30, gender=Gender.MALE)
+    result = EvaluationResult()
+    result.overall_rating = "合格"
+
+    # 默认（非推测启动）路径不读写跨请求缓存
+    for future in service._start_knowledge_retrieval(user, result)[1]:
+        future.result()
+    assert service.knowledge_cache.snapshot()["entries"] == 0
+
+    service.knowledge_cache.put(("kg", "旧查询"), ("旧知识", 0.5))
+    monkeypatch.setattr("src.kg.kg_manager.KnowledgeGraphManager", lambda config: SlowKnowledgeGraph())
+    service._init_knowledge_graph()
+    assert service.knowledge_cache.snapshot()["entries"] == 0
+    service.executors.shutdown(wait=False)
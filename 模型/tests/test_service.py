@@ -25,7 +25,7 @@ def create_test_data():
     test_data = PhysicalTestInput(
         name="张三",
         age=30,
-        gender=Gender.男,
+        gender=Gender.MALE,
         height=175,
         weight=70,
         bmi=22.9,
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.core.executors import ServiceExecutors
+from src.core.single_flight import ReportSingleFlight
+from src.models.models import FailedReport
+
+
+class FakeService:
+    def __init__(self, chunks=("第一段", "第二段"), delay=0.02):
+        self.executors = ServiceExecutors(cpu_workers=1, io_workers=4)
+        self.chunks = chunks
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = threading.Event()
+
+    def analyze_physical_test(self, user_data, cancel_token=None):
+        self.calls += 1
+        cancel_token.add_callback(self.cancelled.set)
+
+        def stream():
+            for chunk in self.chunks:
+                time.sleep(self.delay)
+                cancel_token.raise_if_cancelled()
+                yield chunk
+
+        return SimpleNamespace(overall_score=80, basic_analysis=stream())
+
+
+def test_concurrent_duplicates_share_one_generation_and_replay_fully():
+    service = FakeService()
+    flights = ReportSingleFlight(service, completed_ttl=30.0)
+    key = flights.key_of({"age": 30, "gender": "男"})
+    assert key == flights.key_of({"gender": "男", "age": 30})
+
+    leader, role = flights.join(key)
+    assert role == ReportSingleFlight.LEADER
+    flights.start(leader, None)
+    joined, role = flights.join(key)
+    assert joined is leader and role == ReportSingleFlight.JOINED
+
+    events = [kind for kind, _ in flights.subscribe(joined) if kind != "heartbeat"]
+    assert events == ["scores", "delta", "delta", "done"]
+    assert flights.wait(leader)[1] == "第一段第二段"
+    flights.leave(leader)
+    flights.leave(joined)
+
+    # 完成后的短时间窗口内重试直接回放
+    replayed, role = flights.join(key)
+    assert role == ReportSingleFlight.REPLAYED
+    assert flights.wait(replayed)[1] == "第一段第二段"
+    assert service.calls == 1
+
+
+def test_generation_cancelled_only_after_last_subscriber_leaves():
+    service = FakeService(chunks=("片段",) * 50)
+    flights = ReportSingleFlight(service)
+    first, _ = flights.join("key")
+    flights.start(first, None)
+    second, _ = flights.join("key")
+
+    flights.leave(first)
+    assert not service.cancelled.wait(0.1)
+    flights.leave(second)
+    assert service.cancelled.wait(1.0)
+    assert flights.join("key")[1] == ReportSingleFlight.LEADER
+
+
+def test_async_waiters_do_not_hold_the_io_pool():
+    service = FakeService()
+    service.executors = ServiceExecutors(cpu_workers=1, io_workers=1)
+    flights = ReportSingleFlight(service)
+
+    async def burst():
+        waiters = []
+        for _ in range(8):
+            flight, role = flights.join("key")
+            if role == ReportSingleFlight.LEADER:
+                flights.start(flight, None)
+            waiters.append(flights.wait_async(flight, timeout=5.0))
+        return await asyncio.gather(*waiters)
+
+    # 只有一个io线程时，等待方也不会阻塞生成
+    assert [report for _, report in asyncio.run(burst())] == ["第一段第二段"] * 8
+    assert service.calls == 1
+
+    slow = FakeService(chunks=("片段",) * 50)
+    flights = ReportSingleFlight(slow)
+    flight, _ = flights.join("key")
+    flights.start(flight, None)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(flights.wait_async(flight, timeout=0.05))
+    flights.leave(flight)
+
+
+def test_failed_report_is_not_replayed():
+    service = FakeService()
+    service.analyze_physical_test = lambda user_data, cancel_token=None: SimpleNamespace(
+        overall_score=0, basic_analysis=FailedReport("运动处方报告生成失败，请稍后重试。"))
+    flights = ReportSingleFlight(service, completed_ttl=30.0)
+    flight, _ = flights.join("key")
+    flights.start(flight, None)
+    assert flights.wait(flight)[1] == "运动处方报告生成失败，请稍后重试。"
+    flights.leave(flight)
+    assert flights.join("key")[1] == ReportSingleFlight.LEADER
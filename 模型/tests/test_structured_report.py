@@ -0,0 +1,37 @@
+import json
+
+from src.core.structured_report import PLAN_BLOCK_END, PLAN_BLOCK_START, iter_structured_report
+from src.models.models import ExercisePhase, ExercisePrescription
+
+
+def make_plan():
+    phases = []
+    for i, (start, end) in enumerate([(1, 4), (5, 8), (9, 12)], 1):
+        phases.append({
+            "name": f"阶段{i}", "start_week": start, "end_week": end, "goal": f"目标{i}",
+            "schedule": {"mon": "快走30分钟", "wed": "深蹲3组", "sun": "休息"}, "notes": "注意补水"
+        })
+    return {"total_weeks": 12, "phases": phases}
+
+
+def test_plan_block_is_stripped_and_parsed_incrementally():
+    prescription = ExercisePrescription(12)
+    prescription.phases = [ExercisePhase("第1-12周", "兜底", "兜底")]
+    report = "# 报告\n正文内容\n本运动推荐仅供参考\n"
+    text = report + PLAN_BLOCK_START + json.dumps(make_plan(), ensure_ascii=False) + PLAN_BLOCK_END + "\n"
+
+    chunks = (text[i:i + 7] for i in range(0, len(text), 7))
+    assert "".join(iter_structured_report(chunks, prescription)) == report
+    assert prescription.structured and prescription.complete
+    assert [p.start_week for p in prescription.phases] == [1, 5, 9]
+    plan_data = prescription.to_plan_data()
+    assert plan_data["phases"][0]["week"][0] == {"dayKey": "mon", "dayName": "周一", "summary": "快走30分钟", "detail": "快走30分钟"}
+    assert plan_data["phases"][2]["endWeek"] == 12
+
+
+def test_missing_plan_block_keeps_fallback_phases():
+    prescription = ExercisePrescription(8)
+    prescription.phases = [ExercisePhase("第1-8周", "兜底", "兜底")]
+    assert "".join(iter_structured_report(["只有", "正文<<", "<不是标记"], prescription)) == "只有正文<<<不是标记"
+    assert not prescription.structured
+    assert prescription.to_plan_data() is None
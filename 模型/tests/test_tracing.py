@@ -0,0 +1,24 @@
+import pytest
+
+from src.utils.tracing import MetricsRegistry, STAGE_SECONDS, span
+
+
+def test_histogram_renders_cumulative_prometheus_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("demo_seconds", "示例", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, stage="rag.search")
+    registry.gauge("demo_in_flight", "示例", ("endpoint",), lambda: {("analyze",): 2})
+    lines = registry.render().splitlines()
+    assert 'demo_seconds_bucket{stage="rag.search",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{stage="rag.search",le="1.0"} 2' in lines
+    assert 'demo_seconds_bucket{stage="rag.search",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{stage="rag.search"} 3' in lines
+    assert 'demo_in_flight{endpoint="analyze"} 2.0' in lines
+
+
+def test_span_records_duration_even_when_stage_fails():
+    with pytest.raises(ValueError):
+        with span("test.failing_stage", attempt=None):
+            raise ValueError("检索失败")
+    assert 'fitness_stage_duration_seconds_count{stage="test.failing_stage"} 1' in "\n".join(STAGE_SECONDS.render())
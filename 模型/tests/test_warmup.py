@@ -0,0 +1,35 @@
+from src.core.warmup import ServiceWarmup
+
+
+class FakeService:
+    def __init__(self, fail_stage=None):
+        self.loaded = []
+        self.fail_stage = fail_stage
+
+    def startup_stages(self):
+        return [(name, lambda name=name: self._load(name)) for name in ("knowledge_graph", "rag_pipeline")]
+
+    def _load(self, name):
+        if name == self.fail_stage:
+            raise RuntimeError("索引文件损坏")
+        self.loaded.append(name)
+
+
+def test_warmup_loads_stages_in_order():
+    ready = []
+    warmup = ServiceWarmup(FakeService, on_ready=ready.append)
+    warmup.start(background=False)
+    state = warmup.snapshot()
+    assert warmup.ready and state["progress"] == "3/3"
+    assert warmup.service.loaded == ["knowledge_graph", "rag_pipeline"]
+    assert ready == [warmup.service]
+
+
+def test_warmup_reports_failed_component():
+    warmup = ServiceWarmup(lambda: FakeService(fail_stage="rag_pipeline"))
+    warmup.start(background=False)
+    state = warmup.snapshot()
+    assert warmup.failed
+    assert state["components"]["rag_pipeline"]["status"] == "failed"
+    assert state["components"]["rag_pipeline"]["error"] == "索引文件损坏"
+    assert state["components"]["knowledge_graph"]["status"] == "ready"